@@ -0,0 +1,141 @@
+"""
+Benchmark of the first run of a cell importing many jac files.
+
+A library of `--modules` jac files is generated as a tree, each file
+importing its parent, and a cell imports all of them. Each sample runs
+the cell once in a fresh interpreter with an empty module cache, so every
+file is compiled, for each `--jobs` value (see
+`jackernel.importer.precompile_jac_files`). The compiler is warmed up
+before timing, as in a kernel. A last sample runs the cell again with the
+module cache filled by the previous one.
+
+Results are written as JSON, with the speedup of each job count over
+compiling the files one after the other.
+
+    python benchmarks/imports.py --modules 24 --jobs 1 2 4 8
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CHILD_PROBE = """
+import json, sys, time, types
+from jackernel.cache import configure_module_cache, set_compile_jobs
+from jackernel.execute import exec_jac
+from jackernel.transpiler import warm_up
+
+library, cache_dir, jobs = sys.argv[1], sys.argv[2], int(sys.argv[3])
+configure_module_cache(cache_dir)
+set_compile_jobs(jobs)
+warm_up(library)
+with open(f"{library}/cell.jac") as f:
+    cell = f.read()
+start = time.perf_counter()
+out = exec_jac(cell, module=types.ModuleType("session"), caller_dir=library)
+print(json.dumps({"seconds": time.perf_counter() - start, "output": out.strip()}))
+"""
+
+
+def write_library(directory: str, modules: int, abilities: int) -> str:
+    """Write the jac files and the cell importing them, return the cell."""
+    for i in range(modules):
+        deps = [(i - 1) // 2] if i else []
+        lines = [f"import:jac m{j:03d};" for j in deps]
+        lines.append(f"object Item{i} {{ has value: int = {i}; }}")
+        for k in range(abilities):
+            lines.append(
+                f"can f{k}(x: int) -> int {{\n"
+                f"    y = x * {k + 1} + Item{i}().value;\n"
+                f"    if y > 100 {{ y = y - 100; }}\n"
+                f"    return y;\n}}"
+            )
+        calls = " + ".join(f"m{j:03d}.f0(x)" for j in deps) or "0"
+        lines.append(f"can total(x: int) -> int {{ return f0(x) + {calls}; }}")
+        with open(os.path.join(directory, f"m{i:03d}.jac"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+    cell = "".join(f"import:jac m{i:03d};\n" for i in range(modules))
+    cell += f"with entry {{ print(m{modules - 1:03d}.total(1)); }}\n"
+    with open(os.path.join(directory, "cell.jac"), "w") as f:
+        f.write(cell)
+    return cell
+
+
+def measure(library: str, cache_dir: str, jobs: int) -> dict:
+    """Run the cell once in a fresh interpreter."""
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD_PROBE, library, cache_dir, str(jobs)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(modules: int, abilities: int, jobs: list[int], runs: int) -> dict:
+    """Run the benchmark and return medians plus raw samples."""
+    samples: dict[str, list[float]] = {}
+    with tempfile.TemporaryDirectory() as library:
+        write_library(library, modules, abilities)
+        source_bytes = sum(
+            os.path.getsize(os.path.join(library, i))
+            for i in os.listdir(library)
+            if i.startswith("m")
+        )
+        for _ in range(runs):
+            for n in jobs:
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    cold = measure(library, cache_dir, n)
+                    samples.setdefault(f"cold_jobs_{n}", []).append(cold["seconds"])
+                    if n == jobs[-1]:
+                        warm = measure(library, cache_dir, n)
+                        samples.setdefault("cached", []).append(warm["seconds"])
+    medians = {key: statistics.median(values) for key, values in samples.items()}
+    baseline = medians[f"cold_jobs_{jobs[0]}"]
+    return {
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "modules": modules,
+        "source_bytes": source_bytes,
+        "median": medians,
+        "speedup": {
+            key: baseline / value for key, value in medians.items() if value > 0
+        },
+        "samples": samples,
+    }
+
+
+def main(argv: list = None) -> int:
+    """Entry point for the import benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--modules", type=int, default=24)
+    parser.add_argument(
+        "--abilities", type=int, default=40, help="Abilities per generated file"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        nargs="+",
+        default=[1, os.cpu_count() or 1],
+        help="Compile processes to compare, the first one is the baseline",
+    )
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = run(args.modules, args.abilities, args.jobs, args.runs)
+    results["wall_seconds"] = time.perf_counter() - start
+    print(json.dumps({k: results[k] for k in ("median", "speedup")}, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
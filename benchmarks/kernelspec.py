@@ -0,0 +1,89 @@
+"""Helpers to launch Jac kernels from a throwaway kernel spec."""
+import contextlib
+import json
+import os
+import sys
+import tempfile
+from typing import Iterator, Optional
+
+from jackernel.install import fork_kernel_json, kernel_json
+
+from jupyter_client.kernelspec import KernelSpecManager
+from jupyter_client.manager import KernelManager
+
+KERNEL_NAME = "jac-bench"
+
+
+@contextlib.contextmanager
+def temporary_kernel_spec(
+    extra_argv: Optional[list] = None, fork_server: bool = False
+) -> Iterator[str]:
+    """
+    Write the kernel spec from `jackernel.install` to a temporary directory.
+
+    The spec runs with the current interpreter, so benchmarks measure the
+    environment they are started from.
+
+    Parameters
+    ----------
+    extra_argv : list, optional
+        Extra command line arguments for the kernel, e.g. traitlets config.
+    fork_server : bool
+        Use the fork server spec, kernels are forked from a warm server.
+
+    Yields
+    ------
+    str
+        The directory holding the `kernels/<name>/kernel.json` tree.
+    """
+    spec = dict(fork_kernel_json if fork_server else kernel_json)
+    spec["argv"] = [sys.executable] + spec["argv"][1:] + (extra_argv or [])
+    with tempfile.TemporaryDirectory() as td:
+        spec_dir = os.path.join(td, KERNEL_NAME)
+        os.makedirs(spec_dir)
+        with open(os.path.join(spec_dir, "kernel.json"), "w") as f:
+            json.dump(spec, f)
+        yield td
+
+
+def kernel_manager(spec_root: str) -> KernelManager:
+    """Return a kernel manager for the temporary spec in `spec_root`."""
+    return KernelManager(
+        kernel_name=KERNEL_NAME,
+        kernel_spec_manager=KernelSpecManager(kernel_dirs=[spec_root]),
+    )
+
+
+def kernel_pid(km: KernelManager) -> Optional[int]:
+    """Return the pid of a locally launched kernel, if known."""
+    provisioner = getattr(km, "provisioner", None)
+    return getattr(provisioner, "pid", None)
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Return the resident set size of a process, None if unavailable."""
+    with contextlib.suppress(OSError), open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    try:
+        import psutil
+
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+def cpu_seconds(pid: int) -> Optional[float]:
+    """Return the user plus system CPU time of a process, None if unavailable."""
+    with contextlib.suppress(OSError), open(f"/proc/{pid}/stat") as f:
+        # Fields after the parenthesised command name, utime and stime are 14, 15.
+        fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    try:
+        import psutil
+
+        times = psutil.Process(pid).cpu_times()
+        return times.user + times.system
+    except Exception:
+        return None
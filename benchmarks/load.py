@@ -0,0 +1,306 @@
+"""
+Load test for many Jac kernels on one machine.
+
+Launches N kernels from the `jackernel.install` kernel spec with
+`jupyter_client` and drives each of them with a mix of execute, complete
+and inspect requests at a fixed rate over the real messaging protocol.
+Everything runs on localhost.
+
+Reported:
+
+- per message type latency percentiles (request sent to shell reply),
+- overall and per kernel throughput,
+- CPU time and peak resident memory of every kernel process.
+
+Each kernel runs the cell once before the clock starts, unless --cold is
+given, so the numbers describe kernels that are already in use.
+
+    python benchmarks/load.py --kernels 50 --rate 2 --duration 60 \
+        --output load.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+from kernelspec import (
+    cpu_seconds,
+    kernel_manager,
+    kernel_pid,
+    rss_bytes,
+    temporary_kernel_spec,
+)
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+DEFAULT_MIX = "execute=3,complete=1,inspect=1"
+
+
+class KernelDriver:
+    """One kernel, its client and the latencies measured against it."""
+
+    def __init__(self, spec_root: str, index: int) -> None:
+        """Initialize driver, the kernel is started by `start`."""
+        self.index = index
+        self.km = kernel_manager(spec_root)
+        self.kc = None
+        self.pid: Optional[int] = None
+        self.ready = False
+        self.latencies: dict[str, list[float]] = {}
+        self.failures = 0
+        self.peak_rss = 0
+        self.cpu_start: Optional[float] = None
+        self.cpu_end: Optional[float] = None
+
+    def start(self, timeout: float, first_cell: Optional[str] = None) -> None:
+        """Launch the kernel, wait until it is ready and run `first_cell`."""
+        self.km.start_kernel()
+        self.kc = self.km.client()
+        self.kc.start_channels()
+        self.kc.wait_for_ready(timeout=timeout)
+        self.pid = kernel_pid(self.km)
+        if first_cell is not None:
+            self.request("execute", first_cell, timeout)
+            self.latencies.clear()
+            self.failures = 0
+        self.ready = True
+
+    def stop(self) -> None:
+        """Shut the kernel down."""
+        if self.kc is not None:
+            self.kc.stop_channels()
+        self.km.shutdown_kernel(now=True)
+
+    def sample(self) -> None:
+        """Record the current resident memory of the kernel."""
+        rss = rss_bytes(self.pid) if self.pid else None
+        if rss:
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def request(self, kind: str, code: str, timeout: float) -> None:
+        """Send one request and wait for its shell reply."""
+        start = time.perf_counter()
+        if kind == "execute":
+            msg_id = self.kc.execute(code)
+        elif kind == "complete":
+            msg_id = self.kc.complete(code, len(code))
+        else:
+            msg_id = self.kc.inspect(code, len(code))
+        try:
+            while True:
+                reply = self.kc.get_shell_msg(timeout=timeout)
+                if reply["parent_header"].get("msg_id") == msg_id:
+                    break
+        except Exception:
+            self.failures += 1
+            return
+        elapsed = time.perf_counter() - start
+        if reply["content"].get("status") != "ok":
+            self.failures += 1
+        self.latencies.setdefault(kind, []).append(elapsed)
+        # Output is not checked, keep the iopub queue from growing.
+        while self.kc.iopub_channel.msg_ready():
+            self.kc.iopub_channel.get_msg(timeout=0)
+
+    def drive(
+        self,
+        schedule: list[str],
+        code: dict[str, str],
+        rate: float,
+        deadline: float,
+        timeout: float,
+    ) -> None:
+        """Send requests at `rate` per second until `deadline`."""
+        self.cpu_start = cpu_seconds(self.pid) if self.pid else None
+        interval = 1 / rate
+        # Spread the kernels so their requests do not arrive in lock step.
+        next_send = time.perf_counter() + random.uniform(0, interval)
+        sent = 0
+        while next_send < deadline:
+            time.sleep(max(0.0, next_send - time.perf_counter()))
+            kind = schedule[sent % len(schedule)]
+            self.request(kind, code[kind], timeout)
+            sent += 1
+            next_send += interval
+        self.cpu_end = cpu_seconds(self.pid) if self.pid else None
+
+    def report(self, duration: float) -> dict[str, Any]:
+        """Return the per kernel numbers."""
+        cpu = None
+        if self.cpu_start is not None and self.cpu_end is not None:
+            cpu = self.cpu_end - self.cpu_start
+        count = sum(len(i) for i in self.latencies.values())
+        return {
+            "kernel": self.index,
+            "pid": self.pid,
+            "requests": count,
+            "failures": self.failures,
+            "requests_per_second": count / duration,
+            "cpu_seconds": cpu,
+            "cpu_percent": 100 * cpu / duration if cpu is not None else None,
+            "peak_rss_mb": self.peak_rss / 2**20 if self.peak_rss else None,
+        }
+
+
+def parse_mix(mix: str) -> list[str]:
+    """Turn `execute=3,complete=1` into a round robin request schedule."""
+    schedule = []
+    for item in mix.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in ("execute", "complete", "inspect"):
+            raise ValueError(f"Unknown request type {kind!r}")
+        schedule.extend([kind] * int(weight or 1))
+    random.shuffle(schedule)
+    return schedule
+
+
+def latency_stats(values: list[float]) -> dict[str, Any]:
+    """Return latency percentiles in milliseconds."""
+    values = sorted(values)
+
+    def pct(p: float) -> float:
+        return values[min(len(values) - 1, int(p / 100 * len(values)))] * 1e3
+
+    return {
+        "count": len(values),
+        "mean_ms": statistics.fmean(values) * 1e3,
+        "p50_ms": pct(50),
+        "p90_ms": pct(90),
+        "p99_ms": pct(99),
+        "max_ms": values[-1] * 1e3,
+    }
+
+
+def run(
+    kernels: int,
+    rate: float,
+    duration: float,
+    schedule: list[str],
+    code: dict[str, str],
+    timeout: float,
+    kernel_args: Optional[list] = None,
+    cold: bool = False,
+) -> dict[str, Any]:
+    """Launch the kernels, drive them for `duration` seconds and report."""
+    first_cell = None if cold else code["execute"]
+    with temporary_kernel_spec(kernel_args) as spec_root:
+        drivers = [KernelDriver(spec_root, i) for i in range(kernels)]
+        try:
+            starters = [
+                threading.Thread(target=i.start, args=(timeout, first_cell))
+                for i in drivers
+            ]
+            for i in starters:
+                i.start()
+            for i in starters:
+                i.join()
+            ready = [i for i in drivers if i.ready]
+
+            stop = threading.Event()
+
+            def monitor() -> None:
+                while not stop.is_set():
+                    for i in ready:
+                        i.sample()
+                    stop.wait(0.5)
+
+            sampler = threading.Thread(target=monitor, daemon=True)
+            sampler.start()
+            start = time.perf_counter()
+            deadline = start + duration
+            workers = [
+                threading.Thread(
+                    target=i.drive, args=(schedule, code, rate, deadline, timeout)
+                )
+                for i in ready
+            ]
+            for i in workers:
+                i.start()
+            for i in workers:
+                i.join()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            sampler.join()
+        finally:
+            for i in drivers:
+                i.stop()
+
+    by_type: dict[str, list[float]] = {}
+    for i in ready:
+        for kind, values in i.latencies.items():
+            by_type.setdefault(kind, []).extend(values)
+    total = sum(len(i) for i in by_type.values())
+    return {
+        "kernels": kernels,
+        "kernels_ready": len(ready),
+        "rate_per_kernel": rate,
+        "duration_seconds": elapsed,
+        "requests": total,
+        "failures": sum(i.failures for i in ready),
+        "requests_per_second": total / elapsed,
+        "latency": {kind: latency_stats(v) for kind, v in sorted(by_type.items())},
+        "per_kernel": [i.report(elapsed) for i in ready],
+    }
+
+
+def main(argv: list = None) -> int:
+    """Entry point for the load test."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--kernels", type=int, default=10)
+    parser.add_argument(
+        "--rate", type=float, default=2, help="Requests per second sent to each kernel"
+    )
+    parser.add_argument("--duration", type=float, default=30, help="Seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted request types")
+    parser.add_argument(
+        "--cell",
+        default=os.path.join(CORPUS_DIR, "tiny_print.jac"),
+        help="Jac file sent with every execute request",
+    )
+    parser.add_argument("--complete-code", default="pri")
+    parser.add_argument("--inspect-code", default="print")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument(
+        "--kernel-arg",
+        action="append",
+        default=[],
+        help="Extra kernel command line argument, can be repeated",
+    )
+    parser.add_argument(
+        "--cold",
+        action="store_true",
+        help="Include each kernel's first cell (compiler warm up) in the results",
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    with open(args.cell) as f:
+        code = {
+            "execute": f.read(),
+            "complete": args.complete_code,
+            "inspect": args.inspect_code,
+        }
+    results = run(
+        args.kernels,
+        args.rate,
+        args.duration,
+        parse_mix(args.mix),
+        code,
+        args.timeout,
+        args.kernel_arg,
+        args.cold,
+    )
+    summary = {k: v for k, v in results.items() if k != "per_kernel"}
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if results["kernels_ready"] < args.kernels else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""
+Microbenchmarks for the Jac transpile and execute pipeline.
+
+Every cell of the corpus in `benchmarks/corpus` goes through three stages:
+
+- `transpile`: `transpile_jac_blue`, jac source to a python code object,
+- `import`: `import_jac_module`, transpile and run the generated code,
+- `exec_jac`: what the kernel runs for each cell, including output capture.
+
+Each stage is timed cold, with no transpile cache so every call compiles,
+and warm, with the cell already cached. The compiler is warmed up once
+before measuring, so cold numbers do not include loading jaclang. Latency
+percentiles, throughput and the peak memory traced during one extra call
+are reported per cell, stage and mode.
+
+Results are written as JSON. With --compare the medians are compared to
+an earlier result file and the script exits non-zero on a regression.
+
+    python benchmarks/micro.py --iterations 20 --output micro.json
+    python benchmarks/micro.py --compare micro.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from typing import Any, Callable, Optional
+
+from jackernel.cache import LRUCache, jaclang_version
+from jackernel.importer import import_jac_module
+from jackernel.execute import exec_jac
+from jackernel.transpiler import transpile_jac_blue, warm_up
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+STAGES = ("transpile", "import", "exec_jac")
+MODES = ("cold", "warm")
+
+
+def load_corpus(path: str = CORPUS_DIR) -> dict[str, str]:
+    """Return the `.jac` cells in `path` by name."""
+    corpus = {}
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".jac"):
+            with open(os.path.join(path, name)) as f:
+                corpus[name[:-4]] = f.read()
+    return corpus
+
+
+def stage_runners(
+    caller_dir: str,
+) -> dict[str, Callable[[str, Optional[LRUCache]], bool]]:
+    """Return a runner per stage, each returns whether the cell succeeded."""
+
+    def transpile(cell: str, cache: Optional[LRUCache]) -> bool:
+        return not transpile_jac_blue(cell, caller_dir, cache=cache).errors
+
+    def import_(cell: str, cache: Optional[LRUCache]) -> bool:
+        module = import_jac_module(
+            transpile_jac_blue,
+            cell,
+            caller_dir,
+            module=types.ModuleType("session"),
+            cache=cache,
+        )
+        return module is not None
+
+    def exec_(cell: str, cache: Optional[LRUCache]) -> bool:
+        exec_jac(
+            cell,
+            module=types.ModuleType("session"),
+            cache=cache,
+            caller_dir=caller_dir,
+        )
+        return True
+
+    return {"transpile": transpile, "import": import_, "exec_jac": exec_}
+
+
+def call(runner: Callable, cell: str, cache: Optional[LRUCache]) -> Any:  # noqa: ANN401
+    """Run one stage quietly, returning its outcome or the exception raised."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            return runner(cell, cache)
+        except Exception as e:
+            return e
+
+
+def measure(runner: Callable, cell: str, mode: str, iterations: int) -> dict[str, Any]:
+    """Time `iterations` calls of a stage and trace the peak memory of one."""
+    cache = LRUCache() if mode == "warm" else None
+    outcome = call(runner, cell, cache)
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call(runner, cell, cache)
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        call(runner, cell, cache)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "status": "ok" if outcome is True else "error",
+        "error": repr(outcome) if isinstance(outcome, Exception) else None,
+        "median_seconds": statistics.median(latencies),
+        "p95_seconds": percentile(latencies, 95),
+        "min_seconds": min(latencies),
+        "cells_per_second": len(latencies) / sum(latencies),
+        "peak_kb": peak / 1024,
+    }
+
+
+def percentile(values: list[float], pct: int) -> float:
+    """Return the `pct` percentile of `values`."""
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def git_commit() -> Optional[str]:
+    """Return the commit being benchmarked, if run from a git checkout."""
+    with contextlib.suppress(OSError, subprocess.CalledProcessError):
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    return None
+
+
+def run(
+    corpus: dict[str, str], iterations: int, stages: tuple = STAGES
+) -> dict[str, Any]:
+    """Benchmark every cell of the corpus and return the results."""
+    caller_dir = tempfile.mkdtemp(prefix="jackernel-bench-")
+    try:
+        warm_up(caller_dir)
+        runners = stage_runners(caller_dir)
+        results = {
+            name: {
+                stage: {
+                    mode: measure(runners[stage], cell, mode, iterations)
+                    for mode in MODES
+                }
+                for stage in stages
+            }
+            for name, cell in corpus.items()
+        }
+    finally:
+        shutil.rmtree(caller_dir, ignore_errors=True)
+    return {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "jaclang": jaclang_version(),
+        "iterations": iterations,
+        "results": results,
+    }
+
+
+def compare(
+    results: dict, baseline: dict, threshold: float, min_delta: float
+) -> list[str]:
+    """
+    Return the median latencies that regressed against a baseline.
+
+    Parameters
+    ----------
+    results : dict
+        The results of this run.
+    baseline : dict
+        Earlier results, e.g. from the parent commit.
+    threshold : float
+        Slowdown ratio counted as a regression.
+    min_delta : float
+        Slowdowns smaller than this many seconds are ignored as noise.
+
+    Returns
+    -------
+    list[str]
+        A description of every regression.
+    """
+    regressions = []
+    for name, stages in results["results"].items():
+        for stage, modes in stages.items():
+            for mode, sample in modes.items():
+                try:
+                    before = baseline["results"][name][stage][mode]["median_seconds"]
+                except KeyError:
+                    continue
+                ratio = sample["median_seconds"] / before
+                print(f"{name:<16} {stage:<10} {mode:<5} {ratio:6.2f}x")
+                delta = sample["median_seconds"] - before
+                if ratio > threshold and delta > min_delta:
+                    regressions.append(f"{name} {stage} {mode}: {ratio:.2f}x")
+    return regressions
+
+
+def summary(results: dict) -> str:
+    """Return a table of the median latencies in milliseconds."""
+    lines = [f"{'cell':<16} {'stage':<10} {'cold ms':>9} {'warm ms':>9}  status"]
+    for name, stages in results["results"].items():
+        for stage, modes in stages.items():
+            cold, warm = modes["cold"], modes["warm"]
+            lines.append(
+                f"{name:<16} {stage:<10} {cold['median_seconds'] * 1e3:9.2f} "
+                f"{warm['median_seconds'] * 1e3:9.2f}  {cold['status']}"
+            )
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+    """Entry point for the microbenchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument(
+        "--cells", nargs="+", help="Only run these cells of the corpus (by name)"
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Slowdown ratio counted as a regression by --compare",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=0.0005,
+        help="Slowdowns below this many seconds are ignored by --compare",
+    )
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus)
+    if args.cells:
+        corpus = {i: corpus[i] for i in args.cells}
+    results = run(corpus, args.iterations, tuple(args.stages))
+    print(summary(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_delta)
+        for i in regressions:
+            print(f"Regression, {i}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Startup benchmark for the Jac kernel.
+
+Measures, over several fresh launches:
+
+- time from spawning `python -m jackernel.kernel` to its first
+  kernel_info_reply (time-to-kernel-ready),
+- the number of modules loaded by `import jackernel.kernel`,
+- the resident memory of the kernel once it is ready.
+
+With --fork-server kernels come from `jackernel.forkserver`. The server
+is started by the first launch, which is left out of the samples.
+
+Results are written as JSON. With --check the medians are compared to
+`startup_budget.json` and the script exits non-zero on a regression.
+
+    python benchmarks/startup.py --runs 5 --output startup.json --check
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from kernelspec import kernel_manager, kernel_pid, rss_bytes, temporary_kernel_spec
+
+BUDGET_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "startup_budget.json"
+)
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import jackernel.kernel
+print(json.dumps({"import_seconds": time.perf_counter() - start,
+                  "module_count": len(sys.modules),
+                  "modules": sorted(sys.modules)}))
+"""
+
+
+def measure_import() -> tuple[dict, list[str]]:
+    """Import `jackernel.kernel` in a fresh interpreter."""
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    sample = json.loads(out.strip().splitlines()[-1])
+    return sample, sample.pop("modules")
+
+
+def measure_ready(spec_root: str, timeout: float) -> dict:
+    """Launch one kernel and time it until it answers kernel_info."""
+    km = kernel_manager(spec_root)
+    start = time.perf_counter()
+    km.start_kernel()
+    kc = km.client()
+    kc.start_channels()
+    try:
+        kc.wait_for_ready(timeout=timeout)
+        ready = time.perf_counter() - start
+        pid = kernel_pid(km)
+        rss = rss_bytes(pid) if pid else None
+    finally:
+        kc.stop_channels()
+        km.shutdown_kernel(now=True)
+    return {"ready_seconds": ready, "rss_mb": rss / 2**20 if rss else None}
+
+
+def run(runs: int, timeout: float, fork_server: bool = False) -> dict:
+    """Run the benchmark and return medians plus raw samples."""
+    samples = []
+    # The warm up would be measured as startup memory, keep it out.
+    with temporary_kernel_spec(["--JacKernel.warm_up=False"], fork_server) as spec_root:
+        if fork_server:
+            measure_ready(spec_root, timeout)
+        for _ in range(runs):
+            sample, modules = measure_import()
+            sample.update(measure_ready(spec_root, timeout))
+            samples.append(sample)
+    medians = {}
+    for key in samples[0]:
+        values = [i[key] for i in samples if i[key] is not None]
+        medians[key] = statistics.median(values) if values else None
+    return {
+        "python": sys.version.split()[0],
+        "median": medians,
+        "samples": samples,
+        "modules": modules,
+    }
+
+
+def check(results: dict, budget: dict) -> list[str]:
+    """Return the budget entries the results violate."""
+    medians = results["median"]
+    failures = [
+        f"{key}: {medians[key]:.3f} > {limit}"
+        for key, limit in budget["max"].items()
+        if medians.get(key) is not None and medians[key] > limit
+    ]
+    failures.extend(
+        f"{name} is imported at startup"
+        for name in budget["deferred_modules"]
+        if name in results["modules"]
+    )
+    return failures
+
+
+def main(argv: list = None) -> int:
+    """Entry point for the startup benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--check", action="store_true", help="Fail on budget overrun")
+    parser.add_argument("--budget", default=BUDGET_FILE)
+    parser.add_argument(
+        "--fork-server",
+        action="store_true",
+        help="Launch kernels through jackernel.forkserver (rss_mb is the launcher's)",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.runs, args.timeout, args.fork_server)
+    print(json.dumps(results["median"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.check:
+        with open(args.budget) as f:
+            failures = check(results, json.load(f))
+        for i in failures:
+            print(f"Startup budget exceeded, {i}", file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
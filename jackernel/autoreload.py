@@ -0,0 +1,220 @@
+"""
+Reload the jac files imported by cells when they change on disk.
+
+`jac_file_import` tracks every jac file it runs in this process, with its
+module and the jac files it imports. `reload_modules`, called before a cell
+with `autoreload` on, stats the tracked files and hashes the ones whose
+size or mtime moved. Files whose content changed are compiled and executed
+again in their module, then the files importing them, directly or not, so
+that `include:jac` copies and values computed at import time are
+refreshed too. Files that did not change are not touched.
+
+Modules keep their identity, so `import:jac` names bound by earlier cells
+see the new definitions. Functions and classes that cells copied out of a
+reloaded module, e.g. with `include:jac`, are rebound in the namespaces of
+the sessions that asked for reloads. Objects created before a reload keep
+their old class, and names a file no longer defines stay in its module, as
+with `importlib.reload`.
+"""
+import hashlib
+import os
+import threading
+import types
+import weakref
+from typing import Iterable, Optional
+
+from jackernel.diagnostics import get_logger
+from jackernel.profiling import CompileProfile, timed
+
+_log = get_logger("importer")
+
+
+class _TrackedModule:
+    """A jac file run by `jac_file_import` and what it looked like then."""
+
+    def __init__(
+        self, path: str, module: types.ModuleType, source: str, imports: list[str]
+    ) -> None:
+        self.path = path
+        self.module = module
+        self.imports = imports
+        self.stat = _stat(path)
+        self.digest = _digest(source)
+
+
+_modules: dict[str, _TrackedModule] = {}
+# The session modules rebound after reloads.
+_namespaces: "weakref.WeakSet[types.ModuleType]" = weakref.WeakSet()
+_lock = threading.RLock()
+
+
+def _stat(path: str) -> Optional[tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _digest(source: str) -> str:
+    return hashlib.sha1(source.encode()).hexdigest()
+
+
+def track_module(
+    path: str, module: types.ModuleType, source: str, imports: list[str]
+) -> None:
+    """
+    Remember a jac file that was just imported.
+
+    Parameters
+    ----------
+    path : str
+        The absolute path of the file.
+    module : types.ModuleType
+        The module the file was executed in.
+    source : str
+        The content of the file that was compiled.
+    imports : list[str]
+        The paths of the jac files it imports.
+    """
+    with _lock:
+        _modules[path] = _TrackedModule(path, module, source, imports)
+
+
+def is_tracked(path: str) -> bool:
+    """Return whether the jac file at `path` was imported in this process."""
+    return path in _modules
+
+
+def changed_modules() -> dict[str, str]:
+    """
+    Find the tracked jac files whose content changed since they were run.
+
+    Only files whose size or mtime changed are read. Deleted files are
+    left alone, their modules keep working.
+
+    Returns
+    -------
+    dict[str, str]
+        The new source of each changed file, by path.
+    """
+    changed = {}
+    with _lock:
+        for path, tracked in _modules.items():
+            stat = _stat(path)
+            if stat is None or stat == tracked.stat:
+                continue
+            try:
+                with open(path) as f:
+                    source = f.read()
+            except OSError:
+                continue
+            if _digest(source) == tracked.digest:
+                # Touched or saved without changes.
+                tracked.stat = stat
+            else:
+                changed[path] = source
+    return changed
+
+
+def reload_modules(
+    namespace: Optional[types.ModuleType] = None,
+    profile: Optional[CompileProfile] = None,
+) -> list[str]:
+    """
+    Reload the changed jac files and the jac files importing them.
+
+    Parameters
+    ----------
+    namespace : types.ModuleType, optional
+        The session module about to run a cell. It is rebound now and after
+        later reloads, as long as it exists.
+    profile : CompileProfile, optional
+        Gets the time spent checking and reloading as `autoreload`.
+
+    Returns
+    -------
+    list[str]
+        The paths of the reloaded files, in the order they were executed.
+
+    Raises
+    ------
+    TransformError
+        When a changed file does not compile. Like an error raised while
+        executing it, the file is tried again on the next call, and the
+        files importing it are not reloaded until then.
+    """
+    from jackernel.importer import (
+        dependency_order,
+        jac_file_imports,
+        precompile_jac_files,
+        run_jac_file,
+    )
+
+    with _lock, timed(profile, "autoreload"):
+        if namespace is not None:
+            _namespaces.add(namespace)
+        changed = changed_modules()
+        if not changed:
+            return []
+        sources: dict[str, Optional[str]] = dict.fromkeys(_dependents(changed))
+        sources.update(changed)
+        graph = {
+            path: (source, _modules[path].imports) for path, source in sources.items()
+        }
+        # New imports are not tracked yet, they are imported by the reload.
+        for path in changed:
+            graph[path] = (changed[path], jac_file_imports(path, changed[path]))
+        order = dependency_order(graph)
+        _log.info(
+            "Reloading %d jac files",
+            len(order),
+            extra={"data": {"changed": sorted(changed), "files": order}},
+        )
+        precompile_jac_files(list(changed))
+        replaced: dict[int, tuple[object, object]] = {}
+        try:
+            for path in order:
+                tracked = _modules[path]
+                source = sources[path]
+                if source is None:
+                    with open(path) as f:
+                        source = f.read()
+                previous = dict(tracked.module.__dict__)
+                run_jac_file(tracked.module, path, source)
+                _modules[path] = _TrackedModule(
+                    path, tracked.module, source, graph[path][1]
+                )
+                for name, old in previous.items():
+                    new = tracked.module.__dict__.get(name)
+                    if new is not old and isinstance(old, (type, types.FunctionType)):
+                        replaced[id(old)] = (old, new)
+        finally:
+            # Also after a file failed, for the ones reloaded before it.
+            for module in list(_namespaces):
+                _rebind(module.__dict__, replaced)
+        return order
+
+
+def _dependents(paths: Iterable[str]) -> set[str]:
+    """Return the tracked files importing any of `paths`, directly or not."""
+    importers: dict[str, set[str]] = {}
+    for path, tracked in _modules.items():
+        for dep in tracked.imports:
+            importers.setdefault(dep, set()).add(path)
+    found: set[str] = set()
+    pending = list(paths)
+    while pending:
+        for path in importers.get(pending.pop(), ()):
+            if path not in found:
+                found.add(path)
+                pending.append(path)
+    return found
+
+
+def _rebind(namespace: dict, replaced: dict[int, tuple[object, object]]) -> None:
+    """Point the names bound to replaced functions and classes to the new ones."""
+    for name, value in list(namespace.items()):
+        old, new = replaced.get(id(value), (None, None))
+        if old is value:
+            namespace[name] = new
@@ -0,0 +1,343 @@
+"""Content addressed caches for transpiled Jac cells."""
+import contextlib
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from importlib import metadata
+from typing import Any, Hashable, Iterable, Iterator, Optional
+
+from jackernel.diagnostics import get_logger
+
+_log = get_logger("importer")
+
+
+@lru_cache(maxsize=None)
+def jaclang_version() -> str:
+    """Return the installed jaclang version, part of every cache key."""
+    try:
+        return metadata.version("jaclang")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def source_key(source: str, schedule: Iterable[type], *extra: str) -> str:
+    """
+    Hash a piece of jac source together with the compiler configuration.
+
+    Parameters
+    ----------
+    source : str
+        The jac source to hash.
+    schedule : Iterable[type]
+        The pass schedule the source is compiled with.
+    *extra : str
+        Anything else the generated code depends on (e.g. the caller dir).
+
+    Returns
+    -------
+    str
+        A hex digest identifying the compiled output.
+    """
+    digest = hashlib.sha256()
+    digest.update(jaclang_version().encode())
+    for i in schedule:
+        digest.update(f"\0{i.__module__}.{i.__qualname__}".encode())
+    for i in extra:
+        digest.update(f"\0{i}".encode())
+    digest.update(b"\0\0")
+    digest.update(source.encode())
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Thread safe, bounded least recently used cache with hit/miss counters."""
+
+    def __init__(self, max_size: int = 128) -> None:
+        """
+        Initialize cache.
+
+        Parameters
+        ----------
+        max_size : int
+            Maximum number of entries kept, 0 disables the cache.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of cached entries."""
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the entry for `key` and mark it as recently used."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:  # noqa: ANN401
+        """Store `value`, evicting the least recently used entries if full."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def resize(self, max_size: int) -> None:
+        """Change the maximum size, evicting entries as needed."""
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def clear(self) -> None:
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """Return the cache counters."""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _evict(self) -> None:
+        while len(self._entries) > max(self.max_size, 0):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+def default_cache_dir() -> str:
+    """Return the per-user cache directory, following `XDG_CACHE_HOME`."""
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(root, "jackernel")
+
+
+class DiskCache:
+    """
+    Size bounded cache of byte strings in a directory.
+
+    Safe to share between processes: entries are written to a temporary
+    file and renamed into place, so readers never see a partial entry, and
+    eviction runs under an exclusive lock of the directory. Reading an
+    entry marks it as recently used, the least recently used entries are
+    removed once the entries take more than `max_size` bytes.
+
+    Each instance counts the bytes it writes on top of the size it last
+    found on disk, and only scans the directory when that passes
+    `max_size`. Eviction then goes down to `low_water` of `max_size`, so
+    the next scan is many writes away. Entries written by other processes
+    in the meantime can make the directory overshoot `max_size` until then.
+    """
+
+    suffix = ".entry"
+    low_water = 0.9
+    # Entry locks share this many lock files, which are never removed.
+    lock_stripes = 64
+
+    def __init__(self, directory: str, max_size: int = 128 << 20) -> None:
+        """
+        Initialize cache, creating `directory` if needed.
+
+        Parameters
+        ----------
+        directory : str
+            Where the entries are stored, only accessible to the current user.
+        max_size : int
+            Maximum total size of the entries in bytes.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bytes in the directory as far as this instance knows, None until
+        # it was first scanned.
+        self._size: Optional[int] = None
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def __contains__(self, key: str) -> bool:
+        """Return whether `key` is cached, without marking it as used."""
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the entry for `key`, None when it is not cached."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store `data`, evicting the least recently used entries if full."""
+        if self.max_size <= 0 or len(data) > self.max_size:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            raise
+        if self._size is not None:
+            self._size += len(data)
+        if self._size is None or self._size > self.max_size:
+            self._evict()
+
+    @contextlib.contextmanager
+    def lock(self, key: Optional[str] = None) -> Iterator[None]:
+        """
+        Hold an exclusive lock across processes.
+
+        Parameters
+        ----------
+        key : str, optional
+            Lock only this entry, e.g. while it is being computed, instead
+            of the whole directory. Entries share `lock_stripes` lock files,
+            so holding one may wait for another entry.
+        """
+        name = ".lock"
+        if key is not None:
+            name += f"-{zlib.crc32(key.encode()) % self.lock_stripes:02d}"
+        with open(os.path.join(self.directory, name), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def clear(self) -> None:
+        """Remove all entries and reset the counters."""
+        with self.lock():
+            for entry in self._entries():
+                with contextlib.suppress(OSError):
+                    os.unlink(entry.path)
+            self._size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """Return the cache counters and the size of the entries on disk."""
+        entries = list(self._entries())
+        return {
+            "directory": self.directory,
+            "entries": len(entries),
+            "bytes": sum(i.stat().st_size for i in entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _entries(self) -> Iterator[os.DirEntry]:
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    yield entry
+
+    def _evict(self) -> None:
+        with self.lock():
+            entries = []
+            for entry in self._entries():
+                with contextlib.suppress(OSError):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(i[1] for i in entries)
+            if total > self.max_size:
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= self.max_size * self.low_water:
+                        break
+                    with contextlib.suppress(OSError):
+                        os.unlink(path)
+                    total -= size
+                    self.evictions += 1
+            self._size = total
+
+
+# The module cache, compiled jac files imported by cells, configured by the
+# kernel at startup without loading `jackernel.importer`.
+DEFAULT_MODULE_CACHE_SIZE = 128 << 20
+_module_cache: Optional[DiskCache] = None
+_module_cache_settings = ("", DEFAULT_MODULE_CACHE_SIZE)
+_module_cache_lock = threading.Lock()
+_compile_jobs = 0
+
+
+def configure_module_cache(
+    directory: str = "", max_size: int = DEFAULT_MODULE_CACHE_SIZE
+) -> None:
+    """
+    Set where `jackernel.importer` keeps compiled jac files.
+
+    Parameters
+    ----------
+    directory : str
+        The cache directory, by default `modules` in `default_cache_dir()`.
+    max_size : int
+        Maximum size of the cache in bytes, 0 disables it.
+    """
+    global _module_cache, _module_cache_settings
+    with _module_cache_lock:
+        if (directory, max_size) != _module_cache_settings:
+            _module_cache_settings = (directory, max_size)
+            _module_cache = None
+
+
+def module_cache() -> Optional[DiskCache]:
+    """Return the cache of compiled jac files, None when disabled."""
+    global _module_cache, _module_cache_settings
+    with _module_cache_lock:
+        directory, max_size = _module_cache_settings
+        if _module_cache is None and max_size > 0:
+            directory = directory or os.path.join(default_cache_dir(), "modules")
+            try:
+                _module_cache = DiskCache(directory, max_size)
+            except OSError:
+                _log.warning("No module cache, cannot create %s", directory)
+                _module_cache_settings = (directory, 0)
+        return _module_cache
+
+
+def set_compile_jobs(jobs: int) -> None:
+    """
+    Set the processes compiling uncached jac files in parallel.
+
+    See `jackernel.importer.precompile_jac_files`, 0 is one per CPU.
+    """
+    global _compile_jobs
+    _compile_jobs = jobs
+
+
+def compile_jobs() -> int:
+    """Return the `set_compile_jobs` setting."""
+    return _compile_jobs
@@ -0,0 +1,259 @@
+"""
+Compiled cells and their diagnostics, without depending on jaclang.
+
+Everything here can be unpickled in a process that never loads the jac
+compiler, e.g. a kernel compiling through `jackernel.compileserver` or
+the headless runner receiving cells from its worker pool. Code objects
+are pickled through `marshal`, so both ends must run the same python.
+`dumps_cell` and `loads_cell` encode a cell with `marshal` alone, for
+peers that are not trusted to send pickles.
+"""
+from __future__ import annotations
+
+import copyreg
+import functools
+import marshal
+import os
+from types import CodeType
+from typing import Optional
+
+from jackernel.sourcemap import SourceMap
+from jackernel.symbols import Symbol
+
+# As in jaclang.jac.constant, kept here so formatting needs no compiler.
+ERROR_PREAMBLE = "Jac error originates from..."
+ERROR_LINE_RANGE = 3
+
+
+def _reduce_code(code: CodeType) -> tuple:
+    return marshal.loads, (marshal.dumps(code),)
+
+
+copyreg.pickle(CodeType, _reduce_code)
+
+
+class Alert:
+    """Alert interface.
+
+    Alerts raised in a notebook cell have no file behind them, they keep a
+    reference to the cell `source` instead. The relative path and the
+    formatted alert are computed once, on first use.
+    """
+
+    def __init__(
+        self, msg: str, mod: str, line: int, source: Optional[str] = None
+    ) -> None:
+        """Initialize alert."""
+        self.msg = msg
+        self.mod = mod
+        self.line = line
+        self.source = source
+        self._text: Optional[str] = None
+
+    @classmethod
+    def from_alert(cls, alert: object, source: Optional[str] = None) -> Alert:
+        """Copy an alert of the jaclang passes, attaching the cell source."""
+        mod = "" if source is not None else alert.mod
+        return cls(alert.msg.rstrip(), mod, alert.line, source)
+
+    @property
+    def rel_path(self) -> str:
+        """Return the module path relative to the working directory."""
+        return _rel_path(self.mod, os.getcwd()) if self.mod else ""
+
+    def __str__(self) -> str:
+        """Return string representation of alert."""
+        if self._text is None:
+            where = f"{self.rel_path}, " if self.rel_path else ""
+            self._text = f"{where}line {self.line}: {self.msg}"
+        return self._text
+
+    def excerpt(self) -> str:
+        """Return the numbered source lines around the alert, empty if unknown."""
+        source = self.source
+        if source is None:
+            if not self.mod or not os.path.isfile(self.mod):
+                return ""
+            with open(self.mod, "r") as file:
+                source = file.read()
+        return _excerpt(source, self.line, ERROR_LINE_RANGE)
+
+
+@functools.lru_cache(maxsize=256)
+def _rel_path(mod: str, cwd: str) -> str:
+    return os.path.relpath(mod, start=cwd)
+
+
+def _excerpt(source: str, target_line: int, line_range: int) -> str:
+    """Return the numbered lines of `source` around `target_line`, marked.
+
+    Only the clipped lines are looked at, so the cost does not depend on
+    the size of the source after them.
+    """
+    first = max(1, target_line - line_range)
+    last = target_line + line_range
+    start = 0
+    for _ in range(first - 1):
+        start = source.find("\n", start) + 1
+        if not start:
+            return ""
+    result = []
+    for lineno in range(first, last + 1):
+        end = source.find("\n", start)
+        line = source[start:] if end < 0 else source[start:end]
+        mark = "*" if lineno == target_line else ""
+        result.append(f"{mark}{lineno}: \t{line}")
+        if end < 0:
+            break
+        start = end + 1
+    return "\n".join(result)
+
+
+class TransformError(Exception):
+    """Error during transformation."""
+
+    def __init__(
+        self, message: str, errors: list[Alert], warnings: list[Alert]
+    ) -> None:
+        """Initialize error.
+
+        The message lists every alert and shows the source around the first
+        one, taken from the cell the alerts refer to when they carry it.
+        """
+        # All arguments go to `args`, for pickling and copying.
+        super().__init__(message, errors, warnings)
+        self.errors = errors
+        self.warnings = warnings
+        if len(errors):
+            message += "\nErrors:"
+            for i in self.errors:
+                message += "\n" + str(i)
+        if len(warnings):
+            message += "\nWarnings:"
+            for i in self.warnings:
+                message += "\n" + str(i)
+        first = errors[0] if len(errors) else warnings[0] if len(warnings) else None
+        excerpt = first.excerpt() if first is not None else ""
+        if excerpt:
+            message += f"\n{ERROR_PREAMBLE}\n" + excerpt
+        self.message = message
+
+    def __str__(self) -> str:
+        """Return the message with the alerts and the excerpt."""
+        return self.message
+
+
+class TranspiledCell:
+    """Result of transpiling a jac cell, kept entirely in memory."""
+
+    def __init__(
+        self,
+        errors: list[Alert],
+        py_code: Optional[str] = None,
+        codeobj: Optional[CodeType] = None,
+        units: Optional[list["TranspiledCell"]] = None,
+        line_offset: int = 0,
+        symbols: Optional[list[Symbol]] = None,
+        source_map: Optional[SourceMap] = None,
+        warnings: Optional[list[Alert]] = None,
+    ) -> None:
+        """Initialize transpiled cell.
+
+        A cell compiled element by element has no code object of its own,
+        its `units` are executed in order instead. `line_offset` is the
+        number of cell lines preceding a unit. `symbols` are the names the
+        cell defines, for the kernel's symbol index, and `source_map` maps
+        the generated python back to jac lines. Alerts raised in the cell
+        carry its source, see `cell_alerts`.
+        """
+        self.errors = errors
+        self.py_code = py_code
+        self.codeobj = codeobj
+        self.units = units if units else []
+        self.line_offset = line_offset
+        self.symbols = symbols if symbols else []
+        self.source_map = source_map
+        self.warnings = warnings if warnings else []
+
+
+def dumps_cell(cell: Optional[TranspiledCell]) -> bytes:
+    """
+    Encode a compiled cell with `marshal`, which cannot run code on load.
+
+    Parameters
+    ----------
+    cell : TranspiledCell, optional
+        The cell, None is encoded as is.
+
+    Returns
+    -------
+    bytes
+        The cell as plain tuples, strings, numbers and code objects.
+    """
+    return marshal.dumps(_cell_data(cell) if cell is not None else None)
+
+
+def loads_cell(data: bytes) -> Optional[TranspiledCell]:
+    """
+    Decode a cell encoded by `dumps_cell`.
+
+    Raises
+    ------
+    ValueError
+        When `data` is not an encoded cell.
+    """
+    try:
+        decoded = marshal.loads(data)
+        return _cell_from_data(decoded) if decoded is not None else None
+    # Corrupted code objects raise SystemError, corrupted lengths MemoryError.
+    except (
+        EOFError,
+        IndexError,
+        MemoryError,
+        SystemError,
+        TypeError,
+        ValueError,
+    ) as e:
+        raise ValueError("Not an encoded cell") from e
+
+
+def _cell_data(cell: TranspiledCell) -> tuple:
+    source_map = cell.source_map
+    return (
+        [(i.msg, i.mod, i.line, i.source) for i in cell.errors],
+        cell.py_code,
+        cell.codeobj,
+        [_cell_data(i) for i in cell.units],
+        cell.line_offset,
+        [
+            (i.name, i.kind, i.owner, i.signature, i.doc, i.line, i.origin)
+            for i in cell.symbols
+        ],
+        (
+            (source_map.py_lines, source_map.jac_locs, source_map.mod_paths)
+            if source_map is not None
+            else None
+        ),
+        [(i.msg, i.mod, i.line, i.source) for i in cell.warnings],
+    )
+
+
+def _cell_from_data(data: tuple) -> TranspiledCell:
+    errors, py_code, codeobj, units, line_offset, symbols, source_map, warnings = data
+    if codeobj is not None and not isinstance(codeobj, CodeType):
+        raise TypeError("Not a code object")
+    decoded_symbols = []
+    for name, kind, owner, signature, doc, line, origin in symbols:
+        symbol = Symbol(name, kind, owner, signature, doc, line)
+        symbol.origin = origin
+        decoded_symbols.append(symbol)
+    return TranspiledCell(
+        [Alert(*i) for i in errors],
+        py_code,
+        codeobj,
+        [_cell_from_data(i) for i in units],
+        line_offset,
+        decoded_symbols,
+        SourceMap(*source_map) if source_map is not None else None,
+        [Alert(*i) for i in warnings],
+    )
@@ -0,0 +1,370 @@
+"""
+Compile server shared by the Jac kernels of a host.
+
+One daemon keeps a warm jac compiler and a single transpile cache, and
+serves `transpile_jac_blue` requests over a Unix domain socket. Kernels
+started with `--JacKernel.compile_server=auto` send their cells there and
+never load jaclang themselves. When the daemon cannot be reached they
+compile in process, as without it.
+
+    python -m jackernel.compileserver --cache-size 4096
+
+Cells are compiled on a few worker processes, each with a warm compiler,
+so a slow cell does not hold up the kernels sending other cells. Kernels
+compile their cells relative to their working directory, the same cell
+sent from the same directory is compiled once for all kernels.
+
+Requests are JSON, `{"cell": ..., "caller_dir": ...}`, replies a
+`TranspiledCell` encoded by `jackernel.compiled.dumps_cell`, or None when
+the compiler raised, each framed by its length. Replies are plain data, decoding them
+never runs code. Only the user running the daemon can connect, and
+kernels only use a daemon running as their user (see `jackernel.ipc`).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from jackernel.cache import LRUCache, source_key
+from jackernel.compiled import TranspiledCell, dumps_cell, loads_cell
+from jackernel.diagnostics import get_logger
+from jackernel.ipc import (
+    connect,
+    listen,
+    recv_frame,
+    runtime_path,
+    same_user,
+    send_frame,
+)
+from jackernel.profiling import CompileProfile, timed
+
+_log = get_logger("transform")
+
+
+def default_socket_path() -> str:
+    """Return the daemon socket, `JACKERNEL_COMPILE_SOCKET` overrides it."""
+    return os.environ.get("JACKERNEL_COMPILE_SOCKET") or runtime_path("compile")
+
+
+class CompileClient:
+    """
+    A `transpile_jac_blue` replacement compiling on the shared daemon.
+
+    One connection is kept open and used by one cell at a time. After the
+    daemon failed to answer, or took longer than `timeout`, cells are
+    compiled in process for `retry_interval` seconds before it is tried
+    again.
+    """
+
+    def __init__(
+        self,
+        socket_path: Optional[str] = None,
+        timeout: float = 60,
+        retry_interval: float = 30,
+    ) -> None:
+        """
+        Initialize client, the daemon is connected to on first use.
+
+        Parameters
+        ----------
+        socket_path : str, optional
+            The daemon socket, by default `default_socket_path()`. Cells are
+            compiled in process when the default directory is not private.
+        timeout : float
+            Seconds to wait for a compiled cell.
+        retry_interval : float
+            Seconds to compile in process after the daemon failed.
+        """
+        try:
+            self.socket_path = socket_path or default_socket_path()
+        except PermissionError as e:
+            _log.warning("Compiling in process: %s", e)
+            self.socket_path = None
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._sock = None
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
+
+    def __call__(
+        self,
+        cell: str,
+        caller_dir: str,
+        to_disk: bool = False,
+        cache: Optional[LRUCache] = None,
+        profile: Optional[CompileProfile] = None,
+        gen_dir: str = "",
+    ) -> TranspiledCell:
+        """Transpile a cell, same parameters as `transpile_jac_blue`."""
+        if to_disk:
+            # The daemon writes nothing, generated files are local only.
+            return self._local(cell, caller_dir, to_disk, cache, profile, gen_dir)
+        key = None
+        if cache is not None:
+            key = source_key(cell, (), caller_dir, "compile-server")
+            with timed(profile, "cache"):
+                result = cache.get(key)
+            if result is not None:
+                if profile is not None:
+                    profile.cache_hit = True
+                return result
+        with timed(profile, "compile_server"):
+            result = self._remote(cell, caller_dir)
+        if result is None:
+            return self._local(cell, caller_dir, to_disk, cache, profile)
+        if cache is not None:
+            cache.put(key, result)
+        return result
+
+    def _remote(self, cell: str, caller_dir: str) -> Optional[TranspiledCell]:
+        request = json.dumps({"cell": cell, "caller_dir": caller_dir}).encode()
+        with self._lock:
+            if self.socket_path is None or time.monotonic() < self._retry_at:
+                return None
+            for _ in range(2):
+                if self._sock is None:
+                    self._sock = connect(self.socket_path, self.timeout)
+                    if self._sock is None:
+                        break
+                try:
+                    send_frame(self._sock, request)
+                    reply = recv_frame(self._sock)
+                    if reply is not None:
+                        return loads_cell(reply)
+                except socket.timeout:
+                    # Busy, waiting again would only be slower than
+                    # compiling here.
+                    self.close()
+                    break
+                except (OSError, ValueError):
+                    _log.info("Compile server failed", exc_info=True)
+                # Probably a restarted daemon, reconnect once.
+                self.close()
+            self._retry_at = time.monotonic() + self.retry_interval
+            _log.info("Compiling in process, no compile server at %s", self.socket_path)
+            return None
+
+    def _local(
+        self,
+        cell: str,
+        caller_dir: str,
+        to_disk: bool,
+        cache: Optional[LRUCache],
+        profile: Optional[CompileProfile],
+        gen_dir: str = "",
+    ) -> TranspiledCell:
+        from jackernel.transpiler import transpile_jac_blue
+
+        return transpile_jac_blue(cell, caller_dir, to_disk, cache, profile, gen_dir)
+
+    def close(self) -> None:
+        """Close the connection to the daemon."""
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        server = self.server
+        with server.active_lock:
+            server.active += 1
+        try:
+            while True:
+                request = recv_frame(self.request)
+                if request is None:
+                    return
+                send_frame(self.request, server.compile(request))
+        except OSError:
+            return
+        finally:
+            with server.active_lock:
+                server.active -= 1
+                server.last_active = time.monotonic()
+
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Daemon compiling cells for every kernel of its user."""
+
+    daemon_threads = True
+
+    def __init__(
+        self, listener: object, cache_size: int = 1024, workers: int = 0
+    ) -> None:
+        """
+        Initialize server.
+
+        Parameters
+        ----------
+        listener : socket.socket
+            The bound and listening socket, see `jackernel.ipc.listen`.
+        cache_size : int
+            Number of compiled cells kept, for all kernels. Each worker
+            also keeps as many cells and elements.
+        workers : int
+            Processes compiling cells, 0 for one per CPU up to 4.
+        """
+        super().__init__(listener.getsockname(), _Handler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listener
+        self.cache = LRUCache(cache_size)
+        # Only used to warm up the workers, cells come with their directory.
+        self.scratch_dir = tempfile.mkdtemp(prefix="jackernel-compile-")
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.active = 0
+        self.active_lock = threading.Lock()
+        self.last_active = time.monotonic()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def start_workers(self) -> None:
+        """Start the worker processes and wait until they are warm."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+            context = multiprocessing.get_context("forkserver")
+            # Workers are forked from a server that loaded the compiler once.
+            context.set_forkserver_preload(["jackernel.transpiler"])
+            self._pool = ProcessPoolExecutor(
+                self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.scratch_dir, self.cache.max_size),
+            )
+            pool = self._pool
+        # Each process starts on a submit finding no idle worker.
+        for future in [pool.submit(time.sleep, 0.1) for _ in range(self.workers)]:
+            future.result()
+
+    def compile(self, request: bytes) -> bytes:
+        """Answer one request with the encoded compiled cell."""
+        request = json.loads(request)
+        cell = request["cell"]
+        caller_dir = request["caller_dir"]
+        key = source_key(cell, (), caller_dir, "compile-server")
+        result = self.cache.get(key)
+        if result is None:
+            result = self._compile(cell, caller_dir)
+            if result is not None:
+                self.cache.put(key, result)
+        return dumps_cell(result)
+
+    def verify_request(self, request: object, client_address: object) -> bool:
+        """Only serve processes of the user running the daemon."""
+        if same_user(request):
+            return True
+        _log.warning("Refused a connection from another user")
+        return False
+
+    def _compile(self, cell: str, caller_dir: str) -> Optional[TranspiledCell]:
+        for _ in range(2):
+            with self._pool_lock:
+                pool = self._pool
+            try:
+                return pool.submit(_compile_cell, cell, caller_dir).result()
+            except BrokenProcessPool:
+                # A worker died, e.g. out of memory, start over once.
+                _log.warning("Compile workers died, restarting them")
+                self.start_workers()
+            except Exception:
+                _log.warning("Cell failed to compile", exc_info=True)
+                break
+        # The kernel compiles again in process, and sees the error.
+        return None
+
+    def serve(self, idle_timeout: float = 0) -> None:
+        """Serve until idle for `idle_timeout` seconds, forever when 0."""
+        self.timeout = 1
+        while True:
+            self.handle_request()
+            with self.active_lock:
+                idle = not self.active and (
+                    time.monotonic() - self.last_active > idle_timeout
+                )
+            if idle_timeout and idle:
+                return
+
+    def server_close(self) -> None:
+        """Stop listening and the workers, remove the scratch directory."""
+        super().server_close()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+
+# The element cache of a worker process.
+_worker_cache: Optional[LRUCache] = None
+
+
+def _init_worker(scratch_dir: str, cache_size: int) -> None:
+    global _worker_cache
+    from jackernel.transpiler import warm_up
+
+    _worker_cache = LRUCache(cache_size)
+    warm_up(scratch_dir)
+
+
+def _compile_cell(cell: str, caller_dir: str) -> Optional[TranspiledCell]:
+    from jackernel.transpiler import transpile_jac_blue
+
+    return transpile_jac_blue(cell, caller_dir, cache=_worker_cache)
+
+
+def main(argv: list = None) -> int:
+    """Entry point of the compile server."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--socket", default=None, help="Socket path")
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        help="Compiled cells kept for all kernels",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Processes compiling cells, 0 for one per CPU up to 4",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=0,
+        help="Seconds without requests before exiting, 0 never",
+    )
+    args = parser.parse_args(argv)
+    try:
+        socket_path = args.socket or default_socket_path()
+    except PermissionError as e:
+        print(e, file=sys.stderr)
+        return 1
+    listener = listen(socket_path)
+    if listener is None:
+        print(f"A compile server already listens on {socket_path}", file=sys.stderr)
+        return 1
+    server = CompileServer(listener, args.cache_size, args.workers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.start_workers()
+        server.serve(args.idle_timeout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
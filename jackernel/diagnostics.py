@@ -0,0 +1,132 @@
+"""Structured logging of the compiler, the importer and the kernel.
+
+Each subsystem logs to its own standard library logger,
+`jackernel.<subsystem>`, at a level of its own. Nothing below WARNING is
+enabled by default, so a debug event costs one level check. Events that
+pass are kept, with their structured fields, in a bounded buffer that can
+be read back from a running kernel, e.g. from a cell:
+
+    import:py from jackernel.diagnostics, set_level, events;
+    with entry { set_level("transform", "DEBUG"); }
+    with entry { print(events(10, "transform")); }
+"""
+import logging
+import threading
+from collections import deque
+from typing import Optional, Union
+
+SUBSYSTEMS = ("transform", "importer", "kernel")
+DEFAULT_LEVEL = logging.WARNING
+DEFAULT_BUFFER_SIZE = 1000
+
+
+class EventBuffer(logging.Handler):
+    """Keep the most recent log records as dictionaries."""
+
+    def __init__(self, maxlen: int = DEFAULT_BUFFER_SIZE) -> None:
+        """Initialize buffer."""
+        super().__init__()
+        self._events: deque = deque(maxlen=maxlen)
+        self._events_lock = threading.Lock()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Store the record with the fields passed as `extra={"data": ...}`."""
+        event = {
+            "time": record.created,
+            "subsystem": record.name.rpartition(".")[2],
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        event.update(getattr(record, "data", None) or {})
+        with self._events_lock:
+            self._events.append(event)
+
+    def resize(self, maxlen: int) -> None:
+        """Keep at most `maxlen` events, dropping the oldest ones."""
+        with self._events_lock:
+            self._events = deque(self._events, maxlen=maxlen)
+
+    def events(self) -> list[dict]:
+        """Return the stored events, oldest first."""
+        with self._events_lock:
+            return list(self._events)
+
+    def clear(self) -> None:
+        """Forget all stored events."""
+        with self._events_lock:
+            self._events.clear()
+
+
+_buffer = EventBuffer()
+_root = logging.getLogger("jackernel")
+_root.addHandler(_buffer)
+for _name in SUBSYSTEMS:
+    logging.getLogger(f"jackernel.{_name}").setLevel(DEFAULT_LEVEL)
+
+
+def get_logger(subsystem: str) -> logging.Logger:
+    """Return the logger of one of `SUBSYSTEMS`."""
+    if subsystem not in SUBSYSTEMS:
+        raise ValueError(f"Unknown subsystem {subsystem!r}")
+    return logging.getLogger(f"jackernel.{subsystem}")
+
+
+def set_level(subsystem: str, level: Union[int, str]) -> None:
+    """
+    Change what a subsystem logs.
+
+    Parameters
+    ----------
+    subsystem : str
+        One of `SUBSYSTEMS`, or `*` for all of them.
+    level : int or str
+        A logging level, e.g. `"DEBUG"` or `logging.INFO`.
+    """
+    if isinstance(level, str):
+        level = level.upper()
+    names = SUBSYSTEMS if subsystem == "*" else (subsystem,)
+    for name in names:
+        get_logger(name).setLevel(level)
+
+
+def set_buffer_size(maxlen: int) -> None:
+    """Keep at most `maxlen` recent events."""
+    _buffer.resize(maxlen)
+
+
+def events(
+    count: Optional[int] = None,
+    subsystem: Optional[str] = None,
+    level: Union[int, str] = logging.NOTSET,
+) -> list[dict]:
+    """
+    Return recent events, oldest first.
+
+    Parameters
+    ----------
+    count : int, optional
+        Only return this many of the latest matching events.
+    subsystem : str, optional
+        Only return the events of this subsystem.
+    level : int or str
+        Only return events at this level or above.
+
+    Returns
+    -------
+    list[dict]
+        Each event's time, subsystem, level name, message and fields.
+    """
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    found = [
+        i
+        for i in _buffer.events()
+        if (subsystem is None or i["subsystem"] == subsystem)
+        and logging.getLevelName(i["level"]) >= level
+    ]
+    return found[-count:] if count else found
+
+
+def clear_events() -> None:
+    """Forget all recorded events."""
+    _buffer.clear()
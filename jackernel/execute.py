@@ -0,0 +1,175 @@
+"""
+Compile and run one Jac cell, capturing what it prints.
+
+Shared by `jackernel.kernel.JacKernel` and `jackernel.session.JacSession`,
+without loading Jupyter, so that sessions run cells with jaclang alone.
+"""
+import contextlib
+import os.path as op
+import sys
+import threading
+import types
+from functools import partial
+from io import StringIO
+from typing import Callable, Optional
+
+from jackernel.autoreload import reload_modules
+from jackernel.cache import LRUCache
+from jackernel.compiled import TransformError
+from jackernel.profiling import CompileProfile
+from jackernel.sourcemap import jac_traceback
+from jackernel.stream import OutputStream
+from jackernel.symbols import SymbolIndex
+
+
+class CellError(Exception):
+    """A cell raised, carries what the error message of the reply needs."""
+
+    def __init__(
+        self, ename: str, evalue: str, traceback: list[str], output: str = ""
+    ) -> None:
+        """
+        Initialize error.
+
+        Parameters
+        ----------
+        ename : str
+            The exception type name.
+        evalue : str
+            The exception message.
+        traceback : list[str]
+            The formatted traceback lines.
+        output : str
+            What the cell printed before failing, when it was not streamed.
+        """
+        # All arguments go to `args`, for pickling and copying.
+        super().__init__(ename, evalue, traceback, output)
+        self.ename = ename
+        self.evalue = evalue
+        self.traceback = traceback
+        self.output = output
+
+    def __str__(self) -> str:
+        """Return the exception type name and message."""
+        return f"{self.ename}: {self.evalue}"
+
+
+# sys.stdout and sys.stderr are process wide, so cells capturing them run one
+# at a time, whichever kernel thread or session runs them. Reentrant for
+# cells that run cells, e.g. with a `JacSession`.
+_exec_lock = threading.RLock()
+
+
+def exec_jac(
+    code: str,
+    module: Optional[types.ModuleType] = None,
+    to_disk: bool = False,
+    cache: Optional[LRUCache] = None,
+    send_stream: Optional[Callable[[str, str], None]] = None,
+    caller_dir: Optional[str] = None,
+    profile: Optional[CompileProfile] = None,
+    symbols: Optional[SymbolIndex] = None,
+    cell_name: str = "",
+    transpiler: Optional[Callable] = None,
+    autoreload: bool = False,
+    gen_dir: str = "",
+) -> str:
+    """
+    Compile, jac code, and execute and return the output.
+
+    Cells run one at a time in the process, a call waits for the cell
+    running in another thread.
+
+    Parameters
+    ----------
+    code : str
+        The jac code to execute.
+    module : types.ModuleType, optional
+        The session module to run the cell in, a fresh one when not given.
+    to_disk : bool, optional
+        Write the generated python to `__jac_gen__` for debugging,
+        by default False
+    cache : LRUCache, optional
+        Transpilation cache used to skip recompiling unchanged cells.
+    send_stream : Callable[[str, str], None], optional
+        When given, stdout and stderr are streamed to it in batches while
+        the cell runs instead of being collected.
+    caller_dir : str, optional
+        Directory the cell is compiled relative to, by default the package
+        directory.
+    profile : CompileProfile, optional
+        Filled with the time spent in each compilation stage and in
+        executing the generated code.
+    symbols : SymbolIndex, optional
+        Updated with the names the cell defines once it compiled.
+    cell_name : str, optional
+        Where the cell came from, e.g. `In [3]`, recorded with its symbols
+        and shown in tracebacks.
+    transpiler : Callable, optional
+        Used instead of `transpile_jac_blue`, with the same signature.
+    autoreload : bool, optional
+        First reload the jac files imported earlier that changed on disk,
+        see `jackernel.autoreload`.
+    gen_dir : str, optional
+        Where `__jac_gen__` goes with `to_disk`, by default `caller_dir`.
+
+    Returns
+    -------
+    str
+        The output of the execution, empty when it was streamed.
+
+    Raises
+    ------
+    CellError
+        When the cell fails, with the traceback mapped to jac lines, or
+        with the compile errors and the cell lines around the first one.
+    """
+    # Deferred so that starting the kernel does not pay for loading jaclang.
+    from jackernel.importer import import_jac_module, jac_blue_import
+
+    jac_import = jac_blue_import
+    if transpiler is not None:
+        jac_import = partial(import_jac_module, transpiler)
+
+    current_dir = caller_dir if caller_dir else op.dirname(op.abspath(__file__))
+    if send_stream is None:
+        stdout_capture, stderr_capture = StringIO(), sys.stderr
+    else:
+        stdout_capture = OutputStream("stdout", send_stream)
+        stderr_capture = OutputStream("stderr", send_stream)
+    try:
+        with _exec_lock, contextlib.redirect_stdout(
+            stdout_capture
+        ), contextlib.redirect_stderr(stderr_capture):
+            if autoreload:
+                reload_modules(module, profile)
+            jac_import(
+                target=code,
+                caller_dir=current_dir,
+                to_disk=to_disk,
+                module=module,
+                cache=cache,
+                profile=profile,
+                symbols=symbols,
+                cell_name=cell_name,
+                gen_dir=gen_dir,
+            )
+    except TransformError as e:
+        raise CellError(
+            type(e).__name__,
+            str(e.errors[0]) if e.errors else str(e),
+            str(e).splitlines(),
+            stdout_capture.getvalue() if send_stream is None else "",
+        ) from e
+    except Exception as e:
+        raise CellError(
+            type(e).__name__,
+            str(e),
+            jac_traceback(e),
+            stdout_capture.getvalue() if send_stream is None else "",
+        ) from e
+    finally:
+        stderr_capture.flush()
+        stdout_capture.flush()
+
+    return stdout_capture.getvalue() if send_stream is None else ""
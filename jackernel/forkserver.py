@@ -0,0 +1,359 @@
+"""
+Fork server mode, kernels forked from a process that is already warm.
+
+A long lived server preloads ipykernel, jaclang, the transpiler and
+`JacKernel`, then listens on a Unix domain socket. The `Jac (fork server)`
+kernel spec runs this module as a small launcher: it hands the connection
+file, working directory, environment and its stdio to the server, which
+forks a child that starts the kernel right away. The launcher stays in
+place of the kernel for Jupyter, forwarding signals to the child and
+exiting with its exit code.
+
+The launcher starts a server when none is running and falls back to a
+regular `python -m jackernel.kernel` when it cannot reach one. The
+server exits after `--idle-timeout` seconds without kernels.
+
+    python -m jackernel.forkserver -f {connection_file}
+    python -m jackernel.forkserver serve
+"""
+import argparse
+import contextlib
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from typing import Optional
+
+from jackernel.ipc import connect, listen, runtime_path, same_user
+
+# Signals Jupyter sends the launcher that are meant for the kernel.
+FORWARDED_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGQUIT)
+
+
+def default_socket_path() -> str:
+    """
+    Return the socket of the server for this user and interpreter.
+
+    Set `JACKERNEL_FORK_SOCKET` to use another path. Each interpreter gets
+    its own server, so kernels never run in a different environment than
+    their kernel spec asked for. Raises `PermissionError` when the private
+    runtime directory is not safe to use.
+    """
+    return os.environ.get("JACKERNEL_FORK_SOCKET") or runtime_path("fork")
+
+
+def launch(
+    connection_file: str,
+    extra_argv: list[str],
+    socket_path: str,
+    timeout: float = 60,
+) -> int:
+    """
+    Have the server fork a kernel and wait for it like its parent would.
+
+    Parameters
+    ----------
+    connection_file : str
+        The kernel connection file written by Jupyter.
+    extra_argv : list[str]
+        More kernel command line arguments, e.g. traitlets config.
+    socket_path : str
+        Where the server listens, it is started when not running.
+    timeout : float
+        Seconds to wait for a server that is starting.
+
+    Returns
+    -------
+    int
+        The exit code of the kernel.
+    """
+    sock = connect(socket_path)
+    if sock is None:
+        subprocess.Popen(
+            [sys.executable, "-m", "jackernel.forkserver", "serve"],
+            env={**os.environ, "JACKERNEL_FORK_SOCKET": socket_path},
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + timeout
+        while sock is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+            sock = connect(socket_path)
+    if sock is None:
+        _exec_kernel(connection_file, extra_argv)
+    request = {
+        "connection_file": os.path.abspath(connection_file),
+        "argv": extra_argv,
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+    }
+    # The server may still be preloading, it answers once it is warm.
+    sock.settimeout(timeout)
+    try:
+        socket.send_fds(sock, [json.dumps(request).encode() + b"\n"], [0, 1, 2])
+        replies = sock.makefile("r")
+        reply = json.loads(replies.readline() or "{}")
+    except (OSError, ValueError):
+        reply = {}
+    if "pid" not in reply:
+        sock.close()
+        _exec_kernel(connection_file, extra_argv)
+    pid = reply["pid"]
+
+    def forward(signum: int, frame: object) -> None:
+        with contextlib.suppress(ProcessLookupError):
+            os.kill(pid, signum)
+
+    for signum in FORWARDED_SIGNALS:
+        signal.signal(signum, forward)
+    sock.settimeout(None)
+    # Blocks until the kernel exits, the server then reports its exit code.
+    for line in replies:
+        message = json.loads(line)
+        if "exit" in message:
+            return message["exit"]
+    return 1
+
+
+def _exec_kernel(connection_file: str, extra_argv: list[str]) -> None:
+    """Replace the launcher with a regular kernel."""
+    argv = [sys.executable, "-m", "jackernel.kernel", "-f", connection_file]
+    os.execv(sys.executable, argv + extra_argv)
+
+
+class ForkServer:
+    """Accept kernel requests and fork a warm child for each of them."""
+
+    def __init__(self, socket_path: str, idle_timeout: float = 3600) -> None:
+        """
+        Initialize server.
+
+        Parameters
+        ----------
+        socket_path : str
+            Where to listen.
+        idle_timeout : float
+            Exit after this many seconds without kernels, 0 never exits.
+        """
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        # Kernel pid -> the connection of the launcher waiting for it.
+        self.children: dict[int, socket.socket] = {}
+        self.listener: Optional[socket.socket] = None
+
+    def bind(self) -> bool:
+        """Listen on the socket, False when another server already does."""
+        # Launchers queue up in the backlog while the server preloads.
+        self.listener = listen(self.socket_path)
+        return self.listener is not None
+
+    def preload(self) -> None:
+        """Import and warm up everything a kernel needs before it starts."""
+        import shutil
+
+        import ipykernel.kernelapp  # noqa: F401
+
+        import jackernel.importer  # noqa: F401
+        import jackernel.kernel  # noqa: F401
+        from jackernel.transpiler import warm_up
+
+        scratch = tempfile.mkdtemp(prefix="jackernel-fork-")
+        try:
+            warm_up(scratch)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def serve(self) -> None:
+        """Fork kernels until idle for `idle_timeout` seconds."""
+        import selectors
+
+        wakeup_r, wakeup_w = socket.socketpair()
+        wakeup_r.setblocking(False)
+        wakeup_w.setblocking(False)
+        # Exited kernels wake the loop up so launchers learn right away.
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        signal.set_wakeup_fd(wakeup_w.fileno())
+        selector = selectors.DefaultSelector()
+        selector.register(self.listener, selectors.EVENT_READ)
+        selector.register(wakeup_r, selectors.EVENT_READ)
+        idle_since = time.monotonic()
+        try:
+            while True:
+                for key, _ in selector.select(timeout=1):
+                    if key.fileobj is self.listener:
+                        conn, _ = self.listener.accept()
+                        # Requests carry an environment and stdio to run as.
+                        if not same_user(conn):
+                            conn.close()
+                            continue
+                        pid = self._fork(conn, [selector, wakeup_r, wakeup_w])
+                        if pid is not None:
+                            self.children[pid] = conn
+                            selector.register(conn, selectors.EVENT_READ, pid)
+                    elif key.fileobj is wakeup_r:
+                        _drain(wakeup_r)
+                    elif not key.fileobj.recv(1):
+                        # The launcher is gone, so is the kernel for Jupyter.
+                        selector.unregister(key.fileobj)
+                        _kill(key.data)
+                self._reap(selector)
+                if self.children:
+                    idle_since = time.monotonic()
+                elif self.idle_timeout and (
+                    time.monotonic() - idle_since > self.idle_timeout
+                ):
+                    return
+        finally:
+            signal.set_wakeup_fd(-1)
+            # Launchers lose the server, their kernels must not outlive it.
+            for pid in self.children:
+                _kill(pid, signal.SIGTERM)
+            self.listener.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _reap(self, selector: object) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            conn = self.children.pop(pid, None)
+            if conn is None:
+                continue
+            if conn in selector.get_map():
+                selector.unregister(conn)
+            code = os.waitstatus_to_exitcode(status)
+            with contextlib.suppress(OSError):
+                conn.sendall(json.dumps({"exit": code}).encode() + b"\n")
+            conn.close()
+
+    def _fork(self, conn: socket.socket, inherited: list) -> Optional[int]:
+        """Read one request and fork its kernel, return the kernel pid."""
+        conn.settimeout(10)
+        try:
+            data, fds, _, _ = socket.recv_fds(conn, 1 << 16, 3)
+            while not data.endswith(b"\n"):
+                chunk = conn.recv(1 << 16)
+                if not chunk:
+                    raise ValueError("Incomplete request")
+                data += chunk
+            request = json.loads(data)
+        except (OSError, ValueError):
+            conn.close()
+            return None
+        conn.settimeout(None)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                for i in inherited + [conn, self.listener]:
+                    i.close()
+                for i in self.children.values():
+                    i.close()
+                code = _run_kernel(request, fds)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                # Never return into the server loop from a kernel.
+                os._exit(code)
+        for fd in fds:
+            os.close(fd)
+        conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+        return pid
+
+
+def _drain(sock: socket.socket) -> None:
+    """Read whatever is pending on a non blocking socket."""
+    with contextlib.suppress(BlockingIOError):
+        while sock.recv(4096):
+            pass
+
+
+def _kill(pid: int, signum: int = signal.SIGKILL) -> None:
+    with contextlib.suppress(ProcessLookupError):
+        os.kill(pid, signum)
+
+
+def _run_kernel(request: dict, fds: list[int]) -> int:
+    """Turn a freshly forked child into the kernel of `request`."""
+    os.setsid()
+    signal.set_wakeup_fd(-1)
+    for signum in FORWARDED_SIGNALS + (signal.SIGCHLD,):
+        signal.signal(signum, signal.SIG_DFL)
+    # ipykernel interrupts cells with SIGINT.
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    os.chdir(request["cwd"])
+    # `python -m` puts the working directory first, the server's is the
+    # one of the launcher that started it.
+    sys.path[0] = request["cwd"]
+    os.environ.clear()
+    os.environ.update(request["env"])
+
+    from ipykernel.kernelapp import IPKernelApp
+
+    from jackernel.kernel import JacKernel
+
+    argv = ["-f", request["connection_file"]] + request["argv"]
+    sys.argv = [sys.argv[0]] + argv
+    try:
+        IPKernelApp.launch_instance(argv=argv, kernel_class=JacKernel)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return 0
+
+
+def main(argv: list = None) -> int:
+    """Entry point, launches a kernel or, with `serve`, runs the server."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("command", nargs="?", choices=("launch", "serve"))
+    parser.add_argument("-f", "--connection-file", help="Kernel connection file")
+    parser.add_argument("--socket", default=None, help="Server socket path")
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=3600,
+        help="Seconds without kernels before the server exits, 0 never",
+    )
+    args, extra = parser.parse_known_args(argv)
+    try:
+        socket_path = args.socket or default_socket_path()
+    except PermissionError as e:
+        if args.command == "serve":
+            print(e, file=sys.stderr)
+            return 1
+        socket_path = None
+    if args.command == "serve":
+        server = ForkServer(socket_path, args.idle_timeout)
+        if not server.bind():
+            return 0
+        server.preload()
+        server.serve()
+        return 0
+    if not args.connection_file:
+        parser.error("the connection file (-f) is required to launch a kernel")
+    if socket_path is None:
+        _exec_kernel(args.connection_file, extra)
+    return launch(args.connection_file, extra, socket_path)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
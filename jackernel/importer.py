@@ -1,14 +1,51 @@
 """Special Imports for Jac Code."""
+import logging
 import marshal
-import traceback
+import multiprocessing
+import os
+import sys
 import types
-from os import path
-from typing import Callable, Optional
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Iterable, Optional
 
-from jackernel.transpiler import transpile_jac_blue
+from jackernel.autoreload import is_tracked, track_module
+from jackernel.cache import (
+    DiskCache,
+    LRUCache,
+    compile_jobs,
+    configure_module_cache,
+    module_cache,
+    source_key,
+)
+from jackernel.compiled import TransformError
+from jackernel.diagnostics import get_logger
+from jackernel.profiling import CompileProfile, timed
+from jackernel.scanner import jac_imports
+from jackernel.sourcemap import SourceMap, register
+from jackernel.symbols import SymbolIndex
 
-from jaclang.jac.constant import Constants as Con
-from jaclang.utils.helpers import handle_jac_error
+_log = get_logger("importer")
+
+# Part of the module cache keys, bump when the python generated for jac
+# files changes.
+MODULE_FORMAT = "2"
+# Less missing jac source than this, in characters, compiles faster in
+# process, a process pool takes about 3 s to load the compiler and one
+# core compiles about 12k characters a second.
+PARALLEL_COMPILE_MIN_SOURCE = 64 << 10
+# What the compiler is told a cell is called.
+CELL_PATH = "<cell>"
+
+
+def cell_path(caller_dir: str) -> str:
+    """
+    Return the module path of a cell compiled relative to `caller_dir`.
+
+    Cells get a path inside `caller_dir`, as if they were a file there, so
+    that their imports resolve against its directory both when compiling
+    and when running, like the imports of a jac file.
+    """
+    return os.path.join(caller_dir, CELL_PATH)
 
 
 def import_jac_module(
@@ -17,30 +54,78 @@ def import_jac_module(
     caller_dir: Optional[str] = None,
     cachable: bool = True,
     override_name: Optional[str] = None,
+    to_disk: bool = False,
+    module: Optional[types.ModuleType] = None,
+    cache: Optional[LRUCache] = None,
+    profile: Optional[CompileProfile] = None,
+    symbols: Optional[SymbolIndex] = None,
+    cell_name: str = "",
+    gen_dir: str = "",
 ) -> Optional[types.ModuleType]:
-    """Core Import Process."""
-    gen_dir = path.join(caller_dir, Con.JAC_GEN_DIR)
-    py_file_path = path.join(gen_dir, "session.py")
-    pyc_file_path = path.join(gen_dir, "session.pyc")
+    """Core Import Process.
 
-    print("hi")
-    if transpiler_func(cell=target, caller_dir=caller_dir):
-        return None
-    with open(py_file_path, "r") as f:
-        code_string = f.read()
-    with open(pyc_file_path, "rb") as f:
-        codeobj = marshal.load(f)
-
-    module = types.ModuleType("session")
-    module.__file__ = caller_dir
-    module.__name__ = override_name if override_name else "session"
+    The cell is executed exactly once, into `module` when given so that
+    definitions persist across cells, otherwise into a fresh module.
+    `cell_name` tells where the cell came from, e.g. `In [3]`, and is
+    what tracebacks through the cell show (see `jackernel.sourcemap`).
+    A cell that does not compile raises `TransformError`, listing its
+    alerts and the cell lines around the first one. Uncached jac files the
+    cell imports are compiled before the cell, see `precompile_jac_files`.
+    With `to_disk`, the generated python is written to `__jac_gen__` in
+    `gen_dir`, by default in `caller_dir`.
+    """
+    # Files imported by earlier cells are not imported again.
+    missing = [
+        i for i in jac_file_imports(cell_path(caller_dir), target) if not is_tracked(i)
+    ]
+    if missing:
+        with timed(profile, "precompile"):
+            precompile_jac_files(missing)
+    result = transpiler_func(
+        cell=target,
+        caller_dir=caller_dir,
+        to_disk=to_disk,
+        cache=cache,
+        profile=profile,
+        gen_dir=gen_dir,
+    )
+    if result.errors:
+        _log.info(
+            "%s failed to compile",
+            cell_name or "Cell",
+            extra={"data": {"cell": cell_name, "errors": len(result.errors)}},
+        )
+        raise TransformError(
+            f"{cell_name or 'Cell'} failed to compile.",
+            result.errors,
+            result.warnings,
+        )
+    if symbols is not None:
+        symbols.update(result.symbols, origin=cell_name)
+    code_string = result.py_code
+
+    if module is None:
+        module = types.ModuleType("session")
+        module.__name__ = override_name if override_name else "session"
+    module.__file__ = cell_path(caller_dir)
     module.__dict__["_jac_pycodestring_"] = code_string
-    try:
-        exec(codeobj, module.__dict__)
-    except Exception as e:
-        tb = traceback.extract_tb(e.__traceback__)
-        err = handle_jac_error(code_string, e, tb)
-        raise type(e)(str(e) + "\n" + err)
+    for unit in result.units or [result]:
+        if unit.source_map is not None:
+            register(
+                unit.codeobj.co_filename,
+                unit.source_map,
+                target,
+                cell_name or "<cell>",
+                unit.line_offset,
+            )
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug(
+                "Running %s",
+                unit.codeobj.co_filename,
+                extra={"data": {"cell": cell_name, "line_offset": unit.line_offset}},
+            )
+        with timed(profile, "exec"):
+            exec(unit.codeobj, module.__dict__)
 
     return module
 
@@ -50,13 +135,379 @@ def jac_blue_import(
     caller_dir: Optional[str] = None,
     cachable: bool = True,
     override_name: Optional[str] = None,
+    to_disk: bool = False,
+    module: Optional[types.ModuleType] = None,
+    cache: Optional[LRUCache] = None,
+    profile: Optional[CompileProfile] = None,
+    symbols: Optional[SymbolIndex] = None,
+    cell_name: str = "",
+    gen_dir: str = "",
 ) -> Optional[types.ModuleType]:
     """Jac Blue Imports."""
+    # Only loaded here, cells compiled elsewhere never need jaclang.
+    from jackernel.transpiler import transpile_jac_blue
+
     return import_jac_module(
-        transpile_jac_blue, target, caller_dir, cachable, override_name
+        transpile_jac_blue,
+        target,
+        caller_dir,
+        cachable,
+        override_name,
+        to_disk,
+        module,
+        cache,
+        profile,
+        symbols,
+        cell_name,
+        gen_dir,
+    )
+
+
+def jac_file_import(
+    target: str,
+    base_path: Optional[str] = None,
+    cachable: bool = True,
+    override_name: Optional[str] = None,
+) -> Optional[types.ModuleType]:
+    """Import a jac file, for the `import:jac` statements of cells.
+
+    Resolves `target` relative to the directory of `base_path`, the
+    `__file__` of the importing jac file or cell (see `cell_path`), or to
+    the working directory without one. Registers the module in
+    `sys.modules` as `jaclang.jac_blue_import` does. Instead of writing
+    `__jac_gen__` next to the file, the compiled file is looked up in the
+    module cache shared by all kernels, and only compiled on a miss.
+    `cachable=False` compiles the file again regardless. Imported files are
+    tracked for `jackernel.autoreload`.
+    """
+    dir_path, file_name = os.path.split(os.path.join(*target.split(".")) + ".jac")
+    module_name = os.path.splitext(file_name)[0]
+    package_path = dir_path.replace(os.sep, ".")
+    full_name = f"{package_path}.{module_name}" if package_path else module_name
+    if full_name in sys.modules:
+        return sys.modules[full_name]
+
+    caller_dir = os.path.dirname(base_path) if base_path else os.getcwd()
+    path = os.path.normpath(os.path.join(caller_dir, dir_path, file_name))
+    with open(path) as f:
+        source = f.read()
+    cache = module_cache()
+    if cachable and cache is not None and _module_key(path, source) not in cache:
+        precompile_jac_files([path])
+
+    module = types.ModuleType(module_name)
+    module.__file__ = path
+    module.__name__ = override_name if override_name else module_name
+    run_jac_file(module, path, source, cachable)
+
+    if package_path:
+        parts = package_path.split(".")
+        for i in range(len(parts)):
+            package_name = ".".join(parts[: i + 1])
+            if package_name not in sys.modules:
+                sys.modules[package_name] = types.ModuleType(package_name)
+        setattr(sys.modules[package_path], module_name, module)
+    sys.modules[full_name] = module
+    track_module(path, module, source, jac_file_imports(path, source))
+    return module
+
+
+def run_jac_file(
+    module: types.ModuleType, path: str, source: str, cachable: bool = True
+) -> None:
+    """
+    Compile a jac file and execute it in `module`.
+
+    Parameters
+    ----------
+    module : types.ModuleType
+        The module of the file, a reloaded file keeps its module.
+    path : str
+        The absolute path of the file.
+    source : str
+        The content of the file.
+    cachable : bool
+        Read the module cache, otherwise the file is compiled regardless.
+    """
+    code_string, codeobj = compile_jac_file(path, source, cachable)
+    module.__dict__["_jac_pycodestring_"] = code_string
+    register(
+        codeobj.co_filename,
+        SourceMap.from_generated(code_string),
+        source,
+        f'File "{path}"',
+        0,
+    )
+    exec(codeobj, module.__dict__)
+
+
+def compile_jac_file(
+    path: str, source: str, cachable: bool = True
+) -> tuple[str, types.CodeType]:
+    """
+    Return the generated python and code object of a jac file.
+
+    Entries of the module cache are keyed by the path and source of the
+    file, the jaclang version and the python bytecode version. A kernel
+    compiling a file holds the lock of its entry, so concurrent kernels
+    importing it wait and then read the entry instead of compiling too.
+
+    Parameters
+    ----------
+    path : str
+        The absolute path of the file.
+    source : str
+        The content of the file.
+    cachable : bool
+        Read the module cache, otherwise the file is compiled regardless.
+
+    Returns
+    -------
+    tuple[str, types.CodeType]
+        The generated python and its code object.
+
+    Raises
+    ------
+    TransformError
+        When the file does not compile.
+    """
+    cache = module_cache()
+    if cache is None:
+        return _compile_jac_file(path, source)
+    key = _module_key(path, source)
+    if cachable:
+        entry = _read_entry(cache, key)
+        if entry is not None:
+            _log.debug("Module cache hit: %s", path, extra={"data": {"key": key}})
+            return entry
+    with cache.lock(key):
+        entry = _read_entry(cache, key) if cachable else None
+        if entry is None:
+            entry = _compile_jac_file(path, source)
+            cache.put(key, marshal.dumps(entry))
+    return entry
+
+
+def _module_key(path: str, source: str) -> str:
+    return source_key(
+        source, (), "module", MODULE_FORMAT, sys.implementation.cache_tag, path
+    )
+
+
+def _read_entry(cache: DiskCache, key: str) -> Optional[tuple[str, types.CodeType]]:
+    data = cache.get(key)
+    if data is None:
+        return None
+    try:
+        code_string, codeobj = marshal.loads(data)
+    except (EOFError, ValueError, TypeError):
+        return None
+    return code_string, codeobj
+
+
+def _compile_jac_file(path: str, source: str) -> tuple[str, types.CodeType]:
+    from jackernel.transpiler import transpile_jac_module
+
+    _log.info("Compiling %s", path, extra={"data": {"path": path}})
+    result = transpile_jac_module(source, path)
+    if result.errors:
+        raise TransformError(
+            f"{path} failed to compile.", result.errors, result.warnings
+        )
+    return result.py_code, result.codeobj
+
+
+def import_graph(
+    paths: Iterable[str], cache: Optional[DiskCache] = None
+) -> dict[str, tuple[str, list[str]]]:
+    """
+    Find the jac files some jac files import, directly or not.
+
+    Parameters
+    ----------
+    paths : Iterable[str]
+        The absolute paths of the files.
+    cache : DiskCache, optional
+        A module cache, the files it holds unchanged are left out and their
+        imports are not followed.
+
+    Returns
+    -------
+    dict[str, tuple[str, list[str]]]
+        The source of each of `paths` and of every file they pull in, with
+        the paths of the files each one imports, by path. Files that cannot
+        be read are left out, importing them reports the error.
+    """
+    graph: dict[str, tuple[str, list[str]]] = {}
+    pending = list(paths)
+    seen = set(pending)
+    while pending:
+        path = pending.pop()
+        try:
+            with open(path) as f:
+                source = f.read()
+        except OSError:
+            continue
+        if cache is not None and _module_key(path, source) in cache:
+            continue
+        deps = jac_file_imports(path, source)
+        graph[path] = (source, deps)
+        for dep in deps:
+            if dep not in seen:
+                seen.add(dep)
+                pending.append(dep)
+    return graph
+
+
+def jac_file_imports(path: str, source: str) -> list[str]:
+    """Return the paths of the jac files the jac file at `path` imports."""
+    return [jac_import_path(i, path) for i in jac_imports(source)]
+
+
+def jac_import_path(target: str, base_path: str) -> str:
+    """
+    Return the path of the jac file `target` refers to in `base_path`.
+
+    Parameters
+    ----------
+    target : str
+        The dotted module path of an `import:jac` statement.
+    base_path : str
+        The path of the importing jac file, or the `cell_path` of a cell.
+    """
+    base_dir = os.path.dirname(base_path)
+    return os.path.normpath(os.path.join(base_dir, *target.split("."))) + ".jac"
+
+
+def is_compiled(path: str) -> bool:
+    """
+    Return whether the module cache holds the jac file at `path` as it is now.
+
+    Importing such a file only reads its cache entry, so compiling it again
+    would only tell what is known already: that it compiles.
+    """
+    cache = module_cache()
+    if cache is None:
+        return False
+    try:
+        with open(path) as f:
+            source = f.read()
+    except OSError:
+        return False
+    return _module_key(path, source) in cache
+
+
+def dependency_order(graph: dict[str, tuple[str, list[str]]]) -> list[str]:
+    """Return the paths of an `import_graph`, every file after its imports."""
+    order: list[str] = []
+    visited: set[str] = set()
+
+    def visit(path: str) -> None:
+        visited.add(path)
+        for dep in graph[path][1]:
+            if dep in graph and dep not in visited:
+                visit(dep)
+        order.append(path)
+
+    for path in graph:
+        if path not in visited:
+            visit(path)
+    return order
+
+
+def precompile_jac_files(paths: Iterable[str], jobs: Optional[int] = None) -> int:
+    """
+    Compile the uncached jac files about to be imported, and their imports.
+
+    Each file is compiled after the files it imports, and before the code
+    importing it, so that compiling skips the files it imports (see
+    `jackernel.pyoutpass.CellImportPass`) and importing only reads the
+    module cache. Only uncached files are read and followed.
+
+    With more than one process and at least `PARALLEL_COMPILE_MIN_SOURCE`
+    characters to compile, the files are compiled on a process pool, each
+    one as soon as the files it imports are done. Otherwise they are
+    compiled in process, one after the other. Files that fail to compile
+    are left out, importing them reports the error.
+
+    Parameters
+    ----------
+    paths : Iterable[str]
+        The absolute paths of the files about to be imported.
+    jobs : int, optional
+        Number of processes, by default the `set_compile_jobs` setting.
+
+    Returns
+    -------
+    int
+        The number of files compiled.
+    """
+    cache = module_cache()
+    if cache is None:
+        return 0
+    graph = import_graph(paths, cache)
+    if not graph:
+        return 0
+    missing = dependency_order(graph)
+    jobs = jobs if jobs is not None else compile_jobs()
+    jobs = min(jobs or os.cpu_count() or 1, len(missing))
+    if jobs < 2 or (
+        sum(len(source) for source, _ in graph.values()) < PARALLEL_COMPILE_MIN_SOURCE
+    ):
+        return sum(_compile_missing(i, graph[i][0]) for i in missing)
+    _log.info(
+        "Compiling %d jac files on %d processes",
+        len(missing),
+        jobs,
+        extra={"data": {"files": missing}},
     )
+    context = multiprocessing.get_context("forkserver")
+    # Workers are forked from a server process that loaded the compiler
+    # once, never from the kernel with its threads, sockets and redirected
+    # output.
+    context.set_forkserver_preload(["jackernel.transpiler"])
+    # The files each file is still waiting for.
+    waiting = {i: {dep for dep in graph[i][1] if dep in graph} for i in missing}
+    compiled = 0
+    try:
+        with ProcessPoolExecutor(jobs, mp_context=context) as pool:
+            running: dict[Future, str] = {}
+            while waiting or running:
+                ready = [i for i in missing if i in waiting and not waiting[i]]
+                if not ready and not running:
+                    # Import cycles, their files compile each other.
+                    ready = [i for i in missing if i in waiting]
+                for path in ready:
+                    del waiting[path]
+                    future = pool.submit(
+                        _compile_worker,
+                        cache.directory,
+                        cache.max_size,
+                        path,
+                        graph[path][0],
+                    )
+                    running[future] = path
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = running.pop(future)
+                    compiled += future.result()
+                    for deps in waiting.values():
+                        deps.discard(path)
+    except Exception:
+        # The imports compile whatever is still missing in process.
+        _log.warning("Parallel compilation failed", exc_info=True)
+    return compiled
+
+
+def _compile_missing(path: str, source: str) -> bool:
+    try:
+        compile_jac_file(path, source)
+    except Exception:
+        # Raised again by the import, with the alerts of the file.
+        return False
+    return True
 
 
-# jac_blue_import("sample")
-# current_dir = path.dirname(path.abspath(__file__))
-# jac_blue_import(read_file("sample.jac"), current_dir)
+def _compile_worker(directory: str, max_size: int, path: str, source: str) -> bool:
+    configure_module_cache(directory, max_size)
+    return _compile_missing(path, source)
@@ -26,8 +26,17 @@ kernel_json = {
     },
 }
 
+# Same kernel, forked from a warm server instead of started from scratch.
+fork_kernel_json = {
+    **kernel_json,
+    "argv": ["python", "-m", "jackernel.forkserver", "-f", "{connection_file}"],
+    "display_name": "Jac (fork server)",
+}
+
 
-def install_my_kernel_spec(user: bool = True, prefix: str = None) -> None:
+def install_my_kernel_spec(
+    user: bool = True, prefix: str = None, fork_server: bool = False
+) -> None:
     """
     Install the Jac kernel spec.
 
@@ -37,6 +46,8 @@ def install_my_kernel_spec(user: bool = True, prefix: str = None) -> None:
     Whether to do a user install
     prefix : str
     Specify prefix to install to, e.g. an env
+    fork_server : bool
+    Also install the `Jac-fork` spec, see `jackernel.forkserver`
 
     Returns
     -------
@@ -48,6 +59,15 @@ def install_my_kernel_spec(user: bool = True, prefix: str = None) -> None:
             json.dump(kernel_json, f, sort_keys=True)
         # shutil.copyfile(_ICON_PATH, pathlib.Path(td) / _ICON_PATH.name)
         KernelSpecManager().install_kernel_spec(td, "Jac", user=user, prefix=prefix)
+    if not fork_server:
+        return
+    with TemporaryDirectory() as td:
+        os.chmod(td, 0o755)
+        with open(os.path.join(td, "kernel.json"), "w") as f:
+            json.dump(fork_kernel_json, f, sort_keys=True)
+        KernelSpecManager().install_kernel_spec(
+            td, "Jac-fork", user=user, prefix=prefix
+        )
 
 
 def _is_root() -> bool:
@@ -92,6 +112,13 @@ def main(argv: list = None) -> None:
         "--prefix", help="Install KernelSpec in this prefix", default=None
     )
 
+    parser.add_argument(
+        "--fork-server",
+        help="Also install the Jac (fork server) kernel spec",
+        action="store_true",
+        dest="fork_server",
+    )
+
     args = parser.parse_args(argv)
 
     user = False
@@ -103,7 +130,7 @@ def main(argv: list = None) -> None:
     elif args.user or not _is_root():
         user = True
 
-    install_my_kernel_spec(user=user, prefix=prefix)
+    install_my_kernel_spec(user=user, prefix=prefix, fork_server=args.fork_server)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+"""
+Unix domain socket helpers shared by the fork and compile servers.
+
+Servers and their clients only talk to processes of the same user. The
+default sockets live in a directory only that user can access, and both
+ends check the user of their peer, so another local user can neither
+plant a server nor connect to one.
+"""
+import contextlib
+import hashlib
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+from typing import Optional
+
+_FRAME_HEADER = struct.Struct("!I")
+# pid, uid and gid of the peer, see SO_PEERCRED.
+_PEER_CREDENTIALS = struct.Struct("3i")
+
+
+def runtime_dir() -> str:
+    """
+    Return the directory for the sockets of this user, creating it.
+
+    It is `jackernel-<uid>` in `XDG_RUNTIME_DIR`, or in the temporary
+    directory when that is not set.
+
+    Raises
+    ------
+    PermissionError
+        When the directory exists but is not a directory owned by and
+        only accessible to the current user, e.g. created by another user
+        in a shared temporary directory.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if not base or not os.access(base, os.W_OK):
+        base = tempfile.gettempdir()
+    path = os.path.join(base, f"jackernel-{os.getuid()}")
+    with contextlib.suppress(FileExistsError):
+        os.mkdir(path, 0o700)
+    info = os.lstat(path)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise PermissionError(f"{path} is not a directory private to this user")
+    return path
+
+
+def runtime_path(name: str) -> str:
+    """
+    Return where a server of this user and interpreter puts its socket.
+
+    Each interpreter gets its own servers, so a kernel never talks to a
+    server running another python or another copy of jackernel.
+
+    Parameters
+    ----------
+    name : str
+        What the socket is for, e.g. `fork`.
+
+    Returns
+    -------
+    str
+        A path in `runtime_dir()`.
+
+    Raises
+    ------
+    PermissionError
+        When the runtime directory is not private, see `runtime_dir`.
+    """
+    digest = hashlib.sha1(
+        (sys.executable + os.path.dirname(os.path.abspath(__file__))).encode()
+    ).hexdigest()[:10]
+    return os.path.join(runtime_dir(), f"{name}-{digest}.sock")
+
+
+def peer_uid(sock: socket.socket) -> Optional[int]:
+    """Return the user of the process at the other end, None if unknown."""
+    if hasattr(socket, "SO_PEERCRED"):
+        credentials = sock.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, _PEER_CREDENTIALS.size
+        )
+        return _PEER_CREDENTIALS.unpack(credentials)[1]
+    return None
+
+
+def same_user(sock: socket.socket) -> bool:
+    """
+    Return whether the peer runs as the current user.
+
+    Where the peer cannot be identified, only the current user can connect
+    anyway, `listen` makes sockets accessible to it alone.
+    """
+    uid = peer_uid(sock)
+    return uid is None or uid == os.getuid()
+
+
+def connect(path: str, timeout: Optional[float] = None) -> Optional[socket.socket]:
+    """
+    Connect to the server at `path`.
+
+    Returns None when nobody listens there, or when the socket or the
+    server belong to another user.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        if os.lstat(path).st_uid != os.getuid():
+            raise PermissionError(f"{path} belongs to another user")
+        sock.connect(path)
+        if not same_user(sock):
+            raise PermissionError(f"The server at {path} runs as another user")
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def listen(path: str, backlog: int = 128) -> Optional[socket.socket]:
+    """
+    Listen at `path`, replacing a stale socket left by a dead server.
+
+    Parameters
+    ----------
+    path : str
+        The socket path, only accessible to the current user.
+    backlog : int
+        Connections queued while the server is busy, e.g. still preloading.
+
+    Returns
+    -------
+    socket.socket, optional
+        The listening socket, None when another server already listens.
+    """
+    if os.path.exists(path):
+        other = connect(path)
+        if other is not None:
+            other.close()
+            return None
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        sock.bind(path)
+    except OSError:
+        # Another server won the race.
+        sock.close()
+        return None
+    finally:
+        os.umask(umask)
+    sock.listen(backlog)
+    return sock
+
+
+def send_frame(sock: socket.socket, payload: bytes) -> None:
+    """Send `payload` prefixed with its length."""
+    sock.sendall(_FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock: socket.socket) -> Optional[bytes]:
+    """Receive one frame sent by `send_frame`, None when the peer closed."""
+    header = _recv_exactly(sock, _FRAME_HEADER.size)
+    if header is None:
+        return None
+    payload = _recv_exactly(sock, _FRAME_HEADER.unpack(header)[0])
+    if payload is None:
+        raise ConnectionError("Connection closed in the middle of a frame")
+    return payload
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
@@ -7,60 +7,77 @@ in Jupyter notebooks and captures and displays the output.
 Version: 1.0.0
 """
 
-import contextlib
+import asyncio
+import atexit
+import ctypes
+import os
 import os.path as op
-from io import StringIO
+import re
+import shutil
+import signal
+import tempfile
+import threading
+import tracemalloc
+import types
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
 
 from ipykernel.kernelapp import IPKernelApp
 from ipykernel.kernelbase import Kernel
 
-from jackernel.importer import jac_blue_import as jac_import
-from jackernel.syntax_hilighter import JacLexer
+from jackernel.cache import (
+    DEFAULT_MODULE_CACHE_SIZE,
+    LRUCache,
+    configure_module_cache,
+    set_compile_jobs,
+)
+from jackernel.compileserver import CompileClient
+from jackernel.diagnostics import get_logger, set_buffer_size, set_level
+from jackernel.execute import CellError, exec_jac
+from jackernel.profiling import CompileProfile, record
+from jackernel.scanner import cell_status
+from jackernel.symbols import SymbolIndex, describe_symbol
 
-jac_lexer = JacLexer()
+from traitlets import Bool, Dict, Integer, Unicode, observe
 
+_log = get_logger("kernel")
 
-def exec_jac(code: str) -> str:
-    """
-    Compile, jac code, and execute and return the output.
-
-    Parameters
-    ----------
-    code : str
-        The jac code to execute.
+# The (dotted) name being typed at the cursor, e.g. `Shape.ar` or `pri`.
+_COMPLETION_TARGET = re.compile(r"(?:(?P<owner>[A-Za-z_]\w*)\.)?(?P<prefix>\w*)$")
+# The name under the cursor, also right after its opening parenthesis.
+_INSPECT_TARGET = re.compile(
+    r"(?:(?P<owner>[A-Za-z_]\w*)\.)?(?P<name>[A-Za-z_]\w*)\(?$"
+)
+_WORD = re.compile(r"\w*")
 
-    Returns
-    -------
-    str
-        The output of the execution.
-    """
-    current_dir = op.dirname(op.abspath(__file__))
-    try:
-        jac_import(target=code, caller_dir=current_dir)
 
-    except Exception as e:
-        captured_output = "Exception: " + str(e)
-        return captured_output
+class CellInterruptError(Exception):
+    """Raised when a running cell was cancelled by a kernel interrupt."""
 
-    script_file_path = op.join(current_dir, "__jac_gen__/session.py")
-    try:
-        with open(script_file_path, "r") as script_file:
-            script_code = script_file.read()
-            stdout_capture = StringIO()  # You need to import StringIO from io module
+    pass
 
-            with contextlib.redirect_stdout(stdout_capture):
-                exec(script_code)
 
-            captured_output = stdout_capture.getvalue()
-    except Exception as e:
-        captured_output = "Exception: " + str(e)
-        return captured_output
-
-    return captured_output
+def scratch_root() -> str:
+    """Pick where kernel scratch directories go, preferring tmpfs."""
+    for candidate in (os.environ.get("XDG_RUNTIME_DIR"), "/dev/shm"):
+        if candidate and op.isdir(candidate) and os.access(candidate, os.W_OK):
+            return candidate
+    return tempfile.gettempdir()
 
 
 class JacKernel(Kernel):
-    """Jac wrapper kernel."""
+    """
+    Jac wrapper kernel.
+
+    Cells run on a worker thread, so the message loop keeps answering
+    completion and inspection requests while a cell runs. An interrupt
+    raises KeyboardInterrupt in the cell at its next python instruction.
+    A cell blocked in a single call into C, e.g. `time.sleep` or a socket
+    read, only sees it once that call returns: python only runs signal
+    handlers on the main thread, and calls interrupted by a signal on
+    another thread are restarted (PEP 475).
+    """
 
     implementation = "jac"
     implementation_version = "0.0"
@@ -75,7 +92,225 @@ class JacKernel(Kernel):
 
     banner = "Jac kernel for Jupyter (main), version 1.0.0a4\n\n"
 
-    def do_execute(
+    write_jac_gen = Bool(
+        False,
+        help="Also write each cell's generated python to __jac_gen__ in the "
+        "kernel's scratch directory (debugging), see gen_dir_root.",
+    ).tag(config=True)
+
+    transpile_cache_size = Integer(
+        128,
+        help="Number of transpiled cells kept in the LRU cache, 0 disables it.",
+    ).tag(config=True)
+
+    warm_up = Bool(
+        True,
+        help="Warm up the jac compiler in the background right after start.",
+    ).tag(config=True)
+
+    profile_allocations = Bool(
+        False,
+        help="Also record memory allocated by each compilation stage "
+        "(starts tracemalloc, which slows cells down).",
+    ).tag(config=True)
+
+    log_levels = Dict(
+        {},
+        help="Log level per subsystem (transform, importer, kernel), "
+        "e.g. {'transform': 'DEBUG'}, see jackernel.diagnostics.",
+    ).tag(config=True)
+
+    log_buffer_size = Integer(
+        1000,
+        help="Number of recent log events kept for jackernel.diagnostics.events.",
+    ).tag(config=True)
+
+    compile_server = Unicode(
+        "",
+        help="Compile cells on the shared compile server at this socket, "
+        "'auto' for the default one (see jackernel.compileserver). The kernel "
+        "then only loads jaclang when the server is unreachable.",
+    ).tag(config=True)
+
+    module_cache_dir = Unicode(
+        "",
+        help="Where compiled jac files imported by cells are kept for all "
+        "kernels, defaults to ~/.cache/jackernel/modules.",
+    ).tag(config=True)
+
+    module_cache_size = Integer(
+        DEFAULT_MODULE_CACHE_SIZE,
+        help="Maximum size of the module cache in bytes, 0 disables it.",
+    ).tag(config=True)
+
+    module_compile_jobs = Integer(
+        0,
+        help="Processes compiling the uncached jac files a cell imports in "
+        "parallel, 0 for one per CPU, 1 compiles them one after the other.",
+    ).tag(config=True)
+
+    autoreload = Bool(
+        False,
+        help="Before each cell, reload the jac files cells imported that changed "
+        "on disk, and the jac files importing them.",
+    ).tag(config=True)
+
+    gen_dir_root = Unicode(
+        "",
+        help="Where the per-kernel scratch directory is created, "
+        "defaults to a tmpfs such as /dev/shm when writable.",
+    ).tag(config=True)
+
+    def __init__(self, **kwargs) -> None:  # noqa: ANN003
+        """Initialize the kernel, its session namespace and scratch directory."""
+        super().__init__(**kwargs)
+        # Every cell runs in this module, so definitions carry over.
+        self.user_module = types.ModuleType("session")
+        self.transpile_cache = LRUCache(self.transpile_cache_size)
+        # Filled as cells compile, answers completion without recompiling.
+        self.symbols = SymbolIndex()
+        # Private to this kernel, so concurrent kernels never share generated
+        # code and read-only installs keep working.
+        self.gen_dir = tempfile.mkdtemp(
+            prefix=f"jackernel-{os.getpid()}-",
+            dir=self.gen_dir_root or scratch_root(),
+        )
+        atexit.register(self._remove_gen_dir)
+        # Cells run on this worker so the message loop stays responsive.
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="jac-cell"
+        )
+        self._cell_lock = threading.Lock()
+        self._cell_thread: Optional[int] = None
+        self._executing = False
+        self._last_profile: Optional[CompileProfile] = None
+        self._transpiler: Optional[CompileClient] = None
+        if self.compile_server:
+            self._transpiler = CompileClient(
+                None if self.compile_server == "auto" else self.compile_server
+            )
+        if self.profile_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._apply_log_levels({"new": self.log_levels})
+        set_buffer_size(self.log_buffer_size)
+        self._configure_module_cache()
+
+    def _remove_gen_dir(self) -> None:
+        shutil.rmtree(self.gen_dir, ignore_errors=True)
+
+    @observe("transpile_cache_size")
+    def _resize_transpile_cache(self, change: dict) -> None:
+        if hasattr(self, "transpile_cache"):
+            self.transpile_cache.resize(change["new"])
+
+    @observe("log_levels")
+    def _apply_log_levels(self, change: dict) -> None:
+        for subsystem, level in change["new"].items():
+            set_level(subsystem, level)
+
+    @observe("module_cache_dir", "module_cache_size", "module_compile_jobs")
+    def _configure_module_cache(self, change: Optional[dict] = None) -> None:
+        configure_module_cache(self.module_cache_dir, self.module_cache_size)
+        set_compile_jobs(self.module_compile_jobs)
+
+    @observe("log_buffer_size")
+    def _resize_log_buffer(self, change: dict) -> None:
+        set_buffer_size(change["new"])
+
+    # Requests answered immediately, out of order, while a cell is running.
+    concurrent_requests = {
+        "kernel_info_request",
+        "complete_request",
+        "inspect_request",
+        "is_complete_request",
+    }
+
+    def start(self) -> None:
+        """Register dispatchers, routing light requests around running cells."""
+        super().start()
+        self.shell_stream.on_recv(self._route_shell, copy=False)
+        if self.warm_up and self._transpiler is None:
+            # Queued on the cell worker, so the first cell simply waits for it.
+            self._executor.submit(self._warm_up)
+
+    def _warm_up(self) -> None:
+        try:
+            from jackernel.transpiler import warm_up
+
+            warm_up(self.gen_dir)
+        except Exception:
+            self.log.debug("Jac compiler warm up failed:", exc_info=True)
+
+    def _route_shell(self, msg: list) -> None:
+        if self._executing:
+            idents, msg_list = self.session.feed_identities(msg, copy=False)
+            header = self.session.unpack(msg_list[1].bytes)
+            if header.get("msg_type") in self.concurrent_requests:
+                asyncio.ensure_future(self._dispatch_concurrent(idents, msg_list))
+                return
+        self.schedule_dispatch(self.dispatch_shell, msg)
+
+    async def _dispatch_concurrent(self, idents: list, msg_list: list) -> None:
+        try:
+            msg = self.session.deserialize(msg_list, content=True, copy=False)
+        except Exception:
+            self.log.error("Invalid Message", exc_info=True)
+            return
+        # Busy and idle go out with this request as their parent, as for
+        # ipykernel's control requests, for frontends waiting for idle. The
+        # parent set for side effects stays the running cell's, its output
+        # is still being streamed.
+        self._publish_status("busy", "shell", msg)
+        try:
+            handler = self.shell_handlers[msg["header"]["msg_type"]]
+            await handler(self.shell_stream, idents, msg)
+        except Exception:
+            self.log.error("Exception in concurrent message handler:", exc_info=True)
+        finally:
+            self._publish_status("idle", "shell", msg)
+
+    async def _run_cell(self, func: Callable[[], Any]) -> Any:  # noqa: ANN401
+        """Run `func` on the cell worker, turning SIGINT into a cancellation."""
+        future = self._executor.submit(self._run_interruptible, func)
+        previous = signal.signal(signal.SIGINT, self._interrupt_cell)
+        self._executing = True
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            self._executing = False
+            signal.signal(signal.SIGINT, previous)
+
+    def _run_interruptible(self, func: Callable[[], Any]) -> Any:  # noqa: ANN401
+        try:
+            with self._cell_lock:
+                self._cell_thread = threading.get_ident()
+            try:
+                return func()
+            finally:
+                with self._cell_lock:
+                    self._cell_thread = None
+        except KeyboardInterrupt:
+            self._cell_thread = None
+            raise CellInterruptError("Interrupted by user") from None
+
+    def _interrupt_cell(self, signum: int, frame: Optional[types.FrameType]) -> None:
+        """
+        Raise KeyboardInterrupt inside the running cell.
+
+        Only checked between python instructions, a cell blocked in a call
+        into C is interrupted once the call returns (see `JacKernel`).
+        """
+        with self._cell_lock:
+            if self._cell_thread is not None:
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                    ctypes.c_ulong(self._cell_thread),
+                    ctypes.py_object(KeyboardInterrupt),
+                )
+
+    def _send_stream(self, name: str, text: str) -> None:
+        self.send_response(self.iopub_socket, "stream", {"name": name, "text": text})
+
+    async def do_execute(
         self,
         code: str,
         silent: bool,
@@ -86,12 +321,63 @@ class JacKernel(Kernel):
     ) -> dict:
         """Execute the code and return the result."""
         if not silent:
+            cell_name = f"In [{self.execution_count}]"
+            profile = CompileProfile(label=cell_name)
+            self._last_profile = profile
+            status = "error"
             try:
-                output = exec_jac(code)
+                await self._run_cell(
+                    partial(
+                        exec_jac,
+                        code,
+                        module=self.user_module,
+                        to_disk=self.write_jac_gen,
+                        cache=self.transpile_cache,
+                        send_stream=self._send_stream,
+                        # Imports are relative to where the notebook is, as
+                        # in a python kernel.
+                        caller_dir=os.getcwd(),
+                        profile=profile,
+                        symbols=self.symbols,
+                        cell_name=cell_name,
+                        transpiler=self._transpiler,
+                        autoreload=self.autoreload,
+                        # Not next to the notebook, other kernels may run
+                        # there and it may be read-only.
+                        gen_dir=self.gen_dir,
+                    )
+                )
+                status = "ok"
+
+            except CellInterruptError as e:
                 self.send_response(
-                    self.iopub_socket, "stream", {"name": "stdout", "text": output}
+                    self.iopub_socket,
+                    "error",
+                    {"ename": "KeyboardInterrupt", "evalue": str(e), "traceback": []},
                 )
 
+                return {
+                    "status": "error",
+                    "execution_count": self.execution_count,
+                    "ename": "KeyboardInterrupt",
+                    "evalue": str(e),
+                    "traceback": [],
+                }
+
+            except CellError as e:
+                error = {
+                    "ename": e.ename,
+                    "evalue": e.evalue,
+                    "traceback": e.traceback,
+                }
+                self.send_response(self.iopub_socket, "error", error)
+
+                return {
+                    "status": "error",
+                    "execution_count": self.execution_count,
+                    **error,
+                }
+
             except Exception as e:
                 self.send_response(
                     self.iopub_socket,
@@ -107,6 +393,21 @@ class JacKernel(Kernel):
                     "status": "error",
                     "execution_count": self.execution_count,
                 }
+            finally:
+                record(profile)
+                _log.debug(
+                    "%s finished: %s",
+                    cell_name,
+                    status,
+                    extra={
+                        "data": {
+                            "cell": cell_name,
+                            "status": status,
+                            "seconds": profile.total,
+                            "cache_hit": profile.cache_hit,
+                        }
+                    },
+                )
 
         return {
             "status": "ok",
@@ -115,6 +416,66 @@ class JacKernel(Kernel):
             "user_expressions": {},
         }
 
+    def do_complete(self, code: str, cursor_pos: int) -> dict:
+        """Complete the name before the cursor from the session symbol index."""
+        line_start = code.rfind("\n", 0, cursor_pos) + 1
+        match = _COMPLETION_TARGET.search(code, line_start, cursor_pos)
+        owner, prefix = match.group("owner"), match.group("prefix")
+        return {
+            "status": "ok",
+            "matches": self.symbols.complete(prefix, owner),
+            "cursor_start": cursor_pos - len(prefix),
+            "cursor_end": cursor_pos,
+            "metadata": {},
+        }
+
+    def do_inspect(
+        self,
+        code: str,
+        cursor_pos: int,
+        detail_level: int = 0,
+        omit_sections: tuple = (),
+    ) -> dict:
+        """Describe the name under the cursor from the session symbol index."""
+        line_start = code.rfind("\n", 0, cursor_pos) + 1
+        word_end = _WORD.match(code, cursor_pos).end()
+        match = _INSPECT_TARGET.search(code, line_start, word_end)
+        symbol = None
+        if match:
+            symbol = self.symbols.get(match.group("name"), match.group("owner"))
+        if symbol is None:
+            return {"status": "ok", "data": {}, "metadata": {}, "found": False}
+        return {
+            "status": "ok",
+            "data": {"text/plain": describe_symbol(symbol)},
+            "metadata": {},
+            "found": True,
+        }
+
+    def do_is_complete(self, code: str) -> dict:
+        """Tell console frontends whether `code` is ready to run."""
+        status, depth = cell_status(code)
+        reply = {"status": status}
+        if status == "incomplete":
+            reply["indent"] = "    " * depth
+        return reply
+
+    def finish_metadata(
+        self, parent: dict, metadata: dict, reply_content: dict
+    ) -> dict:
+        """Attach the compile profile of the cell to its execute reply."""
+        metadata = super().finish_metadata(parent, metadata, reply_content)
+        if self._last_profile is not None:
+            metadata["jac_compile_profile"] = self._last_profile.to_dict()
+            self._last_profile = None
+        return metadata
+
+    def do_shutdown(self, restart: bool) -> dict:
+        """Stop the cell worker and remove the scratch directory on shutdown."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._remove_gen_dir()
+        return super().do_shutdown(restart)
+
 
 if __name__ == "__main__":
     IPKernelApp.launch_instance(kernel_class=JacKernel)
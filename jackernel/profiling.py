@@ -0,0 +1,101 @@
+"""Per cell timing of the transpile pipeline.
+
+Every profiled cell records wall time, and allocations when `tracemalloc`
+is tracing, for the lexer, the parser, each scheduled pass, the python
+output pass and the execution of the generated code. The most recent
+profiles of the process can be read back with `history`, e.g. from a cell:
+
+    import:py from jackernel.profiling, history;
+    with entry { print(history(1)); }
+"""
+import contextlib
+import threading
+import time
+import tracemalloc
+from collections import deque
+from typing import Iterator, Optional
+
+_history: deque = deque(maxlen=100)
+_history_lock = threading.Lock()
+
+
+class CompileProfile:
+    """Timings of one cell's trip through the transpile pipeline."""
+
+    def __init__(self, label: str = "") -> None:
+        """Initialize profile."""
+        self.label = label
+        self.cache_hit = False
+        self.stages: dict[str, dict] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block, adding to earlier runs of the same stage."""
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            entry = self.stages.setdefault(
+                name, {"seconds": 0.0, "calls": 0, "allocated": None}
+            )
+            entry["seconds"] += elapsed
+            entry["calls"] += 1
+            if tracing:
+                allocated = tracemalloc.get_traced_memory()[0] - before
+                entry["allocated"] = (entry["allocated"] or 0) + allocated
+
+    @property
+    def total(self) -> float:
+        """Return the time spent in all stages."""
+        return sum(i["seconds"] for i in self.stages.values())
+
+    def to_dict(self) -> dict:
+        """Return a JSON serializable view of the profile."""
+        return {
+            "label": self.label,
+            "cache_hit": self.cache_hit,
+            "total_seconds": self.total,
+            "stages": self.stages,
+        }
+
+
+def timed(
+    profile: Optional[CompileProfile], name: str
+) -> contextlib.AbstractContextManager:
+    """Return `profile.stage(name)`, or a no-op when not profiling."""
+    return profile.stage(name) if profile is not None else contextlib.nullcontext()
+
+
+def record(profile: CompileProfile) -> None:
+    """Add a finished profile to the history."""
+    with _history_lock:
+        _history.append(profile.to_dict())
+
+
+def history(count: Optional[int] = None) -> list[dict]:
+    """
+    Return the most recent cell profiles, oldest first.
+
+    Parameters
+    ----------
+    count : int, optional
+        Only return this many of the latest profiles.
+
+    Returns
+    -------
+    list[dict]
+        The recorded profiles.
+    """
+    with _history_lock:
+        profiles = list(_history)
+    return profiles[-count:] if count else profiles
+
+
+def clear_history() -> None:
+    """Forget all recorded profiles."""
+    with _history_lock:
+        _history.clear()
@@ -1,14 +1,152 @@
 """Connect Decls and Defs in AST."""
+import hashlib
 import os
+from types import CodeType
+from typing import Optional
+
+from jackernel.importer import is_compiled, jac_import_path
+from jackernel.sourcemap import SourceMap
 
 import jaclang.jac.absyntree as ast
 from jaclang.jac.constant import Constants as Con
-from jaclang.jac.passes.blue import PyOutPass
+from jaclang.jac.passes.blue import (
+    BluePygenPass,
+    ImportPass,
+    PyOutPass,
+    SubNodeTabPass,
+)
+from jaclang.jac.transform import Transform
+
+
+class CellImportPass(ImportPass):
+    """Static imports resolved against the file that contains them.
+
+    jaclang resolves the imports of imported jac files against the module
+    being compiled, so a file importing its sibling from another directory
+    was not found. Every import is resolved against the directory of its
+    own module instead, as `jackernel.importer.jac_file_import` does when
+    the code runs, and each imported module is scanned for imports once.
+
+    The python of a cell only imports its jac files, they are compiled on
+    their own when the cell runs. A jac file the module cache holds
+    unchanged (see `jackernel.importer.is_compiled`) is therefore not
+    attached to the tree, unless `include:jac` needs its symbols, so the
+    passes after this one do not go through it and its imports again.
+    """
+
+    def enter_module(self, node: ast.Module) -> None:
+        """Attach the jac modules `node` imports, directly or not."""
+        self.cur_node = node
+        self.terminate()
+        pending = [node]
+        while pending:
+            module = pending.pop()
+            for i in self.get_all_sub_nodes(module, ast.Import):
+                if i.lang.value == "jac" and not i.sub_module:
+                    imported = len(self.import_table)
+                    mod = self.import_module(i, module.mod_path)
+                    if mod is not None:
+                        ast.append_node(i, mod)
+                        i.sub_module = i.kid[-1]
+                    if len(self.import_table) > imported:
+                        # Its own imports, looked up with a table of its nodes.
+                        SubNodeTabPass(prior=self, mod_path=mod.mod_path, input_ir=mod)
+                        pending.append(mod)
+                self.enter_import(i)
+        SubNodeTabPass(prior=self, mod_path=node.mod_path, input_ir=node)
+        node.meta["sub_import_tab"] = self.import_table
+
+    def import_module(self, node: ast.Import, mod_path: str) -> Optional[ast.AstNode]:
+        """Import a module, None for one only needed when the code runs."""
+        target = jac_import_path(node.path.path_str, mod_path)
+        cached = not node.is_absorb and target not in self.import_table
+        if cached and is_compiled(target):
+            return None
+        return super().import_module(node, mod_path)
+
+
+_EMPTY_DOC = '""""""'
+
+
+class CellPygenPass(BluePygenPass):
+    """Python code generation for notebook cells.
+
+    Abilities re-raise errors untouched instead of calling jaclang's
+    `handle_jac_error`, which re-reads the module from disk and rescans
+    the generated code on every exception. The kernel maps tracebacks
+    back to jac with the source map instead, so every statement is tagged
+    with its own jac line rather than the line of its block. Imported jac
+    files go through `jackernel.importer.jac_file_import`.
+    """
+
+    def exit_module(self, node: ast.Module) -> None:
+        """Leave an empty module docstring out of the generated python.
+
+        Modules without a docstring get an empty one, which would reset
+        the `__doc__` of the session module, also for every element of a
+        cell compiled on its own (see `transpile_jac_elements`). It is
+        commented out, the lines after it stay where they were.
+        """
+        super().exit_module(node)
+        code = node.meta["py_code"]
+        if code.startswith(_EMPTY_DOC):
+            node.meta["py_code"] = "#" + code[len(_EMPTY_DOC) :]
+
+    def exit_code_block(self, node: ast.CodeBlock) -> None:
+        """Sub objects.
+
+        stmts: list["StmtType"],
+        """
+        if len(node.stmts) == 0:
+            self.emit_ln(node, "pass")
+        for i in node.stmts:
+            self.emit(node, i.meta["py_code"])
+            if len(i.meta["py_code"]) and i.meta["py_code"][-1] != "\n":
+                self.emit(node, f"  # {self.get_mod_index(i)} {i.line}\n")
+
+    def needs_jac_import(self) -> None:
+        """Import jac files through the module cache of `jackernel.importer`."""
+        self.emit_ln_unique(
+            self.preamble,
+            "from jackernel.importer import jac_file_import as __jac_import__",
+        )
+
+    def emit_jac_error_handler(self, node: ast.AstNode) -> None:
+        """Emit error handler."""
+        self.emit_ln(node, "except Exception:")
+        self.indent_level += 1
+        self.emit_ln(node, "raise")
+        self.indent_level -= 1
 
 
 class CustomPyOutPass(PyOutPass):
     """Custom Python and bytecode file printing pass Developed for JAC kernel."""
 
+    def __init__(
+        self,
+        mod_path: str,
+        input_ir: ast.AstNode,
+        base_path: str = "",
+        prior: Optional[Transform] = None,
+        to_disk: bool = False,
+        gen_dir: str = "",
+    ) -> None:
+        """Initialize pass.
+
+        When `to_disk` is False the generated python, its code object and
+        source map are only kept on the pass (`py_code`, `codeobj`,
+        `source_map`) and nothing is written to `__jac_gen__`. Otherwise
+        `__jac_gen__` goes in `gen_dir`, by default next to the module.
+        """
+        self.to_disk = to_disk
+        self.gen_dir = gen_dir
+        self.py_code: Optional[str] = None
+        self.codeobj: Optional[CodeType] = None
+        self.source_map: Optional[SourceMap] = None
+        super().__init__(
+            mod_path=mod_path, input_ir=input_ir, base_path=base_path, prior=prior
+        )
+
     def enter_module(self, node: ast.Module) -> None:
         """Sub objects.
 
@@ -20,7 +158,17 @@ class CustomPyOutPass(PyOutPass):
         is_imported: bool,
         sym_tab: Optional[SymbolTable],
         """
-        if not (os.path.exists(node.mod_path) and node.meta.get("py_code")):
+        if not node.meta.get("py_code"):
+            return
+        self.py_code = node.meta["py_code"]
+        # Unique per generated code, so tracebacks find the right source map.
+        digest = hashlib.sha1(self.py_code.encode()).hexdigest()[:12]
+        self.codeobj = compile(self.py_code, f"<jac-cell-{digest}>", "exec")
+        self.source_map = SourceMap.from_generated(self.py_code)
+        if not self.to_disk:
+            self.terminate()
+            return
+        if not os.path.isdir(self.gen_dir or os.path.dirname(node.mod_path)):
             return
         mods = [node] + self.get_all_sub_nodes(node, ast.Module)
         for mod in mods:
@@ -31,11 +179,15 @@ class CustomPyOutPass(PyOutPass):
 
     def get_output_targets(self, node: ast.Module) -> tuple[str, str, str]:
         """Get output targets."""
-        gen_path = os.path.join(node.mod_path, Con.JAC_GEN_DIR)
+        # In `gen_dir`, or next to the jac file or in the directory of the cell.
+        gen_path = os.path.join(
+            self.gen_dir or os.path.dirname(node.mod_path), Con.JAC_GEN_DIR
+        )
         os.makedirs(gen_path, exist_ok=True)
         with open(os.path.join(gen_path, "__init__.py"), "w"):
             pass
-        os.makedirs(gen_path, exist_ok=True)
-        out_path_py = os.path.join(gen_path, "session.py")
-        out_path_pyc = os.path.join(gen_path, "session.pyc")
+        # The cell is the session, imported jac files keep their names.
+        name = "session" if node.mod_path == self.mod_path else node.name
+        out_path_py = os.path.join(gen_path, f"{name}.py")
+        out_path_pyc = os.path.join(gen_path, f"{name}.pyc")
         return node.mod_path, out_path_py, out_path_pyc
@@ -0,0 +1,255 @@
+"""
+Run Jac notebooks and files without a Jupyter server.
+
+Every code cell of every input is transpiled up front on a process pool,
+transpilation being independent per cell. The cells of each input are
+then executed in order in one `JacSession`, as soon as their compiled
+code is back, so later inputs keep compiling while earlier ones run.
+Outputs and errors are written back into `.ipynb` files, `.jac` files
+print to the terminal.
+
+    jackernel report.ipynb nightly/*.ipynb --jobs 8
+    jackernel script.jac
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Callable, Optional
+
+from jackernel.cache import LRUCache, source_key
+from jackernel.compiled import TranspiledCell
+from jackernel.session import JacSession
+from jackernel.transpiler import cell_schedule, transpile_jac_blue
+
+
+def transpile_cell(cell: str, caller_dir: str) -> tuple[str, TranspiledCell]:
+    """
+    Transpile a cell the way the kernel's cache would.
+
+    Parameters
+    ----------
+    cell : str
+        The jac cell to convert.
+    caller_dir : str
+        The directory the cell is compiled relative to.
+
+    Returns
+    -------
+    tuple[str, TranspiledCell]
+        The transpile cache key of the cell and the compiled cell.
+    """
+    result = transpile_jac_blue(cell, caller_dir, cache=LRUCache())
+    return source_key(cell, cell_schedule, caller_dir), result
+
+
+class Input:
+    """A notebook or jac file and the cells to run from it."""
+
+    def __init__(self, path: str) -> None:
+        """Read the file, a `.jac` file is a single cell."""
+        self.path = path
+        self.caller_dir = os.path.dirname(os.path.abspath(path))
+        with open(path) as f:
+            text = f.read()
+        if path.endswith(".ipynb"):
+            self.notebook: Optional[dict] = json.loads(text)
+            self.cells = [
+                i for i in self.notebook["cells"] if i.get("cell_type") == "code"
+            ]
+            self.sources = [_source(i) for i in self.cells]
+        else:
+            self.notebook = None
+            self.cells = []
+            self.sources = [text]
+        self.compiled: list[Optional[Future]] = []
+
+    def submit(self, pool: Optional[Executor]) -> None:
+        """Start transpiling every non empty cell on `pool`."""
+        self.compiled = [
+            pool.submit(transpile_cell, i, self.caller_dir)
+            if pool is not None and i.strip()
+            else None
+            for i in self.sources
+        ]
+
+    def run(self, allow_errors: bool = False) -> bool:
+        """
+        Execute the cells in order in a fresh session.
+
+        Parameters
+        ----------
+        allow_errors : bool
+            Keep running the cells after one fails.
+
+        Returns
+        -------
+        bool
+            Whether every executed cell succeeded.
+        """
+        session = JacSession(
+            self.caller_dir, cache_size=max(1, len(self.sources)), warm_up=False
+        )
+        # Cleared up front, cells left out after an error must not keep the
+        # outputs of an earlier run.
+        for cell in self.cells:
+            cell["outputs"] = []
+            cell["execution_count"] = None
+        ok = True
+        for idx, source in enumerate(self.sources):
+            cell = self.cells[idx] if self.notebook is not None else None
+            if not source.strip():
+                continue
+            self._take_compiled(idx, session.cache)
+            outputs = cell["outputs"] if cell is not None else None
+            result = session.run(source, on_output=_collector(outputs))
+            if cell is not None:
+                cell["execution_count"] = result.execution_count
+            if result.ok:
+                continue
+            ok = False
+            error = result.error
+            if outputs is None:
+                print("\n".join(error.traceback), file=sys.stderr)
+            else:
+                outputs.append(
+                    {
+                        "output_type": "error",
+                        "ename": error.ename,
+                        "evalue": error.evalue,
+                        "traceback": error.traceback,
+                    }
+                )
+            if not allow_errors:
+                break
+        return ok
+
+    def _take_compiled(self, idx: int, cache: LRUCache) -> None:
+        future = self.compiled[idx] if idx < len(self.compiled) else None
+        if future is None:
+            return
+        try:
+            key, result = future.result()
+        except Exception:
+            # Compiled again in process, where the error surfaces properly.
+            return
+        cache.put(key, result)
+
+    def write(self, output_dir: Optional[str] = None) -> str:
+        """Write the notebook with its outputs, in place unless `output_dir`."""
+        path = self.path
+        if output_dir is not None:
+            path = os.path.join(output_dir, os.path.basename(path))
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.notebook, f, indent=1, ensure_ascii=False)
+                f.write("\n")
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return path
+
+
+def _source(cell: dict) -> str:
+    source = cell.get("source", "")
+    return "".join(source) if isinstance(source, list) else source
+
+
+def _collector(outputs: Optional[list]) -> Callable[[str, str], None]:
+    """Return a `send_stream` appending to notebook `outputs`.
+
+    Consecutive text on the same stream is merged into one output. Without
+    `outputs` the text goes to the terminal.
+    """
+    if outputs is None:
+        # Bound now, while a cell runs sys.stdout is its capture.
+        streams = {"stdout": sys.stdout, "stderr": sys.stderr}
+        return lambda name, text: streams[name].write(text)
+
+    def send_stream(name: str, text: str) -> None:
+        if outputs and outputs[-1].get("name") == name:
+            outputs[-1]["text"] += text
+        else:
+            outputs.append({"output_type": "stream", "name": name, "text": text})
+
+    return send_stream
+
+
+def run(
+    paths: list[str],
+    jobs: Optional[int] = None,
+    allow_errors: bool = False,
+    output_dir: Optional[str] = None,
+) -> int:
+    """
+    Run notebooks and jac files, writing notebook outputs back.
+
+    Parameters
+    ----------
+    paths : list[str]
+        The `.ipynb` and `.jac` files, run in this order.
+    jobs : int, optional
+        Transpile worker processes, by default one per CPU. With 1 every
+        cell is transpiled right before it runs.
+    allow_errors : bool
+        Run the remaining cells of an input after one fails.
+    output_dir : str, optional
+        Write executed notebooks here instead of over the inputs.
+
+    Returns
+    -------
+    int
+        The number of inputs with a failing cell.
+    """
+    inputs = [Input(i) for i in paths]
+    failed = 0
+    pool = ProcessPoolExecutor(jobs) if jobs != 1 else None
+    try:
+        for i in inputs:
+            i.submit(pool)
+        for i in inputs:
+            ok = i.run(allow_errors)
+            failed += not ok
+            if i.notebook is not None:
+                path = i.write(output_dir)
+                print(f"{'ok' if ok else 'failed':<7}{path}", file=sys.stderr)
+            # Compiled cells are not needed anymore.
+            i.compiled = []
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return failed
+
+
+def main(argv: list = None) -> int:
+    """Entry point of the `jackernel` command."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("paths", nargs="+", help="Notebooks and .jac files to run")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Transpile worker processes, one per CPU by default",
+    )
+    parser.add_argument(
+        "--allow-errors",
+        action="store_true",
+        help="Keep running the cells of an input after one fails",
+    )
+    parser.add_argument(
+        "--output-dir", help="Write executed notebooks here instead of in place"
+    )
+    args = parser.parse_args(argv)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    failed = run(args.paths, args.jobs, args.allow_errors, args.output_dir)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
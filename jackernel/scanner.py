@@ -0,0 +1,159 @@
+"""Light weight structural scanner for Jac cells.
+
+Only tracks what is needed to find the top level elements of a cell and
+whether it is finished: brackets, semicolons, strings and comments. It
+never builds tokens for the rest of the source, so it is much cheaper
+than the jaclang lexer.
+"""
+import re
+
+_TOKENS = re.compile(
+    r"(?P<py>::py::.*?::py::)|(?P<skip>#\*.*?\*#|\"\"\".*?\"\"\"|'''.*?''')"
+    r"|(?P<open_block>::py::|#\*|\"\"\"|''')"
+    r"|(?P<string>f?\"[^\"\r\n]*\"|f?'[^'\r\n]*')|(?P<open_string>f?[\"'])"
+    r"|(?P<comment>#[^\r\n]*)|(?P<open>[{(\[])|(?P<close>[})\]])|(?P<semi>;)",
+    re.DOTALL,
+)
+_LEADING_NOISE = re.compile(
+    r"(?:\s+|#\*.*?\*#|#[^\r\n]*|\"\"\".*?\"\"\"|'''.*?''')*", re.DOTALL
+)
+# Top level statements that only end at a `;`, even if they contain braces.
+_STATEMENT_ELEMENT = re.compile(r"(?:global|froz|import|include)\b")
+_JAC_IMPORT = re.compile(r"(?:import|include)\s*:\s*jac\s+(?:from\s+)?([\w.]+)")
+
+
+def _ends_at_brace(element: str) -> bool:
+    start = _LEADING_NOISE.match(element).end()
+    return not _STATEMENT_ELEMENT.match(element, start)
+
+
+def is_out_of_line_def(element: str) -> bool:
+    """Check if an element defines a body declared elsewhere (`:walker:a:can:b`)."""
+    start = _LEADING_NOISE.match(element).end()
+    return element.startswith(":", start) and not element.startswith("::py::", start)
+
+
+def split_elements(cell: str) -> list[tuple[int, str]]:
+    """
+    Split a jac cell into its top level elements.
+
+    Elements end at a top level `;`, after an inline `::py::` block or at
+    the `}` closing a block at depth zero (architypes, abilities,
+    `with entry`, tests, ...). Leading docstrings and comments stay
+    attached to the element that follows.
+
+    Parameters
+    ----------
+    cell : str
+        The jac cell to split.
+
+    Returns
+    -------
+    list[tuple[int, str]]
+        The 1-based cell line each element starts on and its source.
+    """
+    elements: list[tuple[int, str]] = []
+    depth = 0
+    start = 0
+    line = 1
+    counted = 0
+    for match in _TOKENS.finditer(cell):
+        kind = match.lastgroup
+        if kind == "open":
+            depth += 1
+            continue
+        if kind == "close":
+            depth -= 1
+            if depth or match.group() != "}":
+                continue
+            if not _ends_at_brace(cell[start : match.end()]):
+                continue
+        elif kind not in ("semi", "py") or depth:
+            continue
+        end = match.end()
+        text = cell[start:end]
+        first = start + len(text) - len(text.lstrip())
+        line += cell.count("\n", counted, first)
+        counted = first
+        elements.append((line, cell[first:end]))
+        start = end
+    rest = cell[start:]
+    if rest.strip():
+        first = start + len(rest) - len(rest.lstrip())
+        elements.append((line + cell.count("\n", counted, first), cell[first:]))
+    return elements
+
+
+def cell_status(cell: str) -> tuple[str, int]:
+    """
+    Check whether a jac cell is finished, for `is_complete` requests.
+
+    A cell is incomplete while brackets, a multi line string, a block
+    comment or a `::py::` block are open, or when its last element has not
+    been ended by a `;` or a closing `}`. Unbalanced closing brackets and
+    strings left open at the end of a line are invalid.
+
+    Parameters
+    ----------
+    cell : str
+        The jac source typed so far.
+
+    Returns
+    -------
+    tuple[str, int]
+        `complete`, `incomplete` or `invalid`, and the bracket depth the
+        next line continues at.
+    """
+    depth = 0
+    end = 0
+    for match in _TOKENS.finditer(cell):
+        kind = match.lastgroup
+        if kind == "open_block":
+            return "incomplete", depth
+        if kind == "open_string":
+            return "invalid", depth
+        if kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth -= 1
+            if depth < 0:
+                return "invalid", 0
+            if (
+                not depth
+                and match.group() == "}"
+                and _ends_at_brace(cell[end : match.end()])
+            ):
+                end = match.end()
+        elif kind in ("semi", "py") and not depth:
+            end = match.end()
+    if depth:
+        return "incomplete", depth
+    rest = cell[end:]
+    if _LEADING_NOISE.match(rest).end() < len(rest):
+        return "incomplete", 0
+    return "complete", 0
+
+
+def jac_imports(source: str) -> list[str]:
+    """
+    List the jac modules a jac file or cell imports, e.g. `lib.shapes`.
+
+    Only top level `import:jac` and `include:jac` statements are found,
+    the only places the compiler accepts them.
+
+    Parameters
+    ----------
+    source : str
+        The jac source.
+
+    Returns
+    -------
+    list[str]
+        The dotted import paths, in the order they are imported.
+    """
+    imports = []
+    for _, element in split_elements(source):
+        match = _JAC_IMPORT.match(element, _LEADING_NOISE.match(element).end())
+        if match is not None:
+            imports.append(match.group(1))
+    return imports
@@ -0,0 +1,210 @@
+"""
+Run Jac cells in process, without Jupyter.
+
+`JacSession` is what `JacKernel` does for each execute request, minus the
+messaging: cells are compiled through the transpile cache and run one
+after the other in a persistent namespace, and each run returns a
+`CellResult`.
+
+    from jackernel.session import JacSession
+
+    with JacSession() as session:
+        session.run("object Point { has x: int = 1; }")
+        result = session.run("with entry { print(Point().x); }")
+        print(result.status, result.stdout)
+"""
+import os
+import threading
+import types
+from typing import Callable, Optional
+
+from jackernel.cache import LRUCache
+from jackernel.execute import CellError, exec_jac
+from jackernel.profiling import CompileProfile
+from jackernel.symbols import SymbolIndex
+
+
+class CellResult:
+    """Outcome of one cell run by a `JacSession`."""
+
+    def __init__(
+        self,
+        execution_count: int,
+        stdout: str,
+        stderr: str,
+        error: Optional[CellError] = None,
+        profile: Optional[CompileProfile] = None,
+    ) -> None:
+        """
+        Initialize result.
+
+        Parameters
+        ----------
+        execution_count : int
+            The number of the cell in its session, starting at 1.
+        stdout : str
+            What the cell printed.
+        stderr : str
+            What the cell wrote to stderr.
+        error : CellError, optional
+            Why the cell failed, None when it succeeded.
+        profile : CompileProfile, optional
+            The time spent compiling and running the cell.
+        """
+        self.execution_count = execution_count
+        self.stdout = stdout
+        self.stderr = stderr
+        self.error = error
+        self.profile = profile
+
+    @property
+    def ok(self) -> bool:
+        """Return whether the cell ran without raising."""
+        return self.error is None
+
+    @property
+    def status(self) -> str:
+        """Return `ok` or `error`, as in an execute reply."""
+        return "ok" if self.ok else "error"
+
+    def to_dict(self) -> dict:
+        """Return a JSON serializable view of the result."""
+        result = {
+            "status": self.status,
+            "execution_count": self.execution_count,
+            "stdout": self.stdout,
+            "stderr": self.stderr,
+            "profile": self.profile.to_dict() if self.profile else None,
+        }
+        if self.error is not None:
+            result["ename"] = self.error.ename
+            result["evalue"] = self.error.evalue
+            result["traceback"] = self.error.traceback
+        return result
+
+
+class JacSession:
+    """
+    A persistent Jac namespace that cells are run in, in process.
+
+    Definitions carry over from one cell to the next, as in a notebook.
+    `run` may be called from any thread. Cells run one at a time, also
+    across sessions, since their output is captured from the process wide
+    `sys.stdout` (see `jackernel.execute.exec_jac`).
+    """
+
+    def __init__(
+        self,
+        caller_dir: Optional[str] = None,
+        cache_size: int = 128,
+        on_output: Optional[Callable[[str, str], None]] = None,
+        warm_up: bool = True,
+        autoreload: bool = False,
+    ) -> None:
+        """
+        Initialize session.
+
+        Parameters
+        ----------
+        caller_dir : str, optional
+            Directory jac imports of the cells are resolved against, by
+            default the current working directory.
+        cache_size : int
+            Number of transpiled cells kept in the LRU cache, 0 disables it.
+        on_output : Callable[[str, str], None], optional
+            Called with the stream name (`stdout` or `stderr`) and text as
+            cells print, for every cell without an `on_output` of its own.
+        warm_up : bool
+            Load the jac compiler right away instead of on the first cell.
+        autoreload : bool
+            Before each cell, reload the jac files imported by earlier cells
+            that changed on disk, see `jackernel.autoreload`.
+        """
+        self.caller_dir = caller_dir if caller_dir else os.getcwd()
+        self.cache = LRUCache(cache_size)
+        self.on_output = on_output
+        self.autoreload = autoreload
+        self.module = types.ModuleType("session")
+        self.symbols = SymbolIndex()
+        self.execution_count = 0
+        self._lock = threading.Lock()
+        if warm_up:
+            from jackernel.transpiler import warm_up as warm_up_compiler
+
+            warm_up_compiler(self.caller_dir)
+
+    @property
+    def namespace(self) -> dict:
+        """Return the globals the cells run in."""
+        return self.module.__dict__
+
+    def run(
+        self, code: str, on_output: Optional[Callable[[str, str], None]] = None
+    ) -> CellResult:
+        """
+        Compile and run a cell.
+
+        Parameters
+        ----------
+        code : str
+            The jac cell.
+        on_output : Callable[[str, str], None], optional
+            Receives the cell's output as it is printed, instead of the
+            session's `on_output`.
+
+        Returns
+        -------
+        CellResult
+            The output of the cell and the error it raised, if any. Only
+            interrupts (KeyboardInterrupt) propagate.
+        """
+        forward = on_output if on_output is not None else self.on_output
+        captured: dict[str, list[str]] = {"stdout": [], "stderr": []}
+
+        def send_stream(name: str, text: str) -> None:
+            captured[name].append(text)
+            if forward is not None:
+                forward(name, text)
+
+        with self._lock:
+            self.execution_count += 1
+            count = self.execution_count
+            profile = CompileProfile(label=f"In [{count}]")
+            error = None
+            try:
+                exec_jac(
+                    code,
+                    module=self.module,
+                    cache=self.cache,
+                    send_stream=send_stream,
+                    caller_dir=self.caller_dir,
+                    profile=profile,
+                    symbols=self.symbols,
+                    cell_name=profile.label,
+                    autoreload=self.autoreload,
+                )
+            except CellError as e:
+                error = e
+        return CellResult(
+            count,
+            "".join(captured["stdout"]),
+            "".join(captured["stderr"]),
+            error,
+            profile,
+        )
+
+    def reset(self) -> None:
+        """Start over with an empty namespace, keeping the compiled cells."""
+        with self._lock:
+            self.module = types.ModuleType("session")
+            self.symbols = SymbolIndex()
+            self.execution_count = 0
+
+    def __enter__(self) -> "JacSession":
+        """Return the session."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Drop the namespace and the compiled cells."""
+        self.reset()
+        self.cache.clear()
@@ -0,0 +1,159 @@
+"""Map generated python back to the jac cells it was compiled from.
+
+The code generator ends every python line with a `# <module> <jac line>`
+comment. `SourceMap` reads those once at compile time into two parallel
+run length encoded lists, so a traceback line is resolved with a binary
+search. Cells register their maps under the file name of their code
+object right before they run, which also covers abilities called later
+from other cells. The last `REGISTRY_SIZE` maps are kept.
+"""
+import linecache
+import os
+import re
+import traceback
+from bisect import bisect_right
+from typing import Optional
+
+from jackernel.cache import LRUCache
+
+_LINE_INFO = re.compile(r"#\s*(-?\d+)\s+(\d+)\s*$")
+_DEBUG_INFO = re.compile(r'r""" JAC DEBUG INFO\n(.*?)JAC DEBUG INFO """', re.DOTALL)
+
+# Number of registered cells and files kept. Tracebacks through cells run
+# longer ago show python lines.
+REGISTRY_SIZE = 1024
+
+# Code object file name -> (map, jac source, cell name, line offset).
+_registry = LRUCache(REGISTRY_SIZE)
+
+
+class SourceMap:
+    """Python line to (jac module index, jac line) lookup table."""
+
+    def __init__(
+        self, py_lines: list[int], jac_locs: list[tuple[int, int]], mod_paths: list[str]
+    ) -> None:
+        """
+        Initialize source map.
+
+        Parameters
+        ----------
+        py_lines : list[int]
+            Sorted python lines at which the jac location changes.
+        jac_locs : list[tuple[int, int]]
+            The module index and jac line from each of `py_lines` on.
+        mod_paths : list[str]
+            Paths of the jac modules, by module index. A cell is listed
+            under its `jackernel.importer.cell_path`, it has no file.
+        """
+        self.py_lines = py_lines
+        self.jac_locs = jac_locs
+        self.mod_paths = mod_paths
+
+    @classmethod
+    def from_generated(cls, py_code: str) -> "SourceMap":
+        """Build the map from the line comments of generated python."""
+        py_lines: list[int] = []
+        jac_locs: list[tuple[int, int]] = []
+        for lineno, line in enumerate(py_code.splitlines(), 1):
+            match = _LINE_INFO.search(line)
+            if match is None:
+                continue
+            loc = (int(match.group(1)), int(match.group(2)))
+            if not jac_locs or jac_locs[-1] != loc:
+                py_lines.append(lineno)
+                jac_locs.append(loc)
+        debug_info = _DEBUG_INFO.search(py_code)
+        mod_paths = debug_info.group(1).strip().splitlines() if debug_info else []
+        return cls(py_lines, jac_locs, mod_paths)
+
+    def lookup(self, py_line: int) -> Optional[tuple[int, int]]:
+        """Return the module index and jac line of a python line, if known."""
+        idx = bisect_right(self.py_lines, py_line) - 1
+        if idx < 0:
+            return None
+        return self.jac_locs[idx]
+
+
+def register(
+    filename: str, source_map: SourceMap, source: str, name: str, line_offset: int
+) -> None:
+    """
+    Make tracebacks through a compiled cell resolvable.
+
+    Parameters
+    ----------
+    filename : str
+        The file name of the cell's code object.
+    source_map : SourceMap
+        The map of the generated python.
+    source : str
+        The jac source of the whole cell.
+    name : str
+        How the cell is shown in tracebacks, e.g. `In [3]`.
+    line_offset : int
+        Number of cell lines before the compiled unit.
+    """
+    _registry.put(filename, (source_map, source, name, line_offset))
+
+
+def jac_traceback(exc: BaseException) -> list[str]:
+    """
+    Format a traceback, showing frames of jac cells at their jac lines.
+
+    Frames before the first cell frame belong to the kernel and are left
+    out. Without any cell frame the plain python traceback is returned.
+
+    Parameters
+    ----------
+    exc : BaseException
+        The exception raised while running a cell.
+
+    Returns
+    -------
+    list[str]
+        The traceback lines, ending with the exception itself.
+    """
+    frames = traceback.extract_tb(exc.__traceback__)
+    entries = [_registry.get(i.filename) for i in frames]
+    if not any(entries):
+        return "".join(traceback.format_exception(exc)).rstrip("\n").splitlines()
+    lines = ["Traceback (most recent call last):"]
+    started = False
+    for frame, entry in zip(frames, entries):
+        started = started or entry is not None
+        if not started:
+            continue
+        where, text = _frame_location(frame, entry)
+        if frame.name != "<module>":
+            where += f", in {frame.name}"
+        lines.append(f"  {where}")
+        if text:
+            lines.append(f"    {text.strip()}")
+    lines.extend(
+        "".join(traceback.format_exception_only(type(exc), exc))
+        .rstrip("\n")
+        .split("\n")
+    )
+    return lines
+
+
+def _frame_location(
+    frame: traceback.FrameSummary, entry: Optional[tuple]
+) -> tuple[str, str]:
+    if entry is None:
+        return f'File "{frame.filename}", line {frame.lineno}', frame.line
+    source_map, source, name, line_offset = entry
+    loc = source_map.lookup(frame.lineno)
+    if loc is None or loc[1] == 0:
+        return name, ""
+    mod_index, jac_line = loc
+    paths = source_map.mod_paths
+    path = paths[mod_index] if 0 <= mod_index < len(paths) else ""
+    if not os.path.isfile(path):
+        # The cell itself, which has no file.
+        jac_line += line_offset
+        lines = source.splitlines()
+        text = lines[jac_line - 1] if jac_line <= len(lines) else ""
+        return f"{name}, line {jac_line}", text
+    return f'File "{path}", line {jac_line}', linecache.getline(path, jac_line)
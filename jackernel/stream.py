@@ -0,0 +1,94 @@
+"""Batched output streams used to forward cell output while it runs."""
+import io
+import threading
+import time
+from typing import Callable, Optional
+
+
+class OutputStream(io.TextIOBase):
+    """
+    Text stream that forwards what is written to it in batches.
+
+    Writes are buffered and handed to `send` once `max_buffer` characters
+    are pending or `flush_interval` seconds have passed since the first
+    pending write, whichever comes first. Memory use is bounded by
+    `max_buffer` no matter how much a cell prints.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        send: Callable[[str, str], None],
+        max_buffer: int = 64 * 1024,
+        flush_interval: float = 0.2,
+    ) -> None:
+        """
+        Initialize stream.
+
+        Parameters
+        ----------
+        name : str
+            The stream name, `stdout` or `stderr`.
+        send : Callable[[str, str], None]
+            Called with the stream name and a batch of text.
+        max_buffer : int
+            Number of pending characters that triggers a flush.
+        flush_interval : float
+            Maximum number of seconds text stays buffered.
+        """
+        super().__init__()
+        self.name = name
+        self.send = send
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self._pending: list[str] = []
+        self._size = 0
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        self._first_write = 0.0
+
+    def writable(self) -> bool:
+        """Return True, the stream is writable."""
+        return True
+
+    def write(self, text: str) -> int:
+        """Buffer `text`, flushing if the size or time bound is reached."""
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        if not text:
+            return 0
+        with self._lock:
+            if not self._pending:
+                self._first_write = time.monotonic()
+            self._pending.append(text)
+            self._size += len(text)
+            if (
+                self._size >= self.max_buffer
+                or time.monotonic() - self._first_write >= self.flush_interval
+            ):
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return len(text)
+
+    def flush(self) -> None:
+        """Send everything pending."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            text = "".join(self._pending)
+            # Cleared once sent, so that a KeyboardInterrupt raised in the
+            # cell before then leaves the text for the next flush.
+            self.send(self.name, text)
+            self._pending.clear()
+            self._size = 0
+
+    def close(self) -> None:
+        """Flush pending output and close the stream."""
+        self.flush()
+        super().close()
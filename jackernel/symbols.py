@@ -0,0 +1,189 @@
+"""Index of the names defined in a kernel session, for completion and inspection."""
+import builtins
+import contextlib
+import copy
+import inspect
+import threading
+from bisect import bisect_left, insort
+from typing import Iterable, Optional
+
+
+class Symbol:
+    """A name defined by a cell (or a python builtin)."""
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        owner: Optional[str] = None,
+        signature: str = "",
+        doc: str = "",
+        line: Optional[int] = None,
+    ) -> None:
+        """
+        Initialize symbol.
+
+        Parameters
+        ----------
+        name : str
+            The name as written in jac.
+        kind : str
+            One of `architype`, `ability`, `field`, `global` or `builtin`.
+        owner : str, optional
+            The architype a field or ability belongs to.
+        signature : str
+            The declaration as written, e.g. `can area(scale: float) -> float`.
+        doc : str
+            The docstring, without quotes.
+        line : int, optional
+            The cell line the symbol is declared on.
+        """
+        self.name = name
+        self.kind = kind
+        self.owner = owner
+        self.signature = signature
+        self.doc = doc
+        self.line = line
+        # Set by the index, which cell defined the symbol.
+        self.origin = ""
+
+
+def describe_symbol(symbol: Symbol) -> str:
+    """
+    Format a symbol for an inspection reply.
+
+    Parameters
+    ----------
+    symbol : Symbol
+        The symbol to describe.
+
+    Returns
+    -------
+    str
+        Its signature, kind, location and docstring, one field per line.
+    """
+    signature, doc = symbol.signature, symbol.doc
+    if symbol.kind == "builtin":
+        obj = getattr(builtins, symbol.name, None)
+        doc = inspect.getdoc(obj) or ""
+        with contextlib.suppress(TypeError, ValueError):
+            signature = f"{symbol.name}{inspect.signature(obj)}"
+    kind = f"{symbol.kind} of {symbol.owner}" if symbol.owner else symbol.kind
+    fields = [("Signature", signature or symbol.name), ("Type", kind)]
+    if symbol.line is not None:
+        where = f"{symbol.origin}, line {symbol.line}" if symbol.origin else ""
+        fields.append(("Defined", where or f"line {symbol.line}"))
+    if doc:
+        fields.append(("Docstring", doc))
+    return "\n".join(f"{name + ':':<11}{value}" for name, value in fields)
+
+
+class SymbolIndex:
+    """
+    Session wide symbol index, updated from each compiled cell.
+
+    Top level names and architype members are kept in sorted lists so a
+    completion is a binary search for the prefix followed by a scan over
+    the matches only. Updates come from the cell worker while completions
+    are answered on the message loop, so both take a lock.
+    """
+
+    def __init__(self) -> None:
+        """Initialize index with the python builtins."""
+        self._names: list[str] = []
+        self._symbols: dict[str, Symbol] = {}
+        self._members: dict[str, dict[str, Symbol]] = {}
+        self._member_names: list[str] = []
+        self._lock = threading.Lock()
+        self.update(
+            Symbol(i, "builtin") for i in dir(builtins) if not i.startswith("_")
+        )
+
+    def __len__(self) -> int:
+        """Return the number of top level names."""
+        return len(self._names)
+
+    def update(self, symbols: Iterable[Symbol], origin: str = "") -> None:
+        """Add or replace the symbols of a newly compiled cell."""
+        with self._lock:
+            members_changed = False
+            for symbol in symbols:
+                if origin:
+                    # Compiled cells are cached, keep their symbols untouched.
+                    symbol = copy.copy(symbol)
+                    symbol.origin = origin
+                if symbol.owner is not None:
+                    self._members.setdefault(symbol.owner, {})[symbol.name] = symbol
+                    members_changed = True
+                    continue
+                if symbol.name not in self._symbols:
+                    insort(self._names, symbol.name)
+                self._symbols[symbol.name] = symbol
+                if symbol.kind == "architype":
+                    # A redefinition starts with a clean set of members.
+                    self._members[symbol.name] = {}
+                    members_changed = True
+            if members_changed:
+                self._member_names = sorted(
+                    {i for members in self._members.values() for i in members}
+                )
+
+    def get(self, name: str, owner: Optional[str] = None) -> Optional[Symbol]:
+        """
+        Return the symbol for `name`, None if it is unknown.
+
+        Parameters
+        ----------
+        name : str
+            The name to look up.
+        owner : str, optional
+            Look up a member instead of a top level name. When `owner` is
+            not a known architype, the first architype with such a member
+            is used.
+
+        Returns
+        -------
+        Symbol, optional
+            The most recent definition of the name.
+        """
+        with self._lock:
+            if owner is None:
+                return self._symbols.get(name)
+            if owner in self._members:
+                return self._members[owner].get(name)
+            for members in self._members.values():
+                if name in members:
+                    return members[name]
+            return None
+
+    def complete(self, prefix: str, owner: Optional[str] = None) -> list[str]:
+        """
+        Return the names starting with `prefix`.
+
+        Parameters
+        ----------
+        prefix : str
+            What has been typed of the name so far.
+        owner : str, optional
+            Complete members (after a `.`) instead of top level names. The
+            members of `owner` when it is a known architype, otherwise the
+            members of every architype.
+
+        Returns
+        -------
+        list[str]
+            The matching names, sorted.
+        """
+        with self._lock:
+            if owner is None:
+                names = self._names
+            elif owner in self._members:
+                names = sorted(self._members[owner])
+            else:
+                names = self._member_names
+            matches = []
+            for name in names[bisect_left(names, prefix) :]:
+                if not name.startswith(prefix):
+                    break
+                matches.append(name)
+            return matches
@@ -0,0 +1,136 @@
+"""Tests for reloading the jac files imported by cells."""
+import os
+import sys
+from typing import Callable, Iterator
+
+from jackernel import autoreload
+from jackernel.autoreload import changed_modules, reload_modules
+from jackernel.cache import configure_module_cache
+from jackernel.session import JacSession
+
+import pytest
+
+LIBRARY = {
+    "a.jac": "can f(x: int) -> int { return x + 1; }\n",
+    "b.jac": (
+        "import:jac a;\n"
+        "global base = a.f(10);\n"
+        "can g(x: int) -> int { return a.f(x) * 2; }\n"
+    ),
+    "c.jac": "can h() -> int { return 7; }\n",
+}
+IMPORTS = "import:jac a;\nimport:jac b;\nimport:jac c;\ninclude:jac a;\n"
+PRINT = "with entry { print(a.f(1), b.g(1), b.base, c.h(), f(1)); }"
+
+
+@pytest.fixture
+def library(tmp_path: str) -> Iterator[Callable[[str, str], str]]:
+    """
+    Write `LIBRARY` and return a function writing one of its files.
+
+    Each write moves the mtime forward, so that edits are seen however
+    coarse the file system clock is. The modules are forgotten afterwards.
+    """
+    directory = str(tmp_path / "lib")
+    os.mkdir(directory)
+    configure_module_cache(str(tmp_path / "cache"))
+    clock = [1_000_000]
+
+    def write(name: str, source: str) -> str:
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(source)
+        clock[0] += 1
+        os.utime(path, (clock[0], clock[0]))
+        return path
+
+    for name, source in LIBRARY.items():
+        write(name, source)
+    yield write
+    for name, module in list(sys.modules.items()):
+        if (getattr(module, "__file__", None) or "").startswith(directory):
+            del sys.modules[name]
+    for path in list(autoreload._modules):
+        if path.startswith(directory):
+            del autoreload._modules[path]
+    configure_module_cache()
+
+
+def start(library: Callable[[str, str], str]) -> JacSession:
+    """Return a session that imported the library."""
+    directory = os.path.dirname(library("a.jac", LIBRARY["a.jac"]))
+    session = JacSession(directory, autoreload=True)
+    result = session.run(IMPORTS + PRINT)
+    assert (result.status, result.stdout) == ("ok", "2 4 11 7 2\n")
+    return session
+
+
+@pytest.mark.parametrize(
+    "edits, reloaded, output",
+    [
+        ({}, [], "2 4 11 7 2"),
+        ({"a.jac": LIBRARY["a.jac"]}, [], "2 4 11 7 2"),
+        (
+            {"a.jac": "can f(x: int) -> int { return x + 100; }\n"},
+            ["a.jac", "b.jac"],
+            "101 202 110 7 101",
+        ),
+        (
+            {"b.jac": LIBRARY["b.jac"].replace("* 2", "* 3")},
+            ["b.jac"],
+            "2 6 11 7 2",
+        ),
+        ({"c.jac": "can h() -> int { return 8; }\n"}, ["c.jac"], "2 4 11 8 2"),
+        (
+            {
+                "c.jac": "can h() -> int { return 8; }\n",
+                "a.jac": "can f(x: int) -> int { return x + 2; }\n",
+            },
+            ["a.jac", "b.jac", "c.jac"],
+            "3 6 12 8 3",
+        ),
+    ],
+)
+def test_reload_modules(
+    library: Callable[[str, str], str], edits: dict, reloaded: list, output: str
+) -> None:
+    """Test which files are reloaded after edits, and what cells see."""
+    session = start(library)
+    paths = {library(name, source): source for name, source in edits.items()}
+    changed = {p: s for p, s in paths.items() if s != LIBRARY[os.path.basename(p)]}
+    assert changed_modules() == changed
+    order = reload_modules(session.module)
+    assert sorted(os.path.basename(i) for i in order) == reloaded
+    assert changed_modules() == {}
+    result = session.run(PRINT)
+    assert (result.status, result.stdout.strip()) == ("ok", output)
+
+
+def test_edit_is_seen_by_next_cell(library: Callable[[str, str], str]) -> None:
+    """Test that modules keep their identity and included names are rebound."""
+    session = start(library)
+    module, included = session.namespace["a"], session.namespace["f"]
+    library("a.jac", "can f(x: int) -> int { return x * 10; }\n")
+    result = session.run(PRINT)
+    assert (result.status, result.stdout) == ("ok", "10 20 100 7 10\n")
+    assert session.namespace["a"] is module
+    assert session.namespace["f"] is not included
+    assert session.namespace["f"] is module.f
+
+
+def test_broken_edit_is_retried(library: Callable[[str, str], str]) -> None:
+    """Test that a file that does not compile is reloaded once fixed."""
+    session = start(library)
+    library("a.jac", "can f(x: int) -> int { return x +; }\n")
+    assert not session.run(PRINT).ok
+    library("a.jac", "can f(x: int) -> int { return x + 5; }\n")
+    result = session.run(PRINT)
+    assert (result.status, result.stdout) == ("ok", "6 12 15 7 6\n")
+
+
+def test_disabled(library: Callable[[str, str], str]) -> None:
+    """Test that sessions without autoreload keep the modules they imported."""
+    session = start(library)
+    session.autoreload = False
+    library("a.jac", "can f(x: int) -> int { return x + 100; }\n")
+    assert session.run(PRINT).stdout == "2 4 11 7 2\n"
@@ -0,0 +1,157 @@
+"""Tests for the caches of transpiled cells and compiled jac files."""
+import os
+from typing import Iterator
+
+from jackernel.cache import (
+    DiskCache,
+    LRUCache,
+    configure_module_cache,
+    module_cache,
+    source_key,
+)
+
+import pytest
+
+
+class PassA:
+    """A stand in compiler pass."""
+
+
+class PassB:
+    """Another stand in compiler pass."""
+
+
+@pytest.fixture
+def restore_module_cache() -> Iterator[None]:
+    """Put the default module cache settings back after a test."""
+    yield
+    configure_module_cache()
+
+
+@pytest.mark.parametrize(
+    "left, right, equal",
+    [
+        (("x = 1;", [PassA]), ("x = 1;", [PassA]), True),
+        (("x = 1;", [PassA]), ("x = 2;", [PassA]), False),
+        (("x = 1;", [PassA]), ("x = 1;", [PassB]), False),
+        (("x = 1;", [PassA, PassB]), ("x = 1;", [PassB, PassA]), False),
+        (("x = 1;", [PassA], "/a"), ("x = 1;", [PassA], "/b"), False),
+        (("x = 1;", [PassA], "a", "b"), ("x = 1;", [PassA], "ab"), False),
+        (("x = 1;", [PassA], "/a"), ("/a\0\0x = 1;", [PassA]), False),
+    ],
+)
+def test_source_key(left: tuple, right: tuple, equal: bool) -> None:
+    """Test that keys change with the source and the compiler configuration."""
+    assert (source_key(*left) == source_key(*right)) is equal
+
+
+@pytest.mark.parametrize(
+    "max_size, ops, keys, stats",
+    [
+        (2, ["put a", "put b", "get a", "get c"], ["b", "a"], (1, 1, 0)),
+        (2, ["put a", "put b", "put c"], ["b", "c"], (0, 0, 1)),
+        (2, ["put a", "put b", "get a", "put c"], ["a", "c"], (1, 0, 1)),
+        (2, ["put a", "put b", "put a", "put c"], ["a", "c"], (0, 0, 1)),
+        (0, ["put a", "get a"], [], (0, 1, 0)),
+        (3, ["put a", "put b", "put c", "resize 1"], ["c"], (0, 0, 2)),
+        (1, ["put a", "resize 0", "put b"], [], (0, 0, 1)),
+        (2, ["put a", "get a", "put b", "put c", "clear"], [], (0, 0, 0)),
+    ],
+)
+def test_lru_cache(max_size: int, ops: list, keys: list, stats: tuple) -> None:
+    """Test the entries and counters left after a sequence of operations."""
+    cache = LRUCache(max_size)
+    for op in ops:
+        name, _, arg = op.partition(" ")
+        if name == "put":
+            cache.put(arg, arg.upper())
+        elif name == "get":
+            assert cache.get(arg) in (None, arg.upper())
+        elif name == "resize":
+            cache.resize(int(arg))
+        else:
+            cache.clear()
+    assert list(cache._entries) == keys
+    assert all(cache.get(i) == i.upper() for i in keys)
+    found = cache.stats()
+    assert (found["hits"] - len(keys), found["misses"], found["evictions"]) == stats
+    assert found["size"] == len(cache) == len(keys)
+
+
+@pytest.mark.parametrize(
+    "max_size, entries, used, kept",
+    [
+        # Everything fits.
+        (100, {"a": 30, "b": 30, "c": 30}, [], ["a", "b", "c"]),
+        # Least recently written first, down to 90% of the maximum.
+        (100, {"a": 40, "b": 40, "c": 40}, [], ["b", "c"]),
+        (100, {"a": 30, "b": 30, "c": 30, "d": 30}, [], ["b", "c", "d"]),
+        (100, {"a": 50, "b": 30, "c": 30}, [], ["b", "c"]),
+        # Reading an entry marks it as used.
+        (100, {"a": 40, "b": 40, "c": 40}, ["a"], ["a", "c"]),
+        (100, {"a": 40, "b": 40, "c": 40}, ["a", "b"], ["b", "c"]),
+        # Entries larger than the cache and disabled caches store nothing.
+        (100, {"a": 101}, [], []),
+        (0, {"a": 1}, [], []),
+    ],
+)
+def test_disk_cache_eviction(
+    tmp_path: str, max_size: int, entries: dict, used: list, kept: list
+) -> None:
+    """Test which entries are left once the cache is over its size."""
+    cache = DiskCache(str(tmp_path), max_size)
+    clock = 1_000_000
+    for key, size in entries.items():
+        cache.put(key, b"x" * size)
+        clock += 10
+        if key in cache:
+            os.utime(cache._path(key), (clock, clock))
+        for i in used:
+            # Reads touch the entry, order them after the following writes.
+            if i == key:
+                assert cache.get(i) == b"x" * size
+                os.utime(cache._path(i), (clock + 100, clock + 100))
+    assert sorted(i for i in entries if i in cache) == kept
+    assert not [i for i in os.listdir(tmp_path) if i.endswith(".tmp")]
+
+
+def test_disk_cache_get_put(tmp_path: str) -> None:
+    """Test round trips, misses and the counters."""
+    cache = DiskCache(str(tmp_path / "nested"))
+    assert os.stat(cache.directory).st_mode & 0o777 == 0o700
+    assert cache.get("a") is None
+    assert "a" not in cache
+    cache.put("a", b"first")
+    cache.put("a", b"second")
+    assert "a" in cache
+    assert cache.get("a") == b"second"
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"]) == (1, 6)
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 0)
+
+    other = DiskCache(cache.directory)
+    assert other.get("a") == b"second"
+    with cache.lock("a"), cache.lock("b"):
+        pass
+    other.clear()
+    assert cache.get("a") is None
+    assert other.stats()["entries"] == 0
+    assert other.stats()["hits"] == 0
+
+
+def test_module_cache_settings(tmp_path: str, restore_module_cache: None) -> None:
+    """Test that the module cache is created lazily and kept until changed."""
+    configure_module_cache(str(tmp_path), 0)
+    assert module_cache() is None
+    configure_module_cache(str(tmp_path / "modules"), 1000)
+    cache = module_cache()
+    assert (cache.directory, cache.max_size) == (str(tmp_path / "modules"), 1000)
+    configure_module_cache(str(tmp_path / "modules"), 1000)
+    assert module_cache() is cache
+    configure_module_cache(str(tmp_path / "modules"), 2000)
+    assert module_cache() is not cache
+
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    configure_module_cache(str(blocker / "modules"))
+    assert module_cache() is None
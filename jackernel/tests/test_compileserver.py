@@ -0,0 +1,177 @@
+"""Tests for what kernels accept from the compile server and its peers."""
+import marshal
+import os
+import pickle
+import random
+import socket
+import struct
+import threading
+from typing import Iterator
+
+from jackernel import ipc
+from jackernel.compiled import TranspiledCell, dumps_cell, loads_cell
+from jackernel.compileserver import CompileClient, CompileServer
+from jackernel.ipc import connect, listen, recv_frame, same_user, send_frame
+
+import pytest
+
+CELL = (
+    '"""Doc."""\nobject A { has x: int = 1; }\n\n'
+    "can f() -> int { return A().x; }\nwith entry { print(f()); }"
+)
+
+
+@pytest.fixture(scope="module")
+def compiled() -> TranspiledCell:
+    """Return a cell compiled element by element, with units and symbols."""
+    from jackernel.cache import LRUCache
+    from jackernel.transpiler import transpile_jac_elements
+
+    return transpile_jac_elements(CELL, os.getcwd(), LRUCache())
+
+
+@pytest.fixture
+def other_user(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Make every socket peer look like a process of another user."""
+    credentials = struct.pack("3i", 1, os.getuid() + 1, 0)
+    monkeypatch.setattr(socket, "SO_PEERCRED", 17, raising=False)
+    monkeypatch.setattr(socket.socket, "getsockopt", lambda *args: credentials)
+
+
+@pytest.fixture
+def server_socket(tmp_path: str) -> Iterator[tuple[str, socket.socket]]:
+    """Return a listening socket path and the socket."""
+    path = str(tmp_path / "compile.sock")
+    sock = listen(path)
+    yield path, sock
+    sock.close()
+
+
+def test_round_trip(compiled: TranspiledCell) -> None:
+    """Test that decoding gives back the cell, its units and symbols."""
+    assert len(compiled.units) == 3
+    decoded = loads_cell(dumps_cell(compiled))
+    assert [i.codeobj for i in decoded.units] == [i.codeobj for i in compiled.units]
+    assert [i.line_offset for i in decoded.units] == [
+        i.line_offset for i in compiled.units
+    ]
+    assert [vars(i) for i in decoded.symbols] == [vars(i) for i in compiled.symbols]
+    assert decoded.units[1].source_map.jac_locs == compiled.units[1].source_map.jac_locs
+    assert loads_cell(dumps_cell(None)) is None
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        b"",
+        b"garbage",
+        pickle.dumps(TranspiledCell([])),
+        marshal.dumps(42),
+        marshal.dumps("cell"),
+        marshal.dumps(()),
+        marshal.dumps((None,) * 8),
+        # A string where the code object goes.
+        marshal.dumps(([], "", "print(1)", [], 0, [], None, [])),
+        # The same in a unit.
+        marshal.dumps(
+            ([], "", None, [([], "", "print(1)", [], 0, [], None, [])], 0, [], None, [])
+        ),
+        # Symbols and alerts of the wrong shape.
+        marshal.dumps(([], "", None, [], 0, [("f",)], None, [])),
+        marshal.dumps(([("msg",)], "", None, [], 0, [], None, [])),
+    ],
+)
+def test_rejects_other_payloads(payload: bytes) -> None:
+    """Test that anything but an encoded cell raises ValueError."""
+    with pytest.raises(ValueError):
+        loads_cell(payload)
+
+
+def test_rejects_truncated_and_tampered(compiled: TranspiledCell) -> None:
+    """Test that damaged cells either decode or raise ValueError."""
+    data = dumps_cell(compiled)
+    for size in range(0, len(data), 7):
+        with pytest.raises(ValueError):
+            loads_cell(data[:size])
+    rng = random.Random(0)
+    for _ in range(500):
+        tampered = bytearray(data)
+        for _ in range(rng.randint(1, 3)):
+            tampered[rng.randrange(len(tampered))] = rng.randrange(256)
+        try:
+            cell = loads_cell(bytes(tampered))
+        except ValueError:
+            continue
+        assert cell is None or isinstance(cell, TranspiledCell)
+
+
+def test_same_user() -> None:
+    """Test that both ends of a socket pair of this process are accepted."""
+    left, right = socket.socketpair()
+    with left, right:
+        assert same_user(left)
+        assert ipc.peer_uid(left) in (None, os.getuid())
+
+
+def test_other_user_is_refused(
+    other_user: None, server_socket: tuple[str, socket.socket]
+) -> None:
+    """Test that clients and the server refuse peers of another user."""
+    left, right = socket.socketpair()
+    with left, right:
+        assert not same_user(left)
+    path, listener = server_socket
+    # The listener still accepts, the check runs once connected.
+    assert connect(path, timeout=5) is None
+    server = CompileServer(listener)
+    try:
+        conn, _ = listener.accept()
+        with conn:
+            assert not server.verify_request(conn, None)
+    finally:
+        server.server_close()
+
+
+def test_foreign_socket_is_refused(
+    monkeypatch: pytest.MonkeyPatch, server_socket: tuple[str, socket.socket]
+) -> None:
+    """Test that a socket file of another user is not connected to."""
+    path, _ = server_socket
+    real_getuid = os.getuid
+    monkeypatch.setattr(os, "getuid", lambda: real_getuid() + 1)
+    assert connect(path, timeout=5) is None
+
+
+def test_client_compiles_locally_without_server(tmp_path: str) -> None:
+    """Test the fallback when nobody listens at the socket."""
+    client = CompileClient(str(tmp_path / "missing.sock"), retry_interval=60)
+    result = client(CELL, str(tmp_path))
+    assert not result.errors
+    assert result.codeobj is not None or result.units
+    assert client._sock is None
+    # The daemon is not tried again until the retry interval passed.
+    assert client._remote(CELL, str(tmp_path)) is None
+
+
+def test_client_compiles_locally_on_bad_reply(
+    tmp_path: str, server_socket: tuple[str, socket.socket]
+) -> None:
+    """Test that a reply that is not an encoded cell is never used."""
+    path, listener = server_socket
+
+    def serve() -> None:
+        # Once per connection attempt, the client reconnects once.
+        for _ in range(2):
+            conn, _ = listener.accept()
+            with conn:
+                recv_frame(conn)
+                send_frame(conn, pickle.dumps(TranspiledCell([])))
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    client = CompileClient(path, timeout=10)
+    result = client("with entry { print(1); }", str(tmp_path))
+    thread.join(10)
+    assert not result.errors
+    assert result.codeobj is not None
+    client.close()
@@ -0,0 +1,174 @@
+"""Tests for compiling the jac files cells import ahead of the imports."""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterator
+
+from jackernel import importer
+from jackernel.cache import configure_module_cache
+from jackernel.compiled import TransformError
+from jackernel.importer import (
+    compile_jac_file,
+    dependency_order,
+    import_graph,
+    is_compiled,
+    precompile_jac_files,
+)
+
+import pytest
+
+# main imports lib and util, lib imports util.
+TREE = {
+    "main.jac": "import:jac lib;\nimport:jac util;\n"
+    "can run() -> int { return lib.twice(util.one()); }\n",
+    "lib.jac": "import:jac util;\ncan twice(x: int) -> int { return 2 * x; }\n",
+    "util.jac": "can one() -> int { return 1; }\n",
+}
+
+
+@pytest.fixture
+def tree(tmp_path: str) -> Iterator[Callable[[dict], list]]:
+    """Return a function writing jac files, with an empty module cache."""
+    directory = tmp_path / "tree"
+    directory.mkdir()
+    configure_module_cache(str(tmp_path / "cache"))
+
+    def write(files: dict) -> list:
+        for name, source in files.items():
+            (directory / name).write_text(source)
+        return [str(directory / i) for i in files]
+
+    yield write
+    configure_module_cache()
+
+
+class ThreadPool(ThreadPoolExecutor):
+    """A process pool stand in, recording that it was started."""
+
+    started: list = []
+
+    def __init__(self, jobs: int, mp_context: object) -> None:
+        """Initialize the pool, in threads instead of processes."""
+        super().__init__(jobs)
+        self.started.append(jobs)
+
+
+class BrokenPool(ThreadPool):
+    """A pool whose workers all died."""
+
+    def submit(self, *args: object, **kwargs: object) -> None:
+        """Fail as a pool does when a worker was killed."""
+        raise BrokenProcessPool("A worker died.")
+
+
+def graph(edges: dict) -> dict:
+    """Return an `import_graph` with the given imports and no sources."""
+    return {path: ("", deps) for path, deps in edges.items()}
+
+
+@pytest.mark.parametrize(
+    "edges, expected",
+    [
+        ({}, []),
+        ({"a": []}, ["a"]),
+        ({"a": ["b"], "b": ["c"], "c": []}, ["c", "b", "a"]),
+        ({"a": ["b", "c"], "b": ["c"], "c": []}, ["c", "b", "a"]),
+        ({"c": [], "a": ["b"], "b": []}, ["c", "b", "a"]),
+        # Files left out of the graph, cached or unreadable, are skipped.
+        ({"a": ["missing", "b"], "b": ["missing"]}, ["b", "a"]),
+        # Cycles are broken where they are entered.
+        ({"a": ["b"], "b": ["a"]}, ["b", "a"]),
+        ({"a": ["a"]}, ["a"]),
+        ({"a": ["b"], "b": ["c"], "c": ["a"], "d": ["c"]}, ["c", "b", "a", "d"]),
+    ],
+)
+def test_dependency_order(edges: dict, expected: list) -> None:
+    """Test that files come after their imports, each once."""
+    assert dependency_order(graph(edges)) == expected
+
+
+def test_import_graph(tree: Callable[[dict], list]) -> None:
+    """Test that cached and unreadable files are not followed."""
+    main, lib, util = tree(TREE)
+    missing = os.path.join(os.path.dirname(main), "missing.jac")
+    found = import_graph([main, missing])
+    assert {i: found[i][1] for i in found} == {
+        main: [lib, util],
+        lib: [util],
+        util: [],
+    }
+    compile_jac_file(lib, TREE["lib.jac"])
+    found = import_graph([main], importer.module_cache())
+    assert sorted(found) == [main, util]
+
+
+@pytest.mark.parametrize(
+    "min_source, jobs, pool",
+    [
+        (importer.PARALLEL_COMPILE_MIN_SOURCE, 4, []),
+        (0, 4, [3]),
+        (0, 1, []),
+    ],
+)
+def test_pool_threshold(
+    monkeypatch: pytest.MonkeyPatch,
+    tree: Callable[[dict], list],
+    min_source: int,
+    jobs: int,
+    pool: list,
+) -> None:
+    """Test that only enough source to compile starts a pool."""
+    monkeypatch.setattr(importer, "PARALLEL_COMPILE_MIN_SOURCE", min_source)
+    monkeypatch.setattr(importer, "ProcessPoolExecutor", ThreadPool)
+    monkeypatch.setattr(ThreadPool, "started", [])
+    paths = tree(TREE)
+    assert precompile_jac_files(paths[:1], jobs) == 3
+    assert ThreadPool.started == pool
+    assert all(is_compiled(i) for i in paths)
+    assert precompile_jac_files(paths[:1], jobs) == 0
+
+
+def test_failing_files_are_left_out(
+    monkeypatch: pytest.MonkeyPatch, tree: Callable[[dict], list]
+) -> None:
+    """Test that a file failing to compile is reported by its import only."""
+    monkeypatch.setattr(importer, "PARALLEL_COMPILE_MIN_SOURCE", 0)
+    monkeypatch.setattr(importer, "ProcessPoolExecutor", ThreadPool)
+    broken = {**TREE, "lib.jac": TREE["lib.jac"].replace("2 * x", "2 *")}
+    main, lib, util = tree(broken)
+    # main compiles lib with it, and fails too.
+    assert precompile_jac_files([main], 2) == 1
+    assert [is_compiled(i) for i in (main, lib, util)] == [False, False, True]
+    with pytest.raises(TransformError, match="lib.jac failed to compile"):
+        compile_jac_file(lib, broken["lib.jac"])
+
+
+def test_broken_pool_is_logged(
+    monkeypatch: pytest.MonkeyPatch,
+    tree: Callable[[dict], list],
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """Test that a pool failing leaves the files to the imports."""
+    monkeypatch.setattr(importer, "PARALLEL_COMPILE_MIN_SOURCE", 0)
+    monkeypatch.setattr(importer, "ProcessPoolExecutor", BrokenPool)
+    paths = tree(TREE)
+    with caplog.at_level(logging.WARNING):
+        assert precompile_jac_files(paths[:1], 2) == 0
+    assert "Parallel compilation failed" in caplog.text
+    assert not any(is_compiled(i) for i in paths)
+
+
+def test_process_pool_fills_module_cache(
+    monkeypatch: pytest.MonkeyPatch, tree: Callable[[dict], list]
+) -> None:
+    """Test compiling on the forkserver pool, the files it compiled are cached."""
+    monkeypatch.setattr(importer, "PARALLEL_COMPILE_MIN_SOURCE", 0)
+    # The forkserver starts with the environment of the tests.
+    root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    monkeypatch.setenv(
+        "PYTHONPATH", os.pathsep.join(filter(None, [root, os.getenv("PYTHONPATH")]))
+    )
+    paths = tree(TREE)
+    assert precompile_jac_files(paths[:1], 2) == 3
+    assert all(is_compiled(i) for i in paths)
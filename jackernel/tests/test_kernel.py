@@ -0,0 +1,161 @@
+"""Tests for running cells the way the kernel does."""
+import copy
+import os
+import pickle
+import subprocess
+import sys
+import time
+import types
+from typing import Iterator
+
+from jackernel.cache import configure_module_cache
+from jackernel.execute import CellError, exec_jac
+
+from jupyter_client import BlockingKernelClient, KernelManager
+from jupyter_client.kernelspec import KernelSpec
+
+import pytest
+
+
+def test_jac_gen_goes_to_gen_dir(tmp_path: str) -> None:
+    """Test that generated python is not written next to the notebook."""
+    notebook, gen_dir = tmp_path / "notebook", tmp_path / "gen"
+    notebook.mkdir()
+    gen_dir.mkdir()
+    (notebook / "lib.jac").write_text("can f() -> int { return 3; }\n")
+    configure_module_cache(str(tmp_path / "cache"))
+    try:
+        output = exec_jac(
+            "import:jac lib;\nwith entry { print(lib.f()); }",
+            types.ModuleType("session"),
+            to_disk=True,
+            caller_dir=str(notebook),
+            gen_dir=str(gen_dir),
+        )
+    finally:
+        configure_module_cache()
+        sys.modules.pop("lib", None)
+    assert output == "3\n"
+    assert os.listdir(notebook) == ["lib.jac"]
+    assert "session.py" in os.listdir(gen_dir / "__jac_gen__")
+
+
+def test_cell_error_copies() -> None:
+    """Test that cell errors keep what the reply needs through pickling."""
+    with pytest.raises(CellError) as info:
+        exec_jac('with entry { print("a"); x = [][0]; }')
+    error = info.value
+    assert str(error) == "IndexError: list index out of range"
+    for other in (pickle.loads(pickle.dumps(error)), copy.copy(error)):
+        assert type(other) is CellError
+        assert str(other) == str(error)
+        assert vars(other) == vars(error)
+        assert other.output == "a\n"
+
+
+def test_session_does_not_load_jupyter() -> None:
+    """Test that running cells in process needs jaclang alone."""
+    probe = (
+        "import sys, jackernel.session; "
+        "print(sorted({i.split('.')[0] for i in sys.modules} & %r))"
+        % {"ipykernel", "jupyter_client", "traitlets", "zmq"}
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", probe], check=True, capture_output=True, text=True
+    )
+    assert out.stdout.strip() == "[]"
+
+
+@pytest.fixture(scope="module")
+def kernel_client() -> Iterator[BlockingKernelClient]:
+    """Start a jac kernel and return a client connected to it."""
+    manager = KernelManager()
+    manager._kernel_spec = KernelSpec(
+        argv=[
+            sys.executable,
+            "-Xfrozen_modules=off",
+            "-m",
+            "jackernel.kernel",
+            "-f",
+            "{connection_file}",
+        ],
+        display_name="Jac",
+        language="jac",
+    )
+    root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    manager.start_kernel(
+        env={
+            **os.environ,
+            "PYTHONPATH": root,
+            "PYDEVD_DISABLE_FILE_VALIDATION": "1",
+        }
+    )
+    client = manager.client()
+    client.start_channels()
+    try:
+        client.wait_for_ready(timeout=60)
+        yield client
+    finally:
+        client.stop_channels()
+        manager.shutdown_kernel(now=True)
+
+
+def iopub_until_idle(client: BlockingKernelClient, msg_id: str) -> list:
+    """Return the iopub messages up to the idle status for `msg_id`."""
+    messages = []
+    while True:
+        msg = client.get_iopub_msg(timeout=30)
+        messages.append(msg)
+        if (
+            msg["msg_type"] == "status"
+            and msg["content"]["execution_state"] == "idle"
+            and msg["parent_header"].get("msg_id") == msg_id
+        ):
+            return messages
+
+
+def test_complete_while_cell_runs(kernel_client: BlockingKernelClient) -> None:
+    """Test that completion is answered, with busy and idle, during a cell."""
+    execute_id = kernel_client.execute(
+        'import:py time;\nwith entry { time.sleep(2); print("done"); }'
+    )
+    time.sleep(0.5)
+    complete_id = kernel_client.complete("pri", 3)
+    reply = kernel_client.get_shell_msg(timeout=10)
+    assert reply["parent_header"]["msg_id"] == complete_id
+    assert "print" in reply["content"]["matches"]
+
+    messages = iopub_until_idle(kernel_client, execute_id)
+    states = [
+        (i["parent_header"].get("msg_id"), i["content"]["execution_state"])
+        for i in messages
+        if i["msg_type"] == "status"
+    ]
+    assert states == [
+        (execute_id, "busy"),
+        (complete_id, "busy"),
+        (complete_id, "idle"),
+        (execute_id, "idle"),
+    ]
+    streams = [i for i in messages if i["msg_type"] == "stream"]
+    assert [i["content"]["text"] for i in streams] == ["done\n"]
+    assert streams[0]["parent_header"]["msg_id"] == execute_id
+    assert kernel_client.get_shell_msg(timeout=10)["content"]["status"] == "ok"
+
+
+def test_interrupt_cell(kernel_client: BlockingKernelClient) -> None:
+    """Test that an interrupted cell fails and the next one runs."""
+    # Not stopping on the error, or the next cell may be aborted with it.
+    msg_id = kernel_client.execute(
+        "with entry { while True { x = 1; } }", stop_on_error=False
+    )
+    time.sleep(1)
+    kernel_client.parent.interrupt_kernel()
+    reply = kernel_client.get_shell_msg(timeout=10)
+    assert reply["parent_header"]["msg_id"] == msg_id
+    assert reply["content"]["ename"] == "KeyboardInterrupt"
+    iopub_until_idle(kernel_client, msg_id)
+    reply = kernel_client.execute_interactive(
+        "with entry { print(1); }", output_hook=lambda msg: None, timeout=30
+    )
+    assert reply["content"]["status"] == "ok"
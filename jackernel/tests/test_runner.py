@@ -0,0 +1,86 @@
+"""Tests for running notebooks and jac files without a Jupyter server."""
+import json
+import os
+
+from jackernel.runner import main, run
+
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+NOTEBOOK = os.path.join(FIXTURES, "notebook.ipynb")
+HELLO = os.path.join(FIXTURES, "hello.jac")
+
+ERROR = {
+    "output_type": "error",
+    "ename": "IndexError",
+    "evalue": "list index out of range",
+    "traceback": [
+        "Traceback (most recent call last):",
+        "  In [2], line 3",
+        "    x = [][0];",
+        "IndexError: list index out of range",
+    ],
+}
+
+
+def outputs(path: str) -> list:
+    """Return the execution counts and outputs of the code cells."""
+    with open(path) as f:
+        cells = json.load(f)["cells"]
+    return [
+        (i["execution_count"], i["outputs"]) for i in cells if i["cell_type"] == "code"
+    ]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_stops_at_failing_cell(tmp_path: str, jobs: int) -> None:
+    """Test the outputs written, compiled in process or on a pool."""
+    with open(NOTEBOOK) as f:
+        original = f.read()
+    assert run([NOTEBOOK], jobs, output_dir=str(tmp_path)) == 1
+    assert outputs(str(tmp_path / "notebook.ipynb")) == [
+        (1, [{"output_type": "stream", "name": "stdout", "text": "ok\n"}]),
+        (2, [{"output_type": "stream", "name": "stdout", "text": "before\n"}, ERROR]),
+        # Not run, and without the outputs of an earlier run.
+        (None, []),
+    ]
+    with open(NOTEBOOK) as f:
+        assert f.read() == original
+
+
+def test_allow_errors(tmp_path: str) -> None:
+    """Test that the cells after a failing one still run."""
+    assert run([NOTEBOOK], 1, allow_errors=True, output_dir=str(tmp_path)) == 1
+    assert outputs(str(tmp_path / "notebook.ipynb"))[2] == (
+        3,
+        [{"output_type": "stream", "name": "stdout", "text": "after\n"}],
+    )
+
+
+def test_jac_file(capsys: pytest.CaptureFixture) -> None:
+    """Test that a passing jac file prints to the terminal and returns 0."""
+    assert main([HELLO, "--jobs", "1"]) == 0
+    assert capsys.readouterr().out == "hello\n"
+
+
+def test_failing_jac_file(tmp_path: str, capsys: pytest.CaptureFixture) -> None:
+    """Test that a failing jac file prints its traceback and returns 1."""
+    script = tmp_path / "failing.jac"
+    script.write_text('with entry {\n    print("before");\n    x = [][0];\n}\n')
+    assert main([str(script), HELLO, "--jobs", "1"]) == 1
+    captured = capsys.readouterr()
+    # The other inputs still run.
+    assert captured.out == "before\nhello\n"
+    assert captured.err.splitlines()[-2:] == [
+        "    x = [][0];",
+        "IndexError: list index out of range",
+    ]
+
+
+def test_main_writes_notebooks(tmp_path: str, capsys: pytest.CaptureFixture) -> None:
+    """Test the command line, its return code and what it reports."""
+    output_dir = tmp_path / "out"
+    assert main([NOTEBOOK, "--jobs", "1", "--output-dir", str(output_dir)]) == 1
+    path = str(output_dir / "notebook.ipynb")
+    assert capsys.readouterr().err == f"failed {path}\n"
+    assert outputs(path)[1][1][-1] == ERROR
@@ -0,0 +1,119 @@
+"""Tests for the structural scanner of jac cells."""
+from jackernel.scanner import (
+    cell_status,
+    is_out_of_line_def,
+    jac_imports,
+    split_elements,
+)
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "cell, expected",
+    [
+        ("", []),
+        ("   \n\n", []),
+        ("can f() { return 1; }", [(1, "can f() { return 1; }")]),
+        (
+            "global a = 1;\nglobal b = {1: 2};",
+            [(1, "global a = 1;"), (2, "global b = {1: 2};")],
+        ),
+        ("\n\nglobal a = 1;", [(3, "global a = 1;")]),
+        (
+            '"""Doc."""\nobject A { has x: int = 1; }\nwith entry { print(1); }',
+            [
+                (1, '"""Doc."""\nobject A { has x: int = 1; }'),
+                (3, "with entry { print(1); }"),
+            ],
+        ),
+        ("# note\nglobal a = 1;", [(1, "# note\nglobal a = 1;")]),
+        ('with entry { print("}"); }', [(1, 'with entry { print("}"); }')]),
+        ("with entry { print('{;'); }", [(1, "with entry { print('{;'); }")]),
+        (
+            "#* } ; *#\nglobal a = 1;",
+            [(1, "#* } ; *#\nglobal a = 1;")],
+        ),
+        (
+            "::py::\nx = {1}\n::py::\nglobal a = 1;",
+            [(1, "::py::\nx = {1}\n::py::"), (4, "global a = 1;")],
+        ),
+        ("global a = {1: {2: 3}};", [(1, "global a = {1: {2: 3}};")]),
+        ("global a = 1;\ncan f() {", [(1, "global a = 1;"), (2, "can f() {")]),
+        (
+            "can f() {\n    return 1;\n}\n\ncan g() {\n    return 2;\n}",
+            [
+                (1, "can f() {\n    return 1;\n}"),
+                (5, "can g() {\n    return 2;\n}"),
+            ],
+        ),
+    ],
+)
+def test_split_elements(cell: str, expected: list) -> None:
+    """Test that cells split into their top level elements and lines."""
+    assert split_elements(cell) == expected
+
+
+@pytest.mark.parametrize(
+    "cell, expected",
+    [
+        ("", ("complete", 0)),
+        ("global a = 1;", ("complete", 0)),
+        ("global a = 1; # trailing", ("complete", 0)),
+        ("with entry { print(1); }", ("complete", 0)),
+        ("::py::\nx = 1\n::py::", ("complete", 0)),
+        ("global a = 1", ("incomplete", 0)),
+        ("import:jac lib", ("incomplete", 0)),
+        ("with entry {", ("incomplete", 1)),
+        ("can f() {\n    if x {", ("incomplete", 2)),
+        ("global a = [1,\n", ("incomplete", 1)),
+        ('"""Doc', ("incomplete", 0)),
+        ("#* block", ("incomplete", 0)),
+        ("::py::\nx = 1", ("incomplete", 0)),
+        ("}", ("invalid", 0)),
+        ("with entry { print(1); }}", ("invalid", 0)),
+        ('with entry { print("abc); }', ("invalid", 2)),
+    ],
+)
+def test_cell_status(cell: str, expected: tuple) -> None:
+    """Test that unfinished and invalid cells are told apart."""
+    assert cell_status(cell) == expected
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        ("", []),
+        ("import:jac lib;", ["lib"]),
+        ("include:jac pkg.shapes;", ["pkg.shapes"]),
+        ("import : jac  lib;", ["lib"]),
+        ("import:py os;", []),
+        (
+            '"""Doc."""\nimport:jac a;\nglobal x = 1;\ninclude:jac b.c;',
+            ["a", "b.c"],
+        ),
+        ("# import:jac a;\nglobal x = 1;", []),
+        ("with entry { import_x = 1; }", []),
+        ("global imports = 1;", []),
+    ],
+)
+def test_jac_imports(source: str, expected: list) -> None:
+    """Test that only top level jac imports are listed, in order."""
+    assert jac_imports(source) == expected
+
+
+@pytest.mark.parametrize(
+    "element, expected",
+    [
+        (":walker:a:can:b { }", True),
+        ("  :can:f { }", True),
+        ('"""Doc."""\n:object:A:can:f { }', True),
+        ("# note\n:can:f { }", True),
+        ("can f() { }", False),
+        ("::py::\nx = 1\n::py::", False),
+        ("global a = {1: 2};", False),
+    ],
+)
+def test_is_out_of_line_def(element: str, expected: bool) -> None:
+    """Test that out of line definitions are recognized."""
+    assert is_out_of_line_def(element) is expected
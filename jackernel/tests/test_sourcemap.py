@@ -0,0 +1,139 @@
+"""Tests for mapping generated python back to jac lines."""
+import os
+import sys
+import traceback
+from typing import Iterator
+
+from jackernel import sourcemap
+from jackernel.cache import configure_module_cache
+from jackernel.execute import CellError, exec_jac
+from jackernel.sourcemap import SourceMap, jac_traceback, register
+
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+FAILING = os.path.join(FIXTURES, "failing.jac")
+
+
+@pytest.fixture
+def module_cache(tmp_path: str) -> Iterator[None]:
+    """Keep the jac files the tests import in a temporary module cache."""
+    configure_module_cache(str(tmp_path))
+    yield
+    configure_module_cache()
+    sys.modules.pop("failing", None)
+
+
+@pytest.mark.parametrize(
+    "py_code, py_lines, jac_locs, mod_paths",
+    [
+        ("", [], [], []),
+        ("x = 1\n", [], [], []),
+        (
+            "x = 1  # 0 1\ny = 2  # 0 1\nz = 3  # 0 2\n",
+            [1, 3],
+            [(0, 1), (0, 2)],
+            [],
+        ),
+        (
+            "from __future__ import annotations\nx = [\n  1]  # 0 3\n",
+            [3],
+            [(0, 3)],
+            [],
+        ),
+        (
+            "import lib  # -1 0\ny = lib.f()  # 0 2\n",
+            [1, 2],
+            [(-1, 0), (0, 2)],
+            [],
+        ),
+        (
+            'x = 1  # 1 5\nr""" JAC DEBUG INFO\n/a/<cell>\n/a/lib.jac\n'
+            'JAC DEBUG INFO """',
+            [1],
+            [(1, 5)],
+            ["/a/<cell>", "/a/lib.jac"],
+        ),
+    ],
+)
+def test_from_generated(
+    py_code: str, py_lines: list, jac_locs: list, mod_paths: list
+) -> None:
+    """Test that line comments are read into run length encoded lists."""
+    source_map = SourceMap.from_generated(py_code)
+    assert source_map.py_lines == py_lines
+    assert source_map.jac_locs == jac_locs
+    assert source_map.mod_paths == mod_paths
+
+
+@pytest.mark.parametrize(
+    "py_line, expected",
+    [(1, None), (2, (0, 1)), (4, (0, 1)), (5, (1, 4)), (100, (1, 4))],
+)
+def test_lookup(py_line: int, expected: tuple) -> None:
+    """Test that python lines map to the jac location in effect there."""
+    source_map = SourceMap([2, 5], [(0, 1), (1, 4)], [])
+    assert source_map.lookup(py_line) == expected
+
+
+@pytest.mark.parametrize(
+    "cell, expected",
+    [
+        (
+            "can boom(x: int) -> int {\n    return [1][x];\n}\n"
+            "with entry { boom(3); }",
+            [
+                "Traceback (most recent call last):",
+                "  In [1], line 4",
+                "    with entry { boom(3); }",
+                "  In [1], line 2, in boom",
+                "    return [1][x];",
+                "IndexError: list index out of range",
+            ],
+        ),
+        (
+            "import:jac failing;\nwith entry {\n    failing.first([]);\n}",
+            [
+                "Traceback (most recent call last):",
+                "  In [1], line 3",
+                "    failing.first([]);",
+                f'  File "{FAILING}", line 4, in first',
+                "    return items[0];",
+                "IndexError: list index out of range",
+            ],
+        ),
+        (
+            'with entry {\n    x = 1;\n    raise ValueError("bad " + str(x));\n}',
+            [
+                "Traceback (most recent call last):",
+                "  In [1], line 3",
+                '    raise ValueError("bad " + str(x));',
+                "ValueError: bad 1",
+            ],
+        ),
+    ],
+)
+def test_cell_traceback(module_cache: None, cell: str, expected: list) -> None:
+    """Test that tracebacks show cell and jac file lines, not the kernel."""
+    with pytest.raises(CellError) as info:
+        exec_jac(cell, caller_dir=FIXTURES, cell_name="In [1]")
+    assert info.value.traceback == expected
+
+
+def test_python_traceback() -> None:
+    """Test that errors outside of cells keep the python traceback."""
+    try:
+        int("x")
+    except ValueError as e:
+        lines = jac_traceback(e)
+        expected = "".join(traceback.format_exception(e)).rstrip("\n").splitlines()
+    assert lines == expected
+
+
+def test_registry_is_bounded() -> None:
+    """Test that only the last `REGISTRY_SIZE` cells are kept."""
+    source_map = SourceMap([1], [(0, 1)], [])
+    for i in range(sourcemap.REGISTRY_SIZE + 1):
+        register(f"<test-cell-{i}>", source_map, "x = 1;", f"In [{i}]", 0)
+    assert sourcemap._registry.get("<test-cell-0>") is None
+    assert sourcemap._registry.get("<test-cell-1>") is not None
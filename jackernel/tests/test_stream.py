@@ -0,0 +1,116 @@
+"""Tests for forwarding cell output in batches."""
+import ctypes
+import threading
+import time
+import types
+
+from jackernel.cache import LRUCache
+from jackernel.execute import CellError, exec_jac
+from jackernel.stream import OutputStream
+
+import pytest
+
+
+class Sent(list):
+    """Batches sent by a stream, as (name, text) pairs."""
+
+    def __call__(self, name: str, text: str) -> None:
+        """Record a batch."""
+        self.append((name, text))
+
+    def text(self) -> str:
+        """Return everything sent."""
+        return "".join(i[1] for i in self)
+
+
+def test_large_output_is_sent_at_once() -> None:
+    """Test that reaching the size limit flushes without waiting."""
+    sent = Sent()
+    stream = OutputStream("stdout", sent, max_buffer=10, flush_interval=60)
+    stream.write("abc")
+    assert sent == []
+    stream.write("x" * 20)
+    assert sent == [("stdout", "abc" + "x" * 20)]
+    stream.write("y" * 10)
+    assert sent[-1] == ("stdout", "y" * 10)
+    assert stream._timer is None
+
+
+def test_small_writes_are_merged() -> None:
+    """Test that small writes go out as one batch once the timer fires."""
+    sent = Sent()
+    stream = OutputStream("stderr", sent, flush_interval=0.1)
+    for i in range(100):
+        stream.write(f"{i}\n")
+    assert sent == []
+    deadline = time.monotonic() + 10
+    while not sent and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sent == [("stderr", "".join(f"{i}\n" for i in range(100)))]
+    stream.write("late\n")
+    stream.close()
+    assert sent[-1] == ("stderr", "late\n")
+
+
+def test_write_rejects_bytes() -> None:
+    """Test that only text can be written, as for sys.stdout."""
+    with pytest.raises(TypeError):
+        OutputStream("stdout", Sent()).write(b"x")
+
+
+@pytest.mark.parametrize(
+    "cell, error, expected",
+    [
+        (
+            'with entry { print("a"); print("b", file=sys.stderr); }',
+            None,
+            [("stderr", "b\n"), ("stdout", "a\n")],
+        ),
+        (
+            'with entry { print("a"); raise ValueError("b"); }',
+            "ValueError",
+            [("stdout", "a\n")],
+        ),
+    ],
+)
+def test_sent_when_cell_ends(cell: str, error: str, expected: list) -> None:
+    """Test that nothing is left buffered once a cell returned or raised."""
+    sent = Sent()
+    try:
+        exec_jac("import:py sys;\n" + cell, send_stream=sent, cache=LRUCache())
+    except CellError as e:
+        assert e.ename == error
+    else:
+        assert error is None
+    assert sent == expected
+
+
+def test_not_lost_on_interrupt() -> None:
+    """Test that output printed before a KeyboardInterrupt is all sent."""
+    sent, module = Sent(), types.ModuleType("session")
+    raised: list = []
+
+    def run() -> None:
+        try:
+            exec_jac(
+                "with entry {\n    i = 0;\n    while True { print(i); i += 1; }\n}",
+                module,
+                send_stream=sent,
+                cache=LRUCache(),
+            )
+        except (CellError, KeyboardInterrupt) as e:
+            raised.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while getattr(module, "i", 0) < 10_000 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread.ident), ctypes.py_object(KeyboardInterrupt)
+    )
+    thread.join(10)
+    assert [type(i) for i in raised] == [KeyboardInterrupt]
+    lines = sent.text().splitlines()
+    assert lines == [str(i) for i in range(len(lines))]
+    assert len(lines) >= module.i
@@ -0,0 +1,141 @@
+"""Tests for the session symbol index and the symbols of compiled cells."""
+import os
+
+from jackernel.symbols import Symbol, SymbolIndex, describe_symbol
+from jackernel.transpiler import transpile_jac_blue
+
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+CELL = '''object Circle {
+    """The radius."""
+    has radius: float = 1.0;
+
+    can area(scale: float) -> float {
+        return 3.14 * self.radius * scale;
+    }
+}
+
+"""Double it."""
+can double(x: int) -> int { return 2 * x; }
+
+global ratio = 0.5;
+'''
+
+
+@pytest.fixture
+def index() -> SymbolIndex:
+    """Return an index with two architypes and a few top level names."""
+    index = SymbolIndex()
+    index.update(
+        [
+            Symbol("Circle", "architype", line=1),
+            Symbol("radius", "field", "Circle"),
+            Symbol("area", "ability", "Circle"),
+            Symbol("Square", "architype"),
+            Symbol("side", "field", "Square"),
+            Symbol("area", "ability", "Square", signature="can area() -> float"),
+            Symbol("double", "ability"),
+            Symbol("data", "global"),
+        ],
+        origin="In [1]",
+    )
+    return index
+
+
+@pytest.mark.parametrize(
+    "prefix, owner, expected",
+    [
+        ("da", None, ["data"]),
+        ("pri", None, ["print"]),
+        ("do", None, ["double"]),
+        ("Ci", None, ["Circle"]),
+        ("zz", None, []),
+        ("", "Circle", ["area", "radius"]),
+        ("r", "Circle", ["radius"]),
+        ("s", "Circle", []),
+        ("", "Square", ["area", "side"]),
+        ("", "unknown", ["area", "radius", "side"]),
+        ("s", "unknown", ["side"]),
+    ],
+)
+def test_complete(index: SymbolIndex, prefix: str, owner: str, expected: list) -> None:
+    """Test completion of top level names and architype members."""
+    assert index.complete(prefix, owner) == expected
+
+
+@pytest.mark.parametrize(
+    "name, owner, kind, found_owner",
+    [
+        ("Circle", None, "architype", None),
+        ("print", None, "builtin", None),
+        ("radius", "Circle", "field", "Circle"),
+        ("side", "Circle", None, None),
+        ("side", "unknown", "field", "Square"),
+        ("missing", None, None, None),
+    ],
+)
+def test_get(
+    index: SymbolIndex, name: str, owner: str, kind: str, found_owner: str
+) -> None:
+    """Test lookups, members of unknown owners come from any architype."""
+    symbol = index.get(name, owner)
+    assert (symbol and symbol.kind) == kind
+    assert (symbol and symbol.owner) == found_owner
+
+
+def test_redefined_architype_drops_members(index: SymbolIndex) -> None:
+    """Test that redefining an architype starts with no members."""
+    size = len(index)
+    index.update([Symbol("Circle", "architype"), Symbol("diameter", "field", "Circle")])
+    assert index.complete("", "Circle") == ["diameter"]
+    assert index.complete("ra", "unknown") == []
+    assert len(index) == size
+
+
+def test_update_keeps_cached_symbols(index: SymbolIndex) -> None:
+    """Test that the origin is set on copies, compiled cells are cached."""
+    symbol = Symbol("triple", "ability", line=2)
+    index.update([symbol], origin="In [2]")
+    assert symbol.origin == ""
+    assert index.get("triple").origin == "In [2]"
+
+
+def test_describe_symbol(index: SymbolIndex) -> None:
+    """Test the inspection text of cell symbols and builtins."""
+    assert describe_symbol(index.get("Circle")) == (
+        "Signature: Circle\nType:      architype\nDefined:   In [1], line 1"
+    )
+    assert describe_symbol(index.get("area", "Square")).splitlines() == [
+        "Signature: can area() -> float",
+        "Type:      ability of Square",
+    ]
+    text = describe_symbol(index.get("len"))
+    assert text.startswith("Signature: len(obj, /)\nType:      builtin\n")
+    assert "Docstring:" in text
+
+
+def test_compiled_cell_symbols() -> None:
+    """Test the symbols collected from a compiled cell."""
+    result = transpile_jac_blue(CELL, FIXTURES)
+    assert not result.errors
+    found = [
+        (i.name, i.kind, i.owner, i.signature, i.doc, i.line) for i in result.symbols
+    ]
+    assert found == [
+        ("Circle", "architype", None, "object Circle", "", 1),
+        ("radius", "field", "Circle", "has radius: float = 1.0", "The radius.", 3),
+        ("area", "ability", "Circle", "can area(scale: float) -> float", "", 5),
+        ("double", "ability", None, "can double(x: int) -> int", "Double it.", 11),
+        ("ratio", "global", None, "ratio = 0.5", "", 13),
+    ]
+
+
+def test_included_names_are_not_cell_symbols() -> None:
+    """Test that names included from a jac file are left out."""
+    result = transpile_jac_blue(
+        "include:jac shapes;\ncan g() -> int { return 1; }", FIXTURES
+    )
+    assert not result.errors
+    assert [(i.name, i.line) for i in result.symbols] == [("g", 2)]
@@ -0,0 +1,156 @@
+"""Tests for compiling cells one top level element at a time."""
+import copy
+import os
+import pickle
+import sys
+import types
+from typing import Iterator
+
+from jackernel.cache import LRUCache, configure_module_cache
+from jackernel.compiled import TransformError
+from jackernel.execute import CellError, exec_jac
+from jackernel.transpiler import transpile_jac_blue, transpile_jac_elements
+
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+SHAPES = '''"""Shapes."""
+object Circle {
+    has radius: float = 1.0;
+}
+
+"""Double it."""
+can double(x: int) -> int {
+    return 2 * x;
+}
+
+can first(items: list) -> int {
+    return items[0];
+}
+'''
+
+
+@pytest.fixture
+def module_cache(tmp_path: str) -> Iterator[None]:
+    """Keep the jac files the tests import in a temporary module cache."""
+    configure_module_cache(str(tmp_path))
+    yield
+    configure_module_cache()
+    sys.modules.pop("shapes", None)
+
+
+def test_only_edited_element_is_compiled() -> None:
+    """Test that unchanged elements come from the cache."""
+    cache = LRUCache()
+    before = transpile_jac_elements(SHAPES, FIXTURES, cache)
+    assert len(before.units) == 3
+    assert cache.stats()["misses"] == 3
+
+    edited = SHAPES.replace("2 * x", "3 * x")
+    after = transpile_jac_elements(edited, FIXTURES, cache)
+    assert cache.stats()["misses"] == 4
+    assert after.units[0].codeobj is before.units[0].codeobj
+    assert after.units[1].codeobj is not before.units[1].codeobj
+    assert after.units[2].codeobj is before.units[2].codeobj
+
+
+@pytest.mark.parametrize(
+    "head, shift",
+    [
+        ("", 0),
+        ("global a = 1;\n\n", 2),
+        ('global a = {\n    "x": 1\n};\n\n', 4),
+    ],
+)
+def test_lines_follow_earlier_elements(head: str, shift: int) -> None:
+    """Test symbol lines and traceback lines after elements before them grew."""
+    cell = head + SHAPES + "with entry { first([]); }\n"
+    result = transpile_jac_elements(cell, FIXTURES, LRUCache())
+    assert len(result.units) == (5 if head else 4)
+    found = {i.name: (i.line, i.doc) for i in result.symbols}
+    # Only a docstring starting the cell is the module's.
+    assert found["Circle"] == (shift + 2, "Shapes." if head else "")
+    assert found["double"] == (shift + 7, "Double it.")
+    assert found["first"] == (shift + 11, "")
+
+    with pytest.raises(CellError) as info:
+        exec_jac(cell, cache=LRUCache(), caller_dir=FIXTURES, cell_name="In [1]")
+    assert info.value.traceback[1:5] == [
+        f"  In [1], line {shift + 14}",
+        "    with entry { first([]); }",
+        f"  In [1], line {shift + 12}, in first",
+        "    return items[0];",
+    ]
+
+
+def test_docstrings_as_in_whole_cell() -> None:
+    """Test that only the docstring starting the cell is the module's."""
+    module = types.ModuleType("session")
+    exec_jac(SHAPES, module, cache=LRUCache(), caller_dir=FIXTURES)
+    assert module.__doc__ == "Shapes."
+    assert module.double.__doc__ == "Double it."
+    whole = transpile_jac_blue(SHAPES, FIXTURES)
+    elements = transpile_jac_elements(SHAPES, FIXTURES, LRUCache())
+    assert [vars(i) for i in elements.symbols] == [vars(i) for i in whole.symbols]
+
+    exec_jac("with entry { x = 1; }", module, caller_dir=FIXTURES)
+    assert module.__doc__ == "Shapes."
+
+
+@pytest.mark.parametrize(
+    "cell, expected",
+    [
+        # Out of line definitions need their declaration in the same module.
+        (
+            "object Greeter {\n    can greet() -> str;\n}\n\n"
+            ':object:Greeter:ability:greet -> str {\n    return "hi";\n}\n\n'
+            "with entry { print(Greeter().greet()); }",
+            "hi\n",
+        ),
+        # A single element is compiled as it is.
+        ("with entry { print(1); }", "1\n"),
+    ],
+)
+def test_whole_cell_fallback(cell: str, expected: str) -> None:
+    """Test the cells compiled as a whole instead of element by element."""
+    cache = LRUCache()
+    result = transpile_jac_elements(cell, FIXTURES, cache)
+    assert not result.errors
+    assert result.units == []
+    assert len(cache) == 0
+    assert exec_jac(cell, cache=LRUCache(), caller_dir=FIXTURES) == expected
+
+
+def test_syntax_error_refers_to_cell_lines() -> None:
+    """Test that an element failing to compile reports the line in the cell."""
+    cell = SHAPES.replace("return 2 * x;", "return 2 * ;")
+    cache = LRUCache()
+    result = transpile_jac_elements(cell, FIXTURES, cache)
+    assert result.units == []
+    assert [i.line for i in result.errors] == [8]
+    assert "*8: \t    return 2 * ;" in result.errors[0].excerpt()
+    # The elements compiled before the failing one are kept.
+    assert len(cache) == 1
+
+
+def test_transform_error_copies() -> None:
+    """Test that compile errors keep their alerts through pickling and copying."""
+    cell = SHAPES.replace("return 2 * x;", "return 2 * ;")
+    with pytest.raises(CellError) as info:
+        exec_jac(cell, cache=LRUCache(), caller_dir=FIXTURES)
+    error = info.value.__cause__
+    assert isinstance(error, TransformError)
+    for other in (pickle.loads(pickle.dumps(error)), copy.copy(error)):
+        assert type(other) is TransformError
+        assert str(other) == str(error)
+        assert [str(i) for i in other.errors] == [str(i) for i in error.errors]
+        assert other.errors[0].excerpt() == error.errors[0].excerpt()
+
+
+def test_elements_import_jac_files(module_cache: None) -> None:
+    """Test that every element resolves imports against the caller dir."""
+    cell = "import:jac shapes;\n\nwith entry { print(shapes.perimeter(4)); }"
+    result = transpile_jac_elements(cell, FIXTURES, LRUCache())
+    assert len(result.units) == 2
+    assert exec_jac(cell, cache=LRUCache(), caller_dir=FIXTURES) == "16\n"
@@ -5,56 +5,18 @@ import os
 from abc import ABC, ABCMeta, abstractmethod
 from typing import Optional
 
+from jackernel.compiled import Alert, TransformError
+from jackernel.diagnostics import get_logger
+
 from jaclang.jac.absyntree import AstNode
-from jaclang.jac.constant import Constants as Con, Values as Val
-from jaclang.utils.helpers import add_line_numbers, clip_code_section
 from jaclang.utils.log import logging
 from jaclang.vendor.sly.lex import LexerMeta
 from jaclang.vendor.sly.yacc import ParserMeta
 
 
-class Alert:
-    """Alert interface."""
-
-    def __init__(self, msg: str, mod: str, line: int) -> None:
-        """Initialize alert."""
-        self.msg = msg
-        self.mod = mod
-        self.line = line
-
-    def __str__(self) -> str:
-        """Return string representation of alert."""
-        mod_path = os.path.relpath(self.mod, start=os.getcwd())
-        return f"{mod_path}, line {self.line}: {self.msg}"
+__all__ = ["Alert", "TransformError", "Transform"]
 
-
-class TransformError(Exception):
-    """Error during transformation."""
-
-    def __init__(
-        self, message: str, errors: list[Alert], warnings: list[Alert]
-    ) -> None:
-        """Initialize error."""
-        self.errors = errors
-        self.warnings = warnings
-        if len(errors):
-            message += "\nErrors:"
-            for i in self.errors:
-                message += "\n" + str(i)
-        if len(warnings):
-            message += "\nWarnings:"
-            for i in self.warnings:
-                message += "\n" + str(i)
-        if len(errors) or len(warnings):
-            jac_err_line = errors[0].line if len(errors) else warnings[0].line
-            with open(errors[0].mod, "r") as file:
-                jac_code_string = file.read()
-            message += f"\n{Con.JAC_ERROR_PREAMBLE}\n" + clip_code_section(
-                add_line_numbers(jac_code_string),
-                jac_err_line,
-                Val.JAC_ERROR_LINE_RANGE,
-            )
-        super().__init__(message)
+_log = get_logger("transform")
 
 
 class Transform(ABC):
@@ -68,7 +30,6 @@ class Transform(ABC):
         prior: Optional[Transform] = None,
     ) -> None:
         """Initialize pass."""
-        print("hi")
         self.logger = logging.getLogger(self.__class__.__module__)
         self.errors_had: list[Alert] = [] if not prior else prior.errors_had
         self.warnings_had: list[Alert] = [] if not prior else prior.warnings_had
@@ -78,7 +39,12 @@ class Transform(ABC):
             mod_path.replace(base_path, "") if base_path else mod_path.split(os.sep)[-1]
         )
         self.ir = self.transform(ir=input_ir)
-        print(self.ir)
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug(
+                "%s finished",
+                type(self).__name__,
+                extra={"data": {"pass": type(self).__name__, "ir": repr(self.ir)}},
+            )
 
     @abstractmethod
     def transform(self, ir: AstNode) -> AstNode:
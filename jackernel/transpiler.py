@@ -1,20 +1,35 @@
 """Transpilation functions for Jupyter Cells."""
-from typing import Type, TypeVar
-
-from jackernel.pyoutpass import CustomPyOutPass
-from jackernel.syntax_hilighter import JacLexer as Lexer
-from jackernel.transform import Alert, Transform
+import copy
+import inspect
+import logging
+import os
+from typing import Optional, Type, TypeVar
+
+from jackernel.cache import LRUCache, source_key
+from jackernel.compiled import Alert, TranspiledCell
+from jackernel.diagnostics import get_logger
+from jackernel.importer import CELL_PATH, cell_path
+from jackernel.profiling import CompileProfile, timed
+from jackernel.pyoutpass import CellImportPass, CellPygenPass, CustomPyOutPass
+from jackernel.scanner import is_out_of_line_def, split_elements
+from jackernel.symbols import Symbol
+from jackernel.transform import Transform
 
 import jaclang.jac.absyntree as ast
 from jaclang.jac.parser import JacLexer, JacParser
 from jaclang.jac.passes import Pass
-from jaclang.jac.passes.blue import BluePygenPass
+from jaclang.jac.passes.blue import BluePygenPass, ImportPass
 from jaclang.jac.passes.blue import pass_schedule
-
-jac_lexer = Lexer()
+from jaclang.jac.symtable import SymbolType
 
 T = TypeVar("T", bound=Pass)
 
+_log = get_logger("transform")
+
+# The blue schedule, generating python the way cells need it.
+_cell_passes = {BluePygenPass: CellPygenPass, ImportPass: CellImportPass}
+cell_schedule = [_cell_passes.get(i, i) for i in pass_schedule]
+
 
 def read_file(file_path: str) -> str:
     """
@@ -42,7 +57,9 @@ def read_file(file_path: str) -> str:
     return file_content
 
 
-def jac_cell_to_pass_tree(cell: str) -> Transform:
+def jac_cell_to_pass_tree(
+    cell: str, profile: Optional[CompileProfile] = None, source_path: str = CELL_PATH
+) -> Transform:
     """
     Convert a jac cell to an AST.
 
@@ -50,14 +67,24 @@ def jac_cell_to_pass_tree(cell: str) -> Transform:
     ----------
     cell : str
         The jac cell to convert.
+    profile : CompileProfile, optional
+        Records the lexer and parser timings when given.
+    source_path : str, optional
+        The file the source was read from, alerts refer to it.
 
     Returns
     -------
     Transform
         The AST.
     """
-    lex = JacLexer(mod_path="", input_ir=cell, base_path="")
-    prse = JacParser(mod_path="", input_ir=lex.ir, base_path="", prior=lex)
+    # Any non empty path, the passes format alerts with os.path.relpath.
+    with timed(profile, "lexer"):
+        lex = JacLexer(mod_path=source_path, input_ir=cell, base_path="")
+        if profile is not None:
+            # Tokens are produced lazily, drain them so they are timed here.
+            lex.ir = iter(list(lex.ir))
+    with timed(profile, "parser"):
+        prse = JacParser(mod_path=source_path, input_ir=lex.ir, base_path="", prior=lex)
 
     return prse
 
@@ -67,6 +94,8 @@ def jac_cell_to_pass(
     caller_dir: str,
     target: Type[T] = BluePygenPass,
     schedule: str = pass_schedule,
+    profile: Optional[CompileProfile] = None,
+    source_path: str = CELL_PATH,
 ) -> str:
     """
     Convert a jac cell to a python cell.
@@ -76,58 +105,456 @@ def jac_cell_to_pass(
     cell : str
         The jac cell to convert.
     caller_dir : str
-        The directory of the caller.
+        The module path the passes are given, imports resolve against its
+        directory, see `jackernel.importer.cell_path`.
     target : Type[T], optional
     The pass to convert to, by default BluePygenPass
+    profile : CompileProfile, optional
+        Records the time spent in each pass when given.
+    source_path : str, optional
+        The file the source was read from, alerts refer to it.
 
     Returns
     -------
     str
         The python cell.
     """
-    ast_ret = jac_cell_to_pass_tree(cell)
+    ast_ret = jac_cell_to_pass_tree(cell, profile, source_path)
 
+    debug = _log.isEnabledFor(logging.DEBUG)
     for i in schedule:
         if i == target:
             break
-        ast_ret = i(
+        with timed(profile, i.__name__):
+            ast_ret = i(
+                mod_path=caller_dir, input_ir=ast_ret.ir, base_path="", prior=ast_ret
+            )
+        if debug:
+            _log_pass(ast_ret)
+
+    with timed(profile, target.__name__):
+        ast_ret = target(
             mod_path=caller_dir, input_ir=ast_ret.ir, base_path="", prior=ast_ret
         )
-
-    ast_ret = target(
-        mod_path=caller_dir, input_ir=ast_ret.ir, base_path="", prior=ast_ret
-    )
+    if debug:
+        _log_pass(ast_ret)
 
     return ast_ret
 
 
-def transpile_jac_blue(cell: str, caller_dir: str) -> list[Alert]:
-    """Transpiler Jac file and return python code as string.
+def _log_pass(done: Pass) -> None:
+    name = type(done).__name__
+    _log.debug(
+        "%s finished",
+        name,
+        extra={
+            "data": {
+                "pass": name,
+                "errors": len(done.errors_had),
+                "warnings": len(done.warnings_had),
+            }
+        },
+    )
+
+
+def transpile_jac_blue(
+    cell: str,
+    caller_dir: str,
+    to_disk: bool = False,
+    cache: Optional[LRUCache] = None,
+    profile: Optional[CompileProfile] = None,
+    gen_dir: str = "",
+) -> TranspiledCell:
+    """Transpile a jac cell to python source and a code object.
 
     Parameters
     ----------
     cell : str
         The jac cell to convert.
+    caller_dir : str
+        The directory the imports of the cell are relative to.
+    to_disk : bool, optional
+        Also write the generated python to `__jac_gen__`, only meant for
+        debugging, by default False
+    cache : LRUCache, optional
+        Cache of previously transpiled cells, unchanged cells are looked up
+        here instead of going through the pass schedule. Changed cells are
+        recompiled element by element so that only the edited elements go
+        through the pass schedule again. Bypassed when `to_disk` is set.
+    profile : CompileProfile, optional
+        Records the time spent in each compilation stage when given.
+    gen_dir : str, optional
+        Where `__jac_gen__` goes with `to_disk`, by default `caller_dir`.
 
     Returns
     -------
-    list[Alert]
-        The list of alerts.
+    TranspiledCell
+        The generated python, its code object and the list of alerts.
     """
+    if cache is not None and not to_disk:
+        key = source_key(cell, cell_schedule, caller_dir)
+        with timed(profile, "cache"):
+            result = cache.get(key)
+        _log.debug(
+            "Cell cache %s",
+            "miss" if result is None else "hit",
+            extra={"data": {"key": key}},
+        )
+        if result is None:
+            result = transpile_jac_elements(cell, caller_dir, cache, profile)
+            cache.put(key, result)
+        elif profile is not None:
+            profile.cache_hit = True
+        return result
+
+    mod_path = cell_path(caller_dir)
     code = jac_cell_to_pass(
         cell=cell,
-        caller_dir=caller_dir,
-        target=BluePygenPass,
-        schedule=pass_schedule,
+        caller_dir=mod_path,
+        target=CellPygenPass,
+        schedule=cell_schedule,
+        profile=profile,
     )
     if isinstance(code.ir, ast.Module) and not code.errors_had:
-        print_pass = CustomPyOutPass(
-            mod_path=caller_dir, input_ir=code.ir, base_path="", prior=code
+        with timed(profile, CustomPyOutPass.__name__):
+            print_pass = CustomPyOutPass(
+                mod_path=mod_path,
+                input_ir=code.ir,
+                base_path="",
+                prior=code,
+                to_disk=to_disk,
+                gen_dir=gen_dir,
+            )
+    else:
+        return TranspiledCell(
+            cell_alerts(code.errors_had, cell),
+            warnings=cell_alerts(code.warnings_had, cell),
+        )
+
+    return TranspiledCell(
+        cell_alerts(print_pass.errors_had, cell),
+        print_pass.py_code,
+        print_pass.codeobj,
+        symbols=collect_symbols(code.ir, cell),
+        source_map=print_pass.source_map,
+        warnings=cell_alerts(print_pass.warnings_had, cell),
+    )
+
+
+def transpile_jac_module(source: str, path: str) -> TranspiledCell:
+    """
+    Transpile a jac file imported by a cell, see `jackernel.importer`.
+
+    Parameters
+    ----------
+    source : str
+        The content of the file, compiled as given rather than read again
+        so that the result matches what the caller hashed.
+    path : str
+        The absolute path of the file, its own imports are relative to it.
+
+    Returns
+    -------
+    TranspiledCell
+        The generated python, its code object and the list of alerts.
+    """
+    code = jac_cell_to_pass(
+        cell=source,
+        caller_dir=path,
+        target=CellPygenPass,
+        schedule=cell_schedule,
+        source_path=path,
+    )
+    if not isinstance(code.ir, ast.Module) or code.errors_had:
+        return TranspiledCell(
+            cell_alerts(code.errors_had, source),
+            warnings=cell_alerts(code.warnings_had, source),
+        )
+    print_pass = CustomPyOutPass(
+        mod_path=path, input_ir=code.ir, base_path="", prior=code
+    )
+    return TranspiledCell(
+        cell_alerts(print_pass.errors_had, source),
+        print_pass.py_code,
+        print_pass.codeobj,
+        source_map=print_pass.source_map,
+        warnings=cell_alerts(print_pass.warnings_had, source),
+    )
+
+
+def cell_alerts(alerts: list, cell: str) -> list[Alert]:
+    """
+    Attach the cell source to the alerts raised while compiling it.
+
+    The passes only know the caller directory as the module path of a
+    cell, so their alerts could not show the offending code. Alerts from
+    jac files imported by the cell keep their path.
+
+    Parameters
+    ----------
+    alerts : list
+        The alerts of the jaclang passes.
+    cell : str
+        The jac source of the cell.
+
+    Returns
+    -------
+    list[Alert]
+        The alerts, formatted and excerpted without touching the disk.
+    """
+    is_file: dict[str, bool] = {}
+    converted = []
+    for alert in alerts:
+        if alert.mod not in is_file:
+            is_file[alert.mod] = alert.mod != CELL_PATH and os.path.isfile(alert.mod)
+        converted.append(Alert.from_alert(alert, None if is_file[alert.mod] else cell))
+    return converted
+
+
+def collect_symbols(module: ast.Module, source: str) -> list[Symbol]:
+    """
+    List the names a compiled cell defines, from its symbol table.
+
+    The bootstrap symbol table does not record `has` variables, so the
+    fields of each architype are read from its body. Signatures are cut
+    out of the cell source using the token positions.
+
+    Parameters
+    ----------
+    module : ast.Module
+        The module after the symbol table passes ran.
+    source : str
+        The jac source the module was parsed from.
+
+    Returns
+    -------
+    list[Symbol]
+        Architypes, abilities and globals, each architype followed by its
+        fields and abilities. Names `include:jac` brings in are left out.
+    """
+    kinds = {
+        SymbolType.ARCH: "architype",
+        SymbolType.ABILITY: "ability",
+        SymbolType.VAR: "global",
+    }
+    lines = source.splitlines()
+    symbols = []
+    if module.sym_tab is None:
+        return symbols
+    for name, sym in module.sym_tab.tab.items():
+        if sym.sym_type not in kinds:
+            continue
+        decl = sym.decl
+        if decl is not None and decl.mod_link not in (None, module):
+            # Included from a jac file, its lines are not in `source`.
+            continue
+        if isinstance(decl, ast.Ability):
+            symbols.append(_ability_symbol(decl, lines))
+            continue
+        if not isinstance(decl, ast.Architype):
+            symbols.append(
+                Symbol(
+                    name,
+                    kinds[sym.sym_type],
+                    signature=_source_span(decl, decl, lines) if decl else "",
+                    line=getattr(decl, "line", None),
+                )
+            )
+            continue
+        last = decl.base_classes if decl.base_classes.kid else decl.name
+        symbols.append(
+            Symbol(
+                name,
+                "architype",
+                signature=_source_span(decl.arch_type, last, lines),
+                doc=_doc_text(decl.doc),
+                line=decl.line,
+            )
         )
+        for member in getattr(decl.body, "members", []):
+            if isinstance(member, ast.ArchHas):
+                for var in member.vars.vars:
+                    symbols.append(
+                        Symbol(
+                            var.name.value,
+                            "field",
+                            name,
+                            signature="has " + _source_span(var, var, lines),
+                            doc=_doc_text(member.doc),
+                            line=var.line,
+                        )
+                    )
+            elif isinstance(member, ast.Ability):
+                symbols.append(_ability_symbol(member, lines, name))
+    return symbols
+
+
+def _ability_symbol(
+    node: ast.Ability, lines: list[str], owner: Optional[str] = None
+) -> Symbol:
+    last = node.signature if node.signature is not None else node.name_ref
+    return Symbol(
+        node.py_resolve_name(),
+        "ability",
+        owner,
+        signature="can " + _source_span(node.name_ref, last, lines),
+        doc=_doc_text(node.doc),
+        line=node.line,
+    )
+
+
+def _shifted(symbol: Symbol, offset: int) -> Symbol:
+    """Return a copy of an element's symbol with the line relative to the cell."""
+    symbol = copy.copy(symbol)
+    if symbol.line is not None:
+        symbol.line += offset
+    return symbol
+
+
+def _tokens(node: ast.AstNode) -> list[ast.Token]:
+    if isinstance(node, ast.Token):
+        return [node]
+    return [i for kid in node.kid if kid is not None for i in _tokens(kid)]
+
+
+def _source_span(first: ast.AstNode, last: ast.AstNode, lines: list[str]) -> str:
+    """Return the source from the first token of `first` to the end of `last`.
+
+    Closing brackets are not kept in the tree, the ones left open by the
+    span are taken from the source after it.
+    """
+    tokens = _tokens(first) + _tokens(last)
+    if not tokens:
+        return ""
+    start = min(tokens, key=lambda i: (i.line, i.col_start))
+    end = max(tokens, key=lambda i: (i.line, i.col_end))
+    if start.line == end.line:
+        text = lines[start.line - 1][start.col_start - 1 : end.col_end - 1]
     else:
-        return code.errors_had
+        span = [lines[start.line - 1][start.col_start - 1 :]]
+        span += lines[start.line : end.line - 1]
+        span.append(lines[end.line - 1][: end.col_end - 1])
+        text = " ".join(i.strip() for i in span)
+    depth = sum(text.count(i) for i in "([{") - sum(text.count(i) for i in ")]}")
+    for char in lines[end.line - 1][end.col_end - 1 :]:
+        if depth <= 0:
+            break
+        if char in ")]}":
+            depth -= 1
+        elif char in "([{":
+            depth += 1
+        text += char
+    return text
 
-    return print_pass.errors_had
+
+def _doc_text(doc: Optional[ast.Token]) -> str:
+    if doc is None:
+        return ""
+    quote = 3 if doc.value[:3] in ('"""', "'''") else 1
+    return inspect.cleandoc(doc.value[quote:-quote])
+
+
+# An empty module docstring, what cells without one get anyway, so that a
+# docstring starting the element documents it. On a line of its own, the
+# columns of the element are unchanged and its lines are one more than in
+# the cell. `CellPygenPass` leaves it out of the generated python.
+_ELEMENT_PREFIX = '""""""\n'
+
+
+def transpile_jac_elements(
+    cell: str,
+    caller_dir: str,
+    cache: LRUCache,
+    profile: Optional[CompileProfile] = None,
+) -> TranspiledCell:
+    """Transpile a jac cell one top level element at a time.
+
+    Each element is compiled as its own module and cached by its source, so
+    editing one architype only recompiles that architype. Cells with out of
+    line definitions (`:walker:foo:can:bar`), which need their declaration
+    in the same module, and cells that fail to compile are transpiled as a
+    whole so alerts refer to the real cell lines.
+
+    Parameters
+    ----------
+    cell : str
+        The jac cell to convert.
+    caller_dir : str
+        The directory of the caller.
+    cache : LRUCache
+        Cache the compiled elements are kept in.
+    profile : CompileProfile, optional
+        Records the time spent in each compilation stage when given.
+
+    Returns
+    -------
+    TranspiledCell
+        The cell, with one unit per element.
+    """
+    elements = split_elements(cell)
+    if len(elements) < 2 or any(is_out_of_line_def(i) for _, i in elements):
+        return transpile_jac_blue(cell=cell, caller_dir=caller_dir, profile=profile)
+
+    units = []
+    compiled = []
+    offsets = []
+    for idx, (line, text) in enumerate(elements):
+        # Like in the whole cell, only a docstring starting the cell is the
+        # module docstring, later ones document their element.
+        prefix = "" if idx == 0 else _ELEMENT_PREFIX
+        source = prefix + text
+        offset = line - 1 - prefix.count("\n")
+        key = source_key(source, cell_schedule, caller_dir, "element")
+        with timed(profile, "cache"):
+            unit = cache.get(key)
+        if unit is None:
+            _log.debug(
+                "Compiling element at line %d", line, extra={"data": {"line": line}}
+            )
+            unit = transpile_jac_blue(
+                cell=source, caller_dir=caller_dir, profile=profile
+            )
+            if unit.errors:
+                return transpile_jac_blue(
+                    cell=cell, caller_dir=caller_dir, profile=profile
+                )
+            cache.put(key, unit)
+        compiled.append(unit)
+        offsets.append(offset)
+        units.append(
+            TranspiledCell(
+                [],
+                unit.py_code,
+                unit.codeobj,
+                line_offset=offset,
+                source_map=unit.source_map,
+            )
+        )
+    return TranspiledCell(
+        [],
+        "\n".join(i.py_code for i in units if i.py_code),
+        units=units,
+        symbols=[
+            _shifted(i, offset)
+            for offset, unit in zip(offsets, compiled)
+            for i in unit.symbols
+        ],
+    )
+
+
+def warm_up(caller_dir: str) -> None:
+    """Run a tiny cell through the whole pipeline so the next one starts warm.
+
+    Parameters
+    ----------
+    caller_dir : str
+        The directory of the caller.
+    """
+    result = transpile_jac_blue(
+        cell="with entry { _jac_warm_up_ = 1; }", caller_dir=caller_dir
+    )
+    if result.codeobj is not None:
+        exec(result.codeobj, {})
 
 
 def transpile_jac_purple(cell: str) -> list[Alert]:
@@ -20,6 +20,7 @@ setup(
     entry_points={
         "console_scripts": [
             "install_jackernel = jackernel.install_kernel:install_kernel",
+            "jackernel = jackernel.runner:main",
         ],
     },
     url="https://github.com/Jaseci-Labs/jaclang/tree/main/support/kernel",